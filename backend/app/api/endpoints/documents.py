@@ -1,97 +1,109 @@
 import os
+from pathlib import Path
 from typing import Any, List, Optional
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile, status
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql import func
 
+from app.api.responses import json_response, make_etag, not_modified
 from app.core.auth import get_current_active_user
 from app.db.session import get_db
-from app.models.document import Document, DocumentSection, DocumentImage
+from app.models.document import Document, DocumentSection, IngestionJob
 from app.models.user import User
-from app.schemas.document import Document as DocumentSchema, DocumentCreate, DocumentList
-from app.services.document_processor import (
-    save_uploaded_file,
-    process_document,
-    split_documents,
-    create_embeddings_for_documents,
-    extract_document_structure,
-)
+from app.schemas.document import Document as DocumentSchema, DocumentCreate, DocumentList, SectionSearchResults
+from app.services.admission import admission
+from app.services.cleanup import wake_cleanup_worker
+from app.services.document_processor import iter_document, save_uploaded_file
+from app.services.image_processor import IMAGE_EXTENSIONS, check_image_file
+from app.services.ingestion import DocumentDeleted, clear_document_index, index_document
+from app.services.search_index import SEARCH_MODES, search_sections
 
 router = APIRouter()
 
 
+async def admit_ingest(current_user: User = Depends(get_current_active_user)):
+    """
+    Hold an ingestion slot while the upload is processed, or answer 429 when the server is saturated
+    """
+    async with admission.admit("ingest", current_user.id):
+        yield
+
+
 @router.post("/upload", response_model=DocumentSchema)
-async def upload_document(
+def upload_document(
     *,
     db: Session = Depends(get_db),
     title: str = Form(...),
     description: Optional[str] = Form(None),
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_active_user),
+    _: None = Depends(admit_ingest),
 ) -> Any:
     """
     Upload a new document.
     """
-    # Save the uploaded file
-    file_content = await file.read()
-    file_path = save_uploaded_file(file_content, file.filename)
+    # Save the uploaded file without holding it in memory
+    file_path = save_uploaded_file(file.file, file.filename)
+    if Path(file_path).suffix.lower() in IMAGE_EXTENSIONS:
+        try:
+            check_image_file(file_path)
+        except ValueError as e:
+            os.remove(file_path)
+            raise HTTPException(status_code=400, detail=str(e))
     
     # Process the document
+    db_document = None
     try:
-        documents, meta_data = process_document(file_path)  # Changed from metadata to meta_data
+        # Parsed lazily while it is indexed; meta_data is complete once indexing finishes
+        meta_data = {}
+        documents = iter_document(file_path, meta_data)
         
         # Create document record
         db_document = Document(
             title=title,
             description=description,
             file_path=file_path,
-            file_type=meta_data["file_type"],  # Changed from metadata to meta_data
+            file_type=Path(file_path).suffix.lower(),
             file_size=os.path.getsize(file_path),
-            meta_data=meta_data,  # Changed from metadata to meta_data
+            meta_data={},
             owner_id=current_user.id,
         )
         db.add(db_document)
         db.commit()
         db.refresh(db_document)
         
-        # Split documents for better processing
-        split_docs = split_documents(documents)
-        
-        # Create embeddings
-        vector_store_path = create_embeddings_for_documents(split_docs, str(db_document.id))
-        
-        # Extract document structure
-        sections = extract_document_structure(split_docs)
+        # Checkpointed per batch, so a crashed worker's upload is resumed, not lost
+        job = IngestionJob(document_id=db_document.id)
+        db.add(job)
+        db.commit()
         
-        # Create document sections
-        for section_data in sections:
-            db_section = DocumentSection(
-                section_type=section_data["section_type"],
-                content=section_data["content"],
-                page_num=section_data["page_num"],
-                position=section_data["position"],
-                meta_data=section_data["meta_data"],  # Changed from metadata to meta_data
-                document_id=db_document.id,
-            )
-            db.add(db_section)
-            db.commit()
-            db.refresh(db_section)
-            
-            # If this is an image section, create image record
-            if section_data["section_type"] == "image" and "source" in section_data["meta_data"]:  # Changed from metadata to meta_data
-                db_image = DocumentImage(
-                    image_path=section_data["meta_data"]["source"],  # Changed from metadata to meta_data
-                    image_type=section_data["meta_data"].get("image_type", "unknown"),  # Changed from metadata to meta_data
-                    section_id=db_section.id,
-                )
-                db.add(db_image)
+        # Chunk, store sections and embed
+        index_document(db, db_document, documents, job, meta_data)
         
+        db_document.meta_data = meta_data
+        job.status = "completed"
         db.commit()
+        db.refresh(db_document)
         
         return db_document
     
+    except DocumentDeleted:
+        # Deleted by its owner mid-upload: the cleanup worker purges it once the job stops
+        db.rollback()
+        job.status = "cancelled"
+        db.commit()
+        wake_cleanup_worker()
+        raise HTTPException(status_code=409, detail="Document was deleted during upload")
+    
     except Exception as e:
-        # Clean up the file if processing fails
+        # Clean up the file and anything indexed so far if processing fails
+        db.rollback()
+        if db_document is not None and db_document.id is not None:
+            clear_document_index(db, db_document.id)
+            db.delete(db_document)
+            db.commit()
         if os.path.exists(file_path):
             os.remove(file_path)
         raise HTTPException(
@@ -110,25 +122,89 @@ def list_documents(
     """
     Retrieve user's documents.
     """
-    documents = db.query(Document).filter(Document.owner_id == current_user.id).offset(skip).limit(limit).all()
-    total = db.query(Document).filter(Document.owner_id == current_user.id).count()
+    owned = db.query(Document).filter(Document.owner_id == current_user.id, Document.deleted_at.is_(None))
+    # Sections of the whole page in one statement, their images joined in: no query per document or section
+    documents = (
+        owned.options(selectinload(Document.sections).joinedload(DocumentSection.images))
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+    total = owned.count()
     
     return {"documents": documents, "total": total}
 
 
+@router.get("/search", response_model=SectionSearchResults)
+def search_documents(
+    q: str = Query(..., min_length=1),
+    mode: str = "match",
+    document_id: Optional[int] = None,
+    section_type: Optional[str] = None,
+    page_num: Optional[int] = None,
+    skip: int = 0,
+    limit: int = Query(20, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    """
+    Keyword, phrase or prefix search over the sections of the user's documents.
+    """
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(SEARCH_MODES)}")
+    
+    try:
+        results = search_sections(
+            db,
+            owner_id=current_user.id,
+            query_text=q,
+            mode=mode,
+            document_id=document_id,
+            section_type=section_type,
+            page_num=page_num,
+            skip=skip,
+            limit=limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"results": results, "query": q, "mode": mode}
+
+
 @router.get("/{document_id}", response_model=DocumentSchema)
 def get_document(
     document_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
     """
     Get a specific document by ID.
+    
+    Ingestion and re-indexing both end by updating the document, so its
+    timestamps version the sections too: a client holding the current version
+    gets a 304 before any section is loaded.
     """
-    document = db.query(Document).filter(Document.id == document_id, Document.owner_id == current_user.id).first()
+    document = db.query(Document).filter(
+        Document.id == document_id, Document.owner_id == current_user.id, Document.deleted_at.is_(None)
+    ).first()
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
-    return document
+    
+    etag = make_etag("document", document.id, document.created_at, document.updated_at)
+    response = not_modified(request, etag)
+    if response:
+        return response
+    
+    # Sections with their images in one statement instead of a lazy load per section
+    sections = (
+        db.query(DocumentSection)
+        .options(joinedload(DocumentSection.images))
+        .filter(DocumentSection.document_id == document.id)
+        .all()
+    )
+    set_committed_value(document, "sections", sections)
+    return json_response(request, DocumentSchema, document, etag)
 
 
 @router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -139,21 +215,16 @@ def delete_document(
 ) -> None:
     """
     Delete a document.
+    
+    The document is tombstoned and disappears immediately; its sections,
+    vectors and file are removed by the background cleanup worker.
     """
-    document = db.query(Document).filter(Document.id == document_id, Document.owner_id == current_user.id).first()
+    document = db.query(Document).filter(
+        Document.id == document_id, Document.owner_id == current_user.id, Document.deleted_at.is_(None)
+    ).first()
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Delete the file
-    if os.path.exists(document.file_path):
-        os.remove(document.file_path)
-    
-    # Delete vector store if it exists
-    vector_store_path = os.path.join(os.getenv("VECTOR_DB_PATH", "./vector_db"), f"doc_{document_id}")
-    if os.path.exists(vector_store_path):
-        import shutil
-        shutil.rmtree(vector_store_path)
-    
-    # Delete from database
-    db.delete(document)
-    db.commit() 
\ No newline at end of file
+    document.deleted_at = func.now()
+    db.commit()
+    wake_cleanup_worker()
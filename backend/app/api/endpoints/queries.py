@@ -1,28 +1,59 @@
+from datetime import datetime
 from typing import Any, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, selectinload
 
+from app.api.responses import json_response
 from app.core.auth import get_current_active_user
 from app.db.session import get_db
+from app.models.document import Document
 from app.models.query import Query, Citation
 from app.models.user import User
 from app.schemas.query import QueryCreate, Query as QuerySchema, QueryList, QueryResponse, QueryUpdate
-from app.services.query_processor import process_query
+from app.services.admission import admission
+from app.services.embeddings import query_embedding_cache_stats
+from app.services.query_export import EXPORT_FORMATS, iter_export
+from app.services.query_processor import process_query_coalesced
+from app.services.tracing import span
 
 router = APIRouter()
 
 
+async def admit_query(current_user: User = Depends(get_current_active_user)):
+    """
+    Hold a query slot while the request runs, or answer 429 when the server is saturated
+    """
+    async with admission.admit("query", current_user.id):
+        yield
+
+
 @router.post("/", response_model=QueryResponse)
 def create_query(
     *,
     db: Session = Depends(get_db),
     query_in: QueryCreate,
     current_user: User = Depends(get_current_active_user),
+    _: None = Depends(admit_query),
 ) -> Any:
     """
     Create a new query and get response.
     """
+    # Only the owner's live documents can be queried; tabular ones keep the schema of their stored tables
+    tables = None
+    if query_in.document_id:
+        document = db.query(Document).filter(
+            Document.id == query_in.document_id,
+            Document.owner_id == current_user.id,
+            Document.deleted_at.is_(None),
+        ).first()
+        if document is None:
+            raise HTTPException(status_code=404, detail="Document not found")
+        if document.meta_data:
+            tables = document.meta_data.get("tables")
+    
     # Create query record
     db_query = Query(
         query_text=query_in.query_text,
@@ -36,32 +67,44 @@ def create_query(
     
     # Process the query
     try:
-        result = process_query(
-            query_text=query_in.query_text,
-            document_id=str(query_in.document_id) if query_in.document_id else None
-        )
+        # Concurrent identical queries share one run; each still gets its own rows
+        with span("query", query_id=db_query.id, document_id=query_in.document_id) as query_span:
+            result, coalesced = process_query_coalesced(
+                query_text=query_in.query_text,
+                document_id=str(query_in.document_id) if query_in.document_id else None,
+                tables=tables,
+            )
         
-        # Update the query with the response
+        # Update the query with the response and how it was produced
         db_query.response = result["response"]
+        if result.get("meta_data"):
+            db_query.meta_data = {**(db_query.meta_data or {}), **result["meta_data"]}
+        if coalesced:
+            db_query.meta_data = {**(db_query.meta_data or {}), "coalesced": True}
+        # Timing, tokens and cost of this request; a coalesced one made no LLM calls of its own
+        db_query.meta_data = {**(db_query.meta_data or {}), "trace": query_span.trace.summary()}
         db.add(db_query)
         db.commit()
         db.refresh(db_query)
         
-        # Create citations
-        citations = []
-        for citation_data in result["citations"]:
-            db_citation = Citation(
-                content=citation_data["content"],
-                meta_data=citation_data["meta_data"],  # Changed from metadata to meta_data
-                query_id=db_query.id,
-                document_section_id=citation_data["document_section_id"],
+        # Create citations in one statement: added one by one, each is an INSERT ... RETURNING of its own
+        if result["citations"]:
+            db.execute(
+                insert(Citation),
+                [
+                    {
+                        "content": citation_data["content"],
+                        "meta_data": citation_data["meta_data"],  # Changed from metadata to meta_data
+                        "query_id": db_query.id,
+                        "document_section_id": citation_data["document_section_id"],
+                    }
+                    for citation_data in result["citations"]
+                ],
             )
-            db.add(db_citation)
-            citations.append(db_citation)
         
         db.commit()
         
-        return {"query": db_query, "citations": citations}
+        return {"query": db_query, "citations": db_query.citations}
     
     except Exception as e:
         # Update the query with the error
@@ -77,6 +120,7 @@ def create_query(
 
 @router.get("/", response_model=QueryList)
 def list_queries(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     document_id: Optional[int] = None,
@@ -85,6 +129,9 @@ def list_queries(
 ) -> Any:
     """
     Retrieve query history.
+    
+    Queries change in place (responses, favorites), so the ETag is taken over
+    the body: an unchanged history is answered with a 304.
     """
     query = db.query(Query).filter(Query.user_id == current_user.id)
     
@@ -92,9 +139,51 @@ def list_queries(
         query = query.filter(Query.document_id == document_id)
     
     total = query.count()
-    queries = query.order_by(Query.created_at.desc()).offset(skip).limit(limit).all()
+    # Citations of the whole page in one statement rather than one per query
+    queries = (
+        query.options(selectinload(Query.citations))
+        .order_by(Query.created_at.desc())
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+    
+    return json_response(request, QueryList, {"queries": queries, "total": total})
+
+
+@router.get("/export")
+def export_queries(
+    format: str = "ndjson",
+    document_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    """
+    Export the query history with citations as NDJSON, CSV or Markdown.
+    
+    The export is streamed from a server-side cursor, so it starts right away
+    and uses constant memory however long the history is.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
     
-    return {"queries": queries, "total": total}
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        iter_export(current_user.id, format, document_id=document_id, since=since, until=until),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="queries.{extension}"'},
+    )
+
+
+@router.get("/embedding-cache")
+def get_embedding_cache_stats(
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    """
+    Hit rate of the query embedding cache in this worker.
+    """
+    return query_embedding_cache_stats()
 
 
 @router.get("/{query_id}", response_model=QueryResponse)
@@ -106,13 +195,16 @@ def get_query(
     """
     Get a specific query by ID.
     """
-    query = db.query(Query).filter(Query.id == query_id, Query.user_id == current_user.id).first()
+    query = (
+        db.query(Query)
+        .options(selectinload(Query.citations))
+        .filter(Query.id == query_id, Query.user_id == current_user.id)
+        .first()
+    )
     if not query:
         raise HTTPException(status_code=404, detail="Query not found")
     
-    citations = db.query(Citation).filter(Citation.query_id == query_id).all()
-    
-    return {"query": query, "citations": citations}
+    return {"query": query, "citations": query.citations}
 
 
 @router.put("/{query_id}", response_model=QuerySchema)
@@ -0,0 +1,61 @@
+import hashlib
+from typing import Any, Optional, Type
+
+import orjson
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+# Browsers keep the response but revalidate it on every use, sending If-None-Match
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Weak ETag over a version (e.g. id and updated_at) or the response body itself.
+
+    Weak, because the compression middleware changes the bytes on the wire but
+    not the content.
+    """
+    digest = hashlib.sha1(b"\0".join(part if isinstance(part, bytes) else str(part).encode() for part in parts))
+    return f'W/"{digest.hexdigest()[:20]}"'
+
+
+def _matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Comparison is weak: W/"x" and "x" are the same
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """
+    A 304 response if the client already has this version, otherwise None
+    """
+    if _matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    return None
+
+
+def json_response(
+    request: Request,
+    schema: Type[BaseModel],
+    obj: Any,
+    etag: Optional[str] = None,
+) -> Response:
+    """
+    Serialize obj through a response schema with orjson.
+
+    Without a version-based etag, the ETag is taken over the body, which still
+    saves sending it again when it hasn't changed.
+    """
+    body = orjson.dumps(schema.model_validate(obj).model_dump())
+    etag = etag or make_etag(body)
+    return not_modified(request, etag) or Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+    )
@@ -0,0 +1,118 @@
+"""
+Compare chunking strategies on real files: index size, embedding time and retrieval hit rate.
+
+    python -m app.benchmarks.chunking
+    python -m app.benchmarks.chunking document_storage/report.pdf slides.pptx --k 3
+    python -m app.benchmarks.chunking --questions questions.jsonl
+
+Without a questions file, sentences sampled from each file are used as queries
+and a hit is a top-k chunk containing the whole sentence. A questions file
+holds one {"file": ..., "question": ..., "answer": ...} object per line, where
+a hit is a top-k chunk containing the answer text.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.chunking import CHUNKING_STRATEGIES, chunk_documents
+from app.services.context_packer import estimate_tokens
+from app.services.document_processor import process_document
+from app.services.embeddings import get_embedding_model
+
+_SENTENCE = re.compile(r"[^.!?\n]{40,300}[.!?]")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def sample_questions(texts: List[str], count: int, rng: random.Random) -> List[Tuple[str, str]]:
+    sentences = [match.group(0).strip() for text in texts for match in _SENTENCE.finditer(text)]
+    sentences = [sentence for sentence in sentences if len(sentence.split()) >= 8]
+    return [(sentence, sentence) for sentence in rng.sample(sentences, min(count, len(sentences)))]
+
+
+def load_questions(path: str) -> Dict[str, List[Tuple[str, str]]]:
+    questions: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+    with open(path) as f:
+        for record in map(json.loads, f):
+            questions[os.path.abspath(record["file"])].append((record["question"], record["answer"]))
+    return questions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="files to chunk (default: every file in DOCUMENT_STORAGE_PATH)")
+    parser.add_argument("--questions", help="JSONL file of {file, question, answer}")
+    parser.add_argument("--samples", type=int, default=20, help="sampled questions per file without --questions")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(settings.DOCUMENT_STORAGE_PATH, "*")))
+    labelled = load_questions(args.questions) if args.questions else None
+    rng = random.Random(args.seed)
+    embedding = get_embedding_model()
+
+    totals = {strategy: defaultdict(float) for strategy in CHUNKING_STRATEGIES}
+    for file_path in files:
+        try:
+            documents, _ = process_document(file_path)
+        except ValueError as e:
+            print(f"skipping {file_path}: {e}")
+            continue
+
+        if labelled is not None:
+            questions = labelled.get(os.path.abspath(file_path), [])
+        else:
+            questions = sample_questions([doc.page_content for doc in documents], args.samples, rng)
+        query_vectors = np.array(embedding.embed_documents([question for question, _ in questions])) if questions else None
+
+        for strategy in CHUNKING_STRATEGIES:
+            chunks = chunk_documents([doc.copy(deep=True) for doc in documents], strategy)
+            texts = [chunk.page_content for chunk in chunks]
+            if not texts:
+                continue
+
+            started = time.perf_counter()
+            vectors = np.array(embedding.embed_documents(texts))
+            stats = totals[strategy]
+            stats["embed_seconds"] += time.perf_counter() - started
+            stats["chunks"] += len(chunks)
+            stats["tokens"] += sum(estimate_tokens(text) for text in texts)
+            stats["tiny_chunks"] += sum(1 for text in texts if estimate_tokens(text) < 32)
+
+            if query_vectors is None:
+                continue
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+            queries = query_vectors / (np.linalg.norm(query_vectors, axis=1, keepdims=True) + 1e-12)
+            top = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k]
+            normalized = [_normalize(text) for text in texts]
+            for (_, answer), ranked in zip(questions, top):
+                stats["questions"] += 1
+                stats["hits"] += any(_normalize(answer) in normalized[i] for i in ranked)
+
+    print(f"files: {len(files)}, k={args.k}, chunk tokens={settings.CHUNK_TOKENS}, overlap={settings.CHUNK_OVERLAP_TOKENS}")
+    print(f"{'strategy':<10} {'chunks':>8} {'tokens':>10} {'tok/chunk':>10} {'tiny':>6} {'embed s':>8} {'hit rate':>9}")
+    for strategy, stats in totals.items():
+        if not stats["chunks"]:
+            continue
+        hit_rate = f"{stats['hits'] / stats['questions']:.3f}" if stats["questions"] else "n/a"
+        print(
+            f"{strategy:<10} {int(stats['chunks']):>8} {int(stats['tokens']):>10} "
+            f"{stats['tokens'] / stats['chunks']:>10.1f} {int(stats['tiny_chunks']):>6} "
+            f"{stats['embed_seconds']:>8.2f} {hit_rate:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
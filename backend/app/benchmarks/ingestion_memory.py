@@ -0,0 +1,170 @@
+"""
+Peak memory of the ingestion pipeline as documents grow.
+
+Generates text PDFs of increasing page counts and ingests each one in a fresh
+process against a temporary database and storage directories, reporting the
+peak RSS above the baseline (embedding model loaded, nothing ingested). With
+streaming ingestion the peak should stay flat as the page count grows: the
+script exits with status 1 when the streaming growth at the largest page count
+exceeds the growth at the smallest by more than --tolerance-mb.
+
+    python -m app.benchmarks.ingestion_memory
+    python -m app.benchmarks.ingestion_memory --pages 200 800 3200 --materialize
+    python -m app.benchmarks.ingestion_memory --backend quantized
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+_WORDS = (
+    "model data query index token vector layer cache result table memory batch page "
+    "document stream pipeline latency throughput retrieval embedding chunk section"
+).split()
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def write_text_pdf(path: str, pages: int, lines_per_page: int = 45, seed: int = 0) -> None:
+    """
+    Write a minimal PDF with one Helvetica text stream per page
+    """
+    rng = random.Random(seed)
+    offsets = []
+    with open(path, "wb") as f:
+        def write_object(number: int, body: bytes) -> None:
+            offsets.append((number, f.tell()))
+            f.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        # 1: catalog, 2: page tree, 3: font, then a page and a content stream per page
+        page_ids = [4 + 2 * i for i in range(pages)]
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+        write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+        write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        for page_id in page_ids:
+            lines = [" ".join(rng.choice(_WORDS) for _ in range(12)) + "." for _ in range(lines_per_page)]
+            stream = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+            write_object(
+                page_id,
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {page_id + 1} 0 R "
+                f"/Resources << /Font << /F1 3 0 R >> >> >>".encode(),
+            )
+            write_object(page_id + 1, f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+
+        xref = f.tell()
+        f.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+        for _, offset in sorted(offsets):
+            f.write(f"{offset:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+
+def run_worker(file_path: str, materialize: bool) -> None:
+    """
+    Ingest one file the way the upload endpoint does and print peak memory as JSON
+    """
+    from app.db.init_db import init_db
+    from app.db.session import SessionLocal
+    from app.models.document import Document
+    from app.models.user import User
+    from app.services.document_processor import iter_document
+    from app.services.embeddings import get_embedding_model
+    from app.services.ingestion import index_document
+
+    db = SessionLocal()
+    init_db(db)
+    get_embedding_model().embed_documents(["warm up"])
+    baseline = _peak_rss_mb()
+
+    started = time.perf_counter()
+    meta_data = {}
+    documents = iter_document(file_path, meta_data)
+    if materialize:
+        # The pre-streaming behaviour: every page loaded before indexing starts
+        documents = list(documents)
+
+    owner = db.query(User).first()
+    db_document = Document(
+        title="benchmark", file_path=file_path, file_type=".pdf",
+        file_size=os.path.getsize(file_path), meta_data={}, owner_id=owner.id,
+    )
+    db.add(db_document)
+    db.commit()
+    chunks = index_document(db, db_document, documents)
+    db.close()
+
+    print(json.dumps({
+        "chunks": chunks,
+        "seconds": time.perf_counter() - started,
+        "baseline_mb": baseline,
+        "peak_mb": _peak_rss_mb(),
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 400, 1600])
+    parser.add_argument("--materialize", action="store_true", help="also measure loading every page up front")
+    parser.add_argument("--backend", help="VECTOR_BACKEND to ingest into (default: the configured one)")
+    parser.add_argument(
+        "--tolerance-mb", type=float, default=64,
+        help="allowed extra streaming growth at the largest page count over the smallest",
+    )
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-materialize", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.worker_materialize)
+        return
+
+    modes = [False, True] if args.materialize else [False]
+    streaming_growth = {}
+    print(f"{'pages':>6} {'mode':<12} {'chunks':>7} {'seconds':>8} {'baseline MB':>12} {'peak MB':>8} {'growth MB':>10}")
+    for pages in args.pages:
+        for materialize in modes:
+            with tempfile.TemporaryDirectory() as workdir:
+                file_path = os.path.join(workdir, f"synthetic_{pages}.pdf")
+                write_text_pdf(file_path, pages)
+                env = dict(
+                    os.environ,
+                    DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                    VECTOR_DB_PATH=os.path.join(workdir, "vector_db"),
+                    PARSE_CACHE_PATH=os.path.join(workdir, "parse_cache"),
+                    DOCUMENT_STORAGE_PATH=os.path.join(workdir, "documents"),
+                )
+                if args.backend:
+                    env["VECTOR_BACKEND"] = args.backend
+                command = [sys.executable, "-m", "app.benchmarks.ingestion_memory", "--worker", file_path]
+                if materialize:
+                    command.append("--worker-materialize")
+                output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+            if not materialize:
+                streaming_growth[pages] = result["peak_mb"] - result["baseline_mb"]
+
+            print(
+                f"{pages:>6} {'materialized' if materialize else 'streaming':<12} {result['chunks']:>7} "
+                f"{result['seconds']:>8.1f} {result['baseline_mb']:>12.0f} {result['peak_mb']:>8.0f} "
+                f"{result['peak_mb'] - result['baseline_mb']:>10.0f}"
+            )
+
+    smallest, largest = min(streaming_growth), max(streaming_growth)
+    extra = streaming_growth[largest] - streaming_growth[smallest]
+    print(f"\nstreaming growth at {largest} pages is {extra:+.0f} MB over {smallest} pages (tolerance {args.tolerance_mb:.0f} MB)")
+    if largest > smallest and extra > args.tolerance_mb:
+        print("FAIL: ingestion memory grows with the page count")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
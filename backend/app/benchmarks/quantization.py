@@ -0,0 +1,109 @@
+"""
+Memory / recall / latency benchmark for quantized vector storage.
+
+Runs every quantization setting over the embeddings already stored in
+VECTOR_DB_PATH and compares the results with exact float32 search:
+
+    python -m app.benchmarks.quantization --queries 200 --k 5
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.quantization import FULL_VECTORS_FILE, QuantizedIndex, normalize
+
+
+def load_corpus_vectors(vector_db_path: str) -> np.ndarray:
+    """
+    Collect the embeddings of every stored document, whatever its backend
+    """
+    chunks: List[np.ndarray] = []
+    for store_path in sorted(glob.glob(os.path.join(vector_db_path, "doc_*"))):
+        full_path = os.path.join(store_path, FULL_VECTORS_FILE)
+        if os.path.exists(full_path):
+            chunks.append(np.load(full_path))
+            continue
+
+        from langchain_community.vectorstores import Chroma
+
+        data = Chroma(persist_directory=store_path).get(include=["embeddings"])
+        if data["embeddings"] is not None and len(data["embeddings"]):
+            chunks.append(np.asarray(data["embeddings"], dtype=np.float32))
+
+    if not chunks:
+        raise SystemExit(f"No embeddings found under {vector_db_path}")
+    return normalize(np.vstack(chunks))
+
+
+def percentile_ms(samples: List[float], q: float) -> float:
+    return float(np.percentile(samples, q) * 1000)
+
+
+def run(vectors: np.ndarray, n_queries: int, k: int, noise: float, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    # Perturbed corpus vectors stand in for real queries close to the content
+    queries = normalize(vectors[picks] + rng.normal(scale=noise, size=(len(picks), vectors.shape[1])))
+    truth = [set(np.argsort(-(vectors @ q))[:k]) for q in queries]
+
+    configs = [
+        ("float32 exact", None, {}),
+        ("float16", "float16", {"use_binary": False}),
+        ("float16 + binary", "float16", {"use_binary": True}),
+        ("int8", "int8", {"use_binary": False}),
+        ("int8 + binary", "int8", {"use_binary": True}),
+        ("int8 + binary, no rescore", "int8", {"use_binary": True, "rescore": False}),
+    ]
+
+    print(f"corpus: {len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={k}")
+    print(f"{'config':<28}{'RAM MB':>10}{'B/vector':>10}{'recall@k':>10}{'p50 ms':>9}{'p95 ms':>9}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, quantization, options in configs:
+            if quantization is None:
+                ram = vectors.nbytes
+                search = lambda q: np.argsort(-(vectors @ q))[:k]
+            else:
+                index = QuantizedIndex.build(vectors, os.path.join(tmp, name.replace(" ", "_")), quantization)
+                ram = index.memory_bytes()
+                search = lambda q: index.search(
+                    q,
+                    k=k,
+                    coarse_candidates=settings.VECTOR_COARSE_CANDIDATES,
+                    rescore_candidates=settings.VECTOR_RESCORE_CANDIDATES,
+                    **options,
+                )[0]
+
+            latencies, hits = [], 0
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                found = search(query)
+                latencies.append(time.perf_counter() - start)
+                hits += len(expected.intersection(found.tolist()))
+
+            print(
+                f"{name:<28}{ram / 1e6:>10.2f}{ram / len(vectors):>10.0f}{hits / (k * len(queries)):>10.3f}"
+                f"{percentile_ms(latencies, 50):>9.2f}{percentile_ms(latencies, 95):>9.2f}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vector-db-path", default=settings.VECTOR_DB_PATH)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--noise", type=float, default=0.02, help="stddev of the noise added to query vectors")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    run(load_corpus_vectors(args.vector_db_path), args.queries, args.k, args.noise, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Offline evaluation of the query router against the stored Query history, and
+fitting of its decomposition weights from labelled queries.
+
+Replays every past query on its document's vector store and compares the
+router with the legacy word-count heuristic:
+
+    python -m app.benchmarks.query_router
+    python -m app.benchmarks.query_router --labels labels.jsonl
+
+Refit the weights checked in at app/services/query_router_weights.json, with
+their cross-validated evaluation:
+
+    python -m app.benchmarks.query_router --fit --labels app/benchmarks/data/router_labels.jsonl
+
+A labels file holds one object per line with the route a reviewer judged
+correct, either for a stored query ({"query_id": ..., "route": ...}, replayed
+on its vector store) or for a query text ({"query_text": ..., "route": ...,
+"scores": [...]}, with the optional relevance scores of its top hits).
+"""
+import argparse
+import json
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.db.session import SessionLocal
+from app.models.query import Query
+from app.services.query_router import (
+    LLM_CALLS,
+    ROUTES,
+    WEIGHTS_PATH,
+    hit_features,
+    legacy_route,
+    route_query,
+    text_features,
+)
+from app.services.vector_store import open_vector_store
+
+# Classifier inputs, in the order of the fitted weight vector; top_score only gates retrieval_only
+FEATURES = ("question_marks", "interrogatives", "conjunctions", "log_words", "top_score_gap", "hit_spread")
+FOLDS = 5
+
+
+def load_labels(path: Optional[str]) -> List[Dict[str, Any]]:
+    if not path:
+        return []
+    with open(path) as f:
+        return [record for record in map(json.loads, f) if record]
+
+
+def fit_logistic(x: np.ndarray, y: np.ndarray, l2: float = 1.0, iterations: int = 50) -> Tuple[np.ndarray, float]:
+    """
+    L2-regularised logistic regression fitted by Newton's method; the bias is not penalised
+    """
+    design = np.hstack([x, np.ones((len(x), 1))])
+    penalty = np.diag([l2] * x.shape[1] + [0.0])
+    beta = np.zeros(design.shape[1])
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-design @ beta))
+        gradient = design.T @ (p - y) + penalty @ beta
+        hessian = design.T @ (design * (p * (1 - p))[:, None]) + penalty
+        step = np.linalg.solve(hessian + 1e-9 * np.eye(len(beta)), gradient)
+        beta -= step
+        if np.abs(step).max() < 1e-8:
+            break
+    return beta[:-1], float(beta[-1])
+
+
+def labelled_samples(labels: List[Dict[str, Any]]) -> Tuple[List[Dict[str, float]], List[str], List[str]]:
+    """
+    Features, labelled route and query text of every usable label
+    """
+    features, routes, texts = [], [], []
+    by_id = {record["query_id"]: record["route"] for record in labels if "query_id" in record}
+
+    for record in labels:
+        if "query_text" in record:
+            sample = text_features(record["query_text"])
+            sample.update(hit_features(record.get("scores") or []))
+            features.append(sample)
+            routes.append(record["route"])
+            texts.append(record["query_text"])
+
+    if by_id:
+        stores = {}
+        db = SessionLocal()
+        try:
+            for query in db.query(Query).filter(Query.id.in_(list(by_id))):
+                if query.document_id not in stores:
+                    try:
+                        stores[query.document_id] = open_vector_store(str(query.document_id))
+                    except ValueError:
+                        stores[query.document_id] = None
+                if stores[query.document_id] is None:
+                    continue
+                decision, _ = route_query(query.query_text, stores[query.document_id])
+                features.append(decision["features"])
+                routes.append(by_id[query.id])
+                texts.append(query.query_text)
+        finally:
+            db.close()
+
+    return features, routes, texts
+
+
+def fit(labels_path: str, output: str, l2: float) -> None:
+    samples, routes, texts = labelled_samples(load_labels(labels_path))
+    if not samples:
+        raise SystemExit("No labelled queries to fit on")
+
+    x = np.array([[sample.get(name, 0.0) for name in FEATURES] for sample in samples])
+    y = np.array([route == "decompose" for route in routes], dtype=float)
+    legacy = np.array([legacy_route(query_text) == "decompose" for query_text in texts])
+
+    # Features that never vary in the labels can't be fitted; they keep a zero weight
+    fitted = x.std(axis=0) > 0
+    unfitted = [name for name, varies in zip(FEATURES, fitted) if not varies]
+
+    # Cross-validated accuracy of the fitted classifier, on folds interleaved over the labels
+    fold = np.arange(len(y)) % FOLDS
+    predicted = np.zeros(len(y), dtype=bool)
+    for k in range(FOLDS):
+        train, test = fold != k, fold == k
+        if not test.any():
+            continue
+        weights, bias = fit_logistic(x[train][:, fitted], y[train], l2)
+        predicted[test] = x[test][:, fitted] @ weights + bias >= 0
+
+    weights, bias = fit_logistic(x[:, fitted], y, l2)
+    all_weights = dict.fromkeys(FEATURES, 0.0)
+    all_weights.update({name: round(float(w), 4) for name, w in zip(np.array(FEATURES)[fitted], weights)})
+
+    evaluation = {
+        "labels": labels_path,
+        "queries": len(y),
+        "decompose": int(y.sum()),
+        "l2": l2,
+        "cv_folds": FOLDS,
+        "cv_accuracy": round(float((predicted == y).mean()), 4),
+        "legacy_accuracy": round(float((legacy == y).mean()), 4),
+        "unfitted_features": unfitted,
+    }
+    with open(output, "w") as f:
+        json.dump({"weights": all_weights, "bias": round(bias, 4), "evaluation": evaluation}, f, indent=2)
+        f.write("\n")
+
+    print(f"fitted on {len(y)} labelled queries ({int(y.sum())} decompose)")
+    for name, weight in all_weights.items():
+        print(f"  {name:<16}{weight:>9.4f}{'  (not fitted: constant in the labels)' if name in unfitted else ''}")
+    print(f"  {'bias':<16}{bias:>9.4f}")
+    print(f"{FOLDS}-fold accuracy: router {evaluation['cv_accuracy']:.1%}, legacy {evaluation['legacy_accuracy']:.1%}")
+    print(f"written to {output}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", help="JSONL file of {query_id | query_text, route} judgements")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--fit", action="store_true", help="fit the router weights on the labels")
+    parser.add_argument("--output", default=WEIGHTS_PATH, help="where --fit writes the weights")
+    parser.add_argument("--l2", type=float, default=1.0, help="regularisation strength of --fit")
+    args = parser.parse_args()
+
+    if args.fit:
+        if not args.labels:
+            parser.error("--fit needs --labels")
+        fit(args.labels, args.output, args.l2)
+        return
+
+    labels = {
+        record["query_id"]: record["route"] for record in load_labels(args.labels) if "query_id" in record
+    }
+    confusion: Counter = Counter()
+    correct = {"router": 0, "legacy": 0}
+    calls = {"router": 0, "legacy": 0}
+    labelled = evaluated = 0
+    recorded_saved_ms = 0
+    stores = {}
+
+    db = SessionLocal()
+    try:
+        history = db.query(Query).filter(Query.document_id.isnot(None)).order_by(Query.id)
+        if args.limit:
+            history = history.limit(args.limit)
+
+        for query in history:
+            if query.document_id not in stores:
+                try:
+                    stores[query.document_id] = open_vector_store(str(query.document_id))
+                except ValueError:
+                    stores[query.document_id] = None
+            if stores[query.document_id] is None:
+                continue
+
+            routing = (query.meta_data or {}).get("routing") or {}
+            recorded_saved_ms += routing.get("estimated_latency_saved_ms", 0)
+
+            decision, _ = route_query(query.query_text, stores[query.document_id])
+            legacy = legacy_route(query.query_text)
+            evaluated += 1
+            confusion[(legacy, decision["route"])] += 1
+            calls["router"] += LLM_CALLS[decision["route"]]
+            calls["legacy"] += LLM_CALLS[legacy]
+
+            if query.id in labels:
+                labelled += 1
+                correct["router"] += decision["route"] == labels[query.id]
+                correct["legacy"] += legacy == labels[query.id]
+    finally:
+        db.close()
+
+    if not evaluated:
+        raise SystemExit("No queries with an available vector store to evaluate")
+
+    print(f"queries evaluated: {evaluated}")
+    header = "legacy \\ router"
+    print(f"\n{header:<18}" + "".join(f"{route:>16}" for route in ROUTES))
+    for legacy in ("direct", "decompose"):
+        print(f"{legacy:<18}" + "".join(f"{confusion[(legacy, route)]:>16}" for route in ROUTES))
+
+    saved = calls["legacy"] - calls["router"]
+    print(f"\nLLM calls: legacy {calls['legacy']}, router {calls['router']} ({saved} saved, "
+          f"{saved / max(calls['legacy'], 1):.1%})")
+    print(f"latency saved as recorded at query time: {recorded_saved_ms / 1000:.1f} s")
+    if labelled:
+        print(f"accuracy on {labelled} labelled queries: router {correct['router'] / labelled:.1%}, "
+              f"legacy {correct['legacy'] / labelled:.1%}")
+
+
+if __name__ == "__main__":
+    main()
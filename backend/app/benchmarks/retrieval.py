@@ -0,0 +1,222 @@
+"""
+Sweep retrieval parameters over the indexed documents and report recall, MRR and latency.
+
+Every combination of search type, k, fetch_k and MMR lambda (and of the index
+settings given with --index) is run against the vector stores in
+VECTOR_DB_PATH, and the results are printed as a table to pick the
+RETRIEVER_* settings by:
+
+    python -m app.benchmarks.retrieval
+    python -m app.benchmarks.retrieval --questions questions.jsonl --k 3 5 10
+    python -m app.benchmarks.retrieval --index VECTOR_RESCORE_CANDIDATES=20,50,100 --index VECTOR_BINARY_PASS=true,false
+
+A questions file holds one {"document_id": ..., "question": ..., "section_ids":
+[...]} object per line listing the sections that answer the question. Without
+one, questions are sentences sampled from the stored sections, and the
+relevant sections are those containing the sentence. Query embeddings are
+computed once up front: latency is that of the vector search alone.
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.document import Document, DocumentSection
+from app.services.embeddings import get_embedding_model
+from app.services.vector_store import open_vector_store
+
+_SENTENCE = re.compile(r"[^.!?\n]{40,300}[.!?]")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def load_questions(path: str) -> Dict[int, List[Tuple[str, Set[int]]]]:
+    questions: Dict[int, List[Tuple[str, Set[int]]]] = defaultdict(list)
+    with open(path) as f:
+        for record in map(json.loads, f):
+            questions[record["document_id"]].append((record["question"], set(record["section_ids"])))
+    return questions
+
+
+def sample_questions(sections: List[DocumentSection], count: int, rng: random.Random) -> List[Tuple[str, Set[int]]]:
+    """
+    Sentences of the document's text sections, each relevant to every section that contains it
+    """
+    sentences = [
+        match.group(0).strip()
+        for section in sections
+        if section.section_type == "text" and section.content
+        for match in _SENTENCE.finditer(section.content)
+    ]
+    sentences = [sentence for sentence in sentences if len(sentence.split()) >= 8]
+    normalized = [(section.id, _normalize(section.content or "")) for section in sections]
+    questions = []
+    for sentence in rng.sample(sentences, min(count, len(sentences))):
+        needle = _normalize(sentence)
+        questions.append((sentence, {section_id for section_id, content in normalized if needle in content}))
+    return questions
+
+
+def parse_index_options(options: List[str]) -> List[Dict[str, Any]]:
+    """
+    Every combination of the --index KEY=V1,V2 values, typed like the current setting
+    """
+    axes = []
+    for option in options:
+        key, _, values = option.partition("=")
+        if not hasattr(settings, key):
+            raise SystemExit(f"Unknown setting: {key}")
+        current = getattr(settings, key)
+        if isinstance(current, bool):
+            cast = lambda value: value.lower() in ("1", "true", "yes")
+        else:
+            cast = type(current)
+        axes.append([(key, cast(value)) for value in values.split(",")])
+    return [dict(combination) for combination in itertools.product(*axes)]
+
+
+def retriever_configs(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    configs = []
+    for search_type in args.search_types:
+        for k in args.k:
+            if search_type == "similarity":
+                configs.append({"search_type": search_type, "k": k, "fetch_k": None, "lambda_mult": None})
+                continue
+            for fetch_k in args.fetch_k:
+                if fetch_k < k:
+                    continue
+                for lambda_mult in args.lambdas:
+                    configs.append({"search_type": search_type, "k": k, "fetch_k": fetch_k, "lambda_mult": lambda_mult})
+    return configs
+
+
+def search(store, vector: List[float], config: Dict[str, Any]):
+    if config["search_type"] == "mmr":
+        return store.max_marginal_relevance_search_by_vector(
+            vector, k=config["k"], fetch_k=config["fetch_k"], lambda_mult=config["lambda_mult"]
+        )
+    return store.similarity_search_by_vector(vector, k=config["k"])
+
+
+def evaluate(
+    cases: List[Tuple[Any, Dict[int, Optional[str]], List[Tuple[List[float], Set[int]]]]],
+    config: Dict[str, Any],
+) -> Dict[str, float]:
+    """
+    recall@k, hit rate, MRR and latency percentiles of one configuration over every question
+    """
+    recalls, hits, reciprocal_ranks, latencies = [], [], [], []
+    for store, vector_of, questions in cases:
+        for vector, relevant in questions:
+            # Near-duplicate sections share their representative's vector: compare vectors, not sections
+            relevant_vectors = {vector_of.get(section_id) for section_id in relevant} - {None}
+            started = time.perf_counter()
+            results = search(store, vector, config)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+            retrieved = [vector_of.get(doc.metadata.get("section_id")) for doc in results]
+            found = relevant_vectors.intersection(retrieved)
+            recalls.append(len(found) / len(relevant_vectors) if relevant_vectors else 0.0)
+            hits.append(1.0 if found else 0.0)
+            rank = next((i for i, vector_id in enumerate(retrieved, 1) if vector_id in relevant_vectors), None)
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    if not latencies:
+        return {}
+    return {
+        "questions": len(latencies),
+        "recall": float(np.mean(recalls)),
+        "hit_rate": float(np.mean(hits)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--document-id", type=int, nargs="*", help="documents to evaluate (default: all indexed)")
+    parser.add_argument("--questions", help="JSONL file of {document_id, question, section_ids}")
+    parser.add_argument("--samples", type=int, default=20, help="sampled questions per document without --questions")
+    parser.add_argument("--search-types", nargs="+", default=["similarity", "mmr"], choices=["similarity", "mmr"])
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 5, 10])
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[10, 20, 40])
+    parser.add_argument("--lambdas", type=float, nargs="+", default=[0.5, 0.7, 1.0])
+    parser.add_argument("--index", action="append", default=[], help="index setting to sweep, e.g. VECTOR_RESCORE_CANDIDATES=20,50")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    labelled = load_questions(args.questions) if args.questions else None
+    rng = random.Random(args.seed)
+    embedding = get_embedding_model()
+
+    cases = []
+    db = SessionLocal()
+    try:
+        documents = db.query(Document).filter(Document.deleted_at.is_(None))
+        if args.document_id:
+            documents = documents.filter(Document.id.in_(args.document_id))
+        for document in documents.order_by(Document.id):
+            try:
+                store = open_vector_store(str(document.id))
+            except ValueError:
+                continue
+            sections = db.query(DocumentSection).filter(DocumentSection.document_id == document.id).all()
+            if labelled is not None:
+                questions = labelled.get(document.id, [])
+            else:
+                questions = sample_questions(sections, args.samples, rng)
+            if not questions:
+                continue
+            vectors = embedding.embed_documents([question for question, _ in questions])
+            vector_of = {section.id: section.vector_id for section in sections}
+            cases.append((store, vector_of, [(vector, relevant) for vector, (_, relevant) in zip(vectors, questions)]))
+    finally:
+        db.close()
+
+    if not cases:
+        raise SystemExit("No indexed documents with questions to evaluate")
+
+    current = (settings.RETRIEVER_SEARCH_TYPE, settings.RETRIEVER_K, settings.RETRIEVER_FETCH_K, settings.RETRIEVER_LAMBDA)
+    print(f"documents: {len(cases)}, questions: {sum(len(questions) for _, _, questions in cases)}, "
+          f"backend: {settings.VECTOR_BACKEND}, current settings marked *")
+    print(
+        f"  {'search':<10} {'k':>3} {'fetch_k':>7} {'lambda':>6} {'index settings':<32} "
+        f"{'recall@k':>8} {'hit@k':>6} {'MRR':>6} {'p50 ms':>7} {'p95 ms':>7}"
+    )
+    for index_settings in parse_index_options(args.index):
+        defaults = {key: getattr(settings, key) for key in index_settings}
+        for key, value in index_settings.items():
+            setattr(settings, key, value)
+        try:
+            for config in retriever_configs(args):
+                result = evaluate(cases, config)
+                if not result:
+                    continue
+                marker = "*" if (config["search_type"], config["k"]) == current[:2] and (
+                    config["search_type"] == "similarity" or (config["fetch_k"], config["lambda_mult"]) == current[2:]
+                ) else " "
+                index_label = " ".join(f"{key}={value}" for key, value in index_settings.items()) or "-"
+                print(
+                    f"{marker} {config['search_type']:<10} {config['k']:>3} {config['fetch_k'] or '-':>7} "
+                    f"{config['lambda_mult'] if config['lambda_mult'] is not None else '-':>6} {index_label:<32} "
+                    f"{result['recall']:>8.3f} {result['hit_rate']:>6.3f} {result['mrr']:>6.3f} "
+                    f"{result['p50_ms']:>7.2f} {result['p95_ms']:>7.2f}"
+                )
+        finally:
+            for key, value in defaults.items():
+                setattr(settings, key, value)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Payload size and serialization time of the read endpoints, before and after.
+
+Builds documents with growing numbers of sections and query histories with
+citations, then compares FastAPI's classic encoder (jsonable_encoder +
+json.dumps), Pydantic's own JSON serializer (what recent FastAPI versions use
+for a response_model) and the orjson path, and the size of the body raw,
+gzipped and, when the brotli package is installed, brotli-compressed. A
+revalidated view answered with a 304 sends no body at all:
+
+    python -m app.benchmarks.serialization
+    python -m app.benchmarks.serialization --sizes 100 1000 5000 --repeat 20
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.schemas.document import Document as DocumentSchema
+from app.schemas.query import QueryList
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_WORDS = (
+    "model data query index token vector layer cache result table memory batch page "
+    "document stream pipeline latency throughput retrieval embedding chunk section"
+).split()
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def make_document(sections: int, rng: random.Random) -> Any:
+    """
+    A document shaped like the ORM object GET /documents/{id} serializes
+    """
+    return SimpleNamespace(
+        id=1, title="Benchmark document", description=None, file_type=".pdf", file_path="document_storage/bench.pdf",
+        file_size=1 << 20, meta_data={"page_count": sections // 4, "file_hash": "0" * 64},
+        created_at=datetime.now(), updated_at=datetime.now(), owner_id=1,
+        sections=[
+            SimpleNamespace(
+                id=i, document_id=1, section_type="NarrativeText", content=_text(rng, 180), page_num=i // 4,
+                position=i, vector_id=f"doc1-{i}", images=[],
+                meta_data={"source": "bench.pdf", "page": i // 4, "start_index": i * 1000, "category": "NarrativeText"},
+            )
+            for i in range(sections)
+        ],
+    )
+
+
+def make_query_history(queries: int, rng: random.Random) -> Dict[str, Any]:
+    """
+    A history shaped like what GET /queries/ serializes, with three citations per query
+    """
+    return {
+        "total": queries,
+        "queries": [
+            SimpleNamespace(
+                id=i, query_text=_text(rng, 12), response=_text(rng, 150), created_at=datetime.now(),
+                is_favorite=False, user_id=1, document_id=1, meta_data={"routing": {"route": "retrieve"}},
+                citations=[
+                    SimpleNamespace(
+                        id=i * 3 + j, query_id=i, document_section_id=j, content=_text(rng, 120),
+                        meta_data={"page": j, "source": "bench.pdf"},
+                    )
+                    for j in range(3)
+                ],
+            )
+            for i in range(queries)
+        ],
+    }
+
+
+def default_encode(schema: Type[BaseModel], obj: Any) -> bytes:
+    # FastAPI's response path for a response_model before it serialized with Pydantic
+    return json.dumps(jsonable_encoder(schema.model_validate(obj))).encode()
+
+
+def pydantic_encode(schema: Type[BaseModel], obj: Any) -> bytes:
+    return schema.model_validate(obj).model_dump_json().encode()
+
+
+def orjson_encode(schema: Type[BaseModel], obj: Any) -> bytes:
+    return orjson.dumps(schema.model_validate(obj).model_dump())
+
+
+def _time(fn: Callable[[], bytes], repeat: int) -> Tuple[float, bytes]:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = fn()
+    return (time.perf_counter() - started) / repeat * 1000, body
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 2000], help="sections / queries per payload")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    payloads: List[Tuple[str, Type[BaseModel], Any]] = []
+    for size in args.sizes:
+        payloads.append((f"document/{size} sections", DocumentSchema, make_document(size, rng)))
+        payloads.append((f"queries/{size}", QueryList, make_query_history(size, rng)))
+
+    print(
+        f"{'payload':<24} {'default ms':>10} {'pydantic ms':>11} {'orjson ms':>10} {'speedup':>8} "
+        f"{'raw KB':>8} {'gzip KB':>8} {'brotli KB':>10} {'304 KB':>7}"
+    )
+    for name, schema, obj in payloads:
+        default_ms, default_body = _time(lambda: default_encode(schema, obj), args.repeat)
+        pydantic_ms, _ = _time(lambda: pydantic_encode(schema, obj), args.repeat)
+        orjson_ms, body = _time(lambda: orjson_encode(schema, obj), args.repeat)
+        assert json.loads(default_body) == json.loads(body), f"{name}: encoders disagree"
+
+        gzipped = len(gzip.compress(body, compresslevel=settings.GZIP_LEVEL)) / 1024
+        brotli_kb = f"{len(brotli.compress(body, quality=settings.BROTLI_QUALITY)) / 1024:>10.1f}" if brotli else f"{'-':>10}"
+        print(
+            f"{name:<24} {default_ms:>10.2f} {pydantic_ms:>11.2f} {orjson_ms:>10.2f} {default_ms / orjson_ms:>7.1f}x "
+            f"{len(body) / 1024:>8.1f} {gzipped:>8.1f} {brotli_kb} {0:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import secrets
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 from pydantic import AnyHttpUrl, validator, field_validator
 from pydantic_settings import BaseSettings
 
@@ -26,14 +26,118 @@ class Settings(BaseSettings):
     
     # Vector database configuration
     VECTOR_DB_PATH: str = "./vector_db"
+    VECTOR_BACKEND: str = "chroma"  # chroma, quantized, flat
+    VECTOR_QUANTIZATION: str = "int8"  # int8, float16
+    VECTOR_BINARY_PASS: bool = True  # coarse sign-bit pass before compact scoring
+    VECTOR_COARSE_CANDIDATES: int = 200
+    VECTOR_RESCORE_CANDIDATES: int = 50  # candidates rescored against full-precision vectors
+    
+    # Embedding configuration
+    EMBEDDING_MODEL_NAME: str = "all-MiniLM-L6-v2"
+    EMBEDDING_SERVER_SOCKET: Optional[str] = None  # e.g. ./embedding_server.sock; unset embeds in-process
+    EMBEDDING_SERVER_AUTHKEY: Optional[str] = None  # unset: a random key in <socket>.key, readable by its owner only
+    EMBEDDING_MAX_BATCH: int = 64  # texts encoded together by the embedding server
+    EMBEDDING_MAX_WAIT_MS: float = 5  # wait for more requests after the first one of a batch
+    QUERY_EMBEDDING_CACHE_SIZE: int = 4096  # query vectors kept per process; 0 disables the cache
+    
+    # Response compression
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # bytes; smaller responses are sent as is
+    GZIP_LEVEL: int = 6
+    BROTLI_QUALITY: int = 4  # used when brotli-asgi is installed
+    
+    # Admission control of uploads and queries, per process
+    ADMISSION_MAX_CONCURRENT: int = 8  # expensive requests running at once
+    ADMISSION_INGEST_MAX_CONCURRENT: int = 2  # of which ingestions; queries may use every slot
+    ADMISSION_MAX_QUEUED: int = 32  # waiting requests, queries first; more get a 429
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 30
+    ADMISSION_USER_MAX_QUERIES: int = 4  # per user, running or queued
+    ADMISSION_USER_MAX_INGESTS: int = 2
+    
+    # Startup warm-up (see /ready)
+    WARMUP_ENABLED: bool = True
+    WARMUP_VECTOR_STORES: int = 5  # vector stores of the most recently queried documents to open
+    
+    # Chunking configuration
+    CHUNKING_STRATEGY: str = "adaptive"  # adaptive (cells, slides, headings, code), recursive
+    CHUNK_TOKENS: int = 256
+    CHUNK_OVERLAP_TOKENS: int = 32  # only between pieces of a section too large for one chunk
+    DEDUP_ENABLED: bool = True  # near-duplicate chunks of a document share one vector
+    DEDUP_SIMILARITY: float = 0.9  # fraction of SimHash bits near-duplicates share
+    
+    # Retrieval configuration (compare settings with python -m app.benchmarks.retrieval)
+    RETRIEVER_SEARCH_TYPE: str = "mmr"  # mmr, similarity
+    RETRIEVER_K: int = 5
+    RETRIEVER_FETCH_K: int = 10  # candidates MMR picks from
+    RETRIEVER_LAMBDA: float = 0.5  # MMR: 1 is pure relevance, 0 pure diversity
+    CONTEXT_TOKEN_BUDGET: int = 2000  # prompt tokens of retrieved context per answer
+    QUERY_ROUTER_ENABLED: bool = True
+    ROUTER_RETRIEVAL_ONLY_SCORE: float = 0.9  # answer with the top passage above this relevance
+    ROUTER_DECOMPOSE_THRESHOLD: float = 0.5
     
     # LLM configuration
     OPENAI_API_KEY: Optional[str] = None
     ANTHROPIC_API_KEY: Optional[str] = None
+    LLM_BACKEND: str = "openai"  # openai, fake (offline canned responses)
+    LLM_MODEL_NAME: str = "gpt-3.5-turbo"
+    LLM_MAX_CONCURRENCY: int = 8  # concurrent LLM calls per process
+    LLM_REQUESTS_PER_MINUTE: float = 300
+    LLM_MAX_RETRIES: int = 4
+    LLM_BACKOFF_BASE_SECONDS: float = 0.5
+    LLM_TIMEOUT_SECONDS: float = 60
+    # USD per million prompt and completion tokens, by model name prefix, for cost estimates
+    LLM_PRICES: Dict[str, List[float]] = {
+        "gpt-3.5-turbo": [0.5, 1.5],
+        "gpt-4o-mini": [0.15, 0.6],
+        "gpt-4o": [2.5, 10.0],
+        "gpt-4-turbo": [10.0, 30.0],
+        "gpt-4": [30.0, 60.0],
+    }
+    
+    # Tracing of uploads and queries; a summary is always kept in Query.meta_data["trace"]
+    TRACE_EXPORTER: str = "none"  # none, jsonl, otlp
+    TRACE_EXPORT_PATH: str = "./traces/traces.jsonl"
+    TRACE_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"  # OTLP/HTTP JSON of a local collector
+    TRACE_SERVICE_NAME: str = "notebook-llm"
+    TRACE_EXPORT_MAX_QUEUED: int = 1000  # finished traces waiting for export; more are dropped
     
     # Document storage
     DOCUMENT_STORAGE_PATH: str = "./document_storage"
     
+    # Ingestion runs as a pipeline of chunk batches (parse -> split -> embed -> persist)
+    INGEST_BATCH_SIZE: int = 64
+    INGEST_MEMORY_LIMIT_MB: int = 1536  # batches shrink when an ingestion grows RSS by more, then it fails; 0 disables
+    INGEST_JOB_STALE_SECONDS: int = 600  # a running job without a heartbeat for this long is resumed
+    INGEST_JOB_MAX_ATTEMPTS: int = 3
+    
+    # Deleted documents are purged in the background; unreferenced data is collected periodically
+    CLEANUP_INTERVAL_SECONDS: int = 60
+    CLEANUP_GC_INTERVAL_SECONDS: int = 3600
+    CLEANUP_GRACE_SECONDS: int = 3600  # never collect files younger than this
+    VECTOR_COMPACT_RATIO: float = 0.2  # compact flat stores with more deleted rows than this
+    
+    # Parsed document cache, reused when re-chunking or re-embedding
+    PARSE_CACHE_PATH: str = "./parse_cache"
+    
+    # Tabular files (CSV/Excel) are stored as Parquet and queried directly
+    TABLE_STORE_PATH: str = "./table_store"
+    TABLE_SAMPLE_ROWS: int = 5
+    
+    # Image processing: OCR, optional captioning and thumbnails, cached by image hash
+    IMAGE_CACHE_PATH: str = "./image_cache"
+    IMAGE_WORKERS: int = 4
+    IMAGE_MIN_SIDE: int = 32  # skip icons and spacers smaller than this (px)
+    IMAGE_HASH_DISTANCE: int = 4  # max perceptual-hash bit difference for duplicates
+    IMAGE_THUMBNAIL_SIZE: int = 256
+    IMAGE_CAPTION_MODEL: Optional[str] = None  # e.g. Salesforce/blip-image-captioning-base
+    
+    # OCR of scanned PDF pages (those without a text layer), cached per file hash, page and DPI
+    OCR_ENABLED: bool = True
+    OCR_DPI: int = 300
+    OCR_LANGUAGE: str = "eng"  # tesseract language(s), e.g. eng+deu
+    OCR_WORKERS: int = 0  # processes; 0 uses every core
+    OCR_MIN_TEXT_CHARS: int = 20  # pages with less extractable text are OCR'd
+    OCR_CACHE_PATH: str = "./ocr_cache"
+    
     class Config:
         case_sensitive = True
         env_file = ".env"
@@ -1,12 +1,31 @@
 import os
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 
 from app.core.auth import get_password_hash
 from app.core.config import settings
 from app.db.session import Base, engine
 from app.models.user import User
-from app.models.document import Document, DocumentSection, DocumentImage
+from app.models.document import Document, DocumentSection, DocumentImage, IngestionJob
 from app.models.query import Query, Citation
+from app.services.search_index import ensure_search_index
+
+
+def add_missing_columns(engine: Engine) -> None:
+    """
+    create_all only creates missing tables; add the columns introduced since a table was created
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
 
 
 def init_db(db: Session) -> None:
@@ -15,6 +34,8 @@ def init_db(db: Session) -> None:
     """
     # Create tables
     Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
+    ensure_search_index(engine)
     
     # Check if we should create a superuser
     user = db.query(User).filter(User.email == "admin@example.com").first()
@@ -1,7 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
 from app.api.api import api_router
 from app.core.config import settings
+from app.services.admission import AdmissionRejected
+from app.services.cleanup import start_cleanup_worker
+from app.services.ingestion import start_resuming_ingestion_jobs
+from app.services.warmup import is_ready, start_warm_up, warm_up_status
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -19,12 +25,57 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress responses above a size threshold; brotli when brotli-asgi is installed
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(
+        BrotliMiddleware,
+        quality=settings.BROTLI_QUALITY,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        gzip_fallback=True,
+    )
+except ImportError:
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        compresslevel=settings.GZIP_LEVEL,
+    )
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    # Turned away by admission control: tell the client when to come back
+    return JSONResponse(
+        {"detail": exc.reason},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.on_event("startup")
+def warm_up():
+    # Preload models and connections in the background; /ready reports when done
+    start_warm_up()
+
+@app.on_event("startup")
+def resume_ingestion():
+    # Uploads interrupted by a worker crash continue from their last checkpoint
+    start_resuming_ingestion_jobs()
+
+@app.on_event("startup")
+def start_cleanup():
+    # Deleted documents are tombstoned by the API and purged here
+    start_cleanup_worker()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Notebook LLM - Multimodal Research Assistant"}
 
+@app.get("/ready")
+async def ready():
+    # Readiness probe: route traffic here only once warm-up is done ("/" is the liveness check)
+    return JSONResponse(warm_up_status(), status_code=200 if is_ready() else 503)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
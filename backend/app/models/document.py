@@ -17,12 +17,14 @@ class Document(Base):
     meta_data = Column(JSON, nullable=True)  # Renamed from metadata to meta_data
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    deleted_at = Column(DateTime(timezone=True), nullable=True, index=True)  # tombstone until cleanup
     owner_id = Column(Integer, ForeignKey("users.id"))
     
     # Relationships
     owner = relationship("User", back_populates="documents")
     sections = relationship("DocumentSection", back_populates="document", cascade="all, delete-orphan")
     queries = relationship("Query", back_populates="document")
+    ingestion_jobs = relationship("IngestionJob", back_populates="document", cascade="all, delete-orphan")
 
 
 class DocumentSection(Base):
@@ -53,4 +55,19 @@ class DocumentImage(Base):
     section_id = Column(Integer, ForeignKey("document_sections.id"))
     
     # Relationships
-    section = relationship("DocumentSection", back_populates="images") 
\ No newline at end of file
+    section = relationship("DocumentSection", back_populates="images") 
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, default="running")  # running, completed, failed, cancelled (document deleted)
+    chunks_indexed = Column(Integer, default=0)  # checkpoint: chunks stored, searchable and embedded
+    attempts = Column(Integer, default=1)  # runs started, including resumes
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    document_id = Column(Integer, ForeignKey("documents.id"), index=True)
+    
+    # Relationships
+    document = relationship("Document", back_populates="ingestion_jobs")
@@ -74,4 +74,20 @@ class Document(DocumentBase):
 
 class DocumentList(BaseModel):
     documents: List[Document]
-    total: int 
\ No newline at end of file
+    total: int 
+
+
+class SectionSearchResult(BaseModel):
+    section_id: int
+    document_id: int
+    document_title: str
+    section_type: str
+    page_num: Optional[int] = None
+    snippet: str  # HTML-escaped section text, matches wrapped in <mark>
+    score: float
+
+
+class SectionSearchResults(BaseModel):
+    results: List[SectionSearchResult]
+    query: str
+    mode: str
@@ -0,0 +1,169 @@
+"""
+Admission control for the expensive endpoints: document ingestion and queries.
+
+A process runs at most ADMISSION_MAX_CONCURRENT expensive requests at once,
+of which at most ADMISSION_INGEST_MAX_CONCURRENT ingestions, so uploads can
+never take every slot. Requests over the cap wait in a bounded queue where
+interactive queries go before ingestion. Each user has a cap on requests in
+flight per kind. A request that can't be queued, or waits too long, is
+rejected at once with a retry estimate instead of piling up behind the others.
+
+Queued requests wait on the event loop, not in a worker thread: a sync
+dependency would hold one of the threads that run the sync endpoints while it
+waits, so a full queue could starve the very requests it waits for.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from app.core.config import settings
+
+# Lower runs first
+PRIORITIES = {"query": 0, "ingest": 1}
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is turned away; retry_after is a hint in seconds
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    def __init__(self, kind: str):
+        self.kind = kind
+        # Granted from _dispatch, which runs on the event loop that waits for it
+        self.granted: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queued: int,
+        kind_limits: Dict[str, int],
+        user_limits: Dict[str, int],
+        queue_timeout: float,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.kind_limits = kind_limits
+        self.user_limits = user_limits
+        self.queue_timeout = queue_timeout
+
+        self.lock = threading.Lock()
+        self.running: Dict[str, int] = defaultdict(int)
+        self.waiting: List[Tuple[int, int, _Ticket]] = []
+        self.in_flight: Dict[Tuple[str, int], int] = defaultdict(int)
+        self.rejected: Dict[str, int] = defaultdict(int)
+        # Moving average of how long each kind holds a slot, for Retry-After
+        self.durations: Dict[str, float] = defaultdict(lambda: 1.0)
+        self._sequence = itertools.count()
+
+    def _fits(self, kind: str) -> bool:
+        return sum(self.running.values()) < self.max_concurrent and self.running[kind] < self.kind_limits[kind]
+
+    def _dispatch(self) -> None:
+        # Grant waiting tickets in priority order; an ingestion over its own cap
+        # doesn't hold up the queries queued behind it
+        remaining = []
+        for entry in sorted(self.waiting):
+            ticket = entry[2]
+            if self._fits(ticket.kind):
+                self.running[ticket.kind] += 1
+                ticket.granted.set_result(None)
+            else:
+                remaining.append(entry)
+        heapq.heapify(remaining)
+        self.waiting = remaining
+
+    def _remove(self, ticket: _Ticket) -> None:
+        self.waiting = [entry for entry in self.waiting if entry[2] is not ticket]
+        heapq.heapify(self.waiting)
+
+    def _release(self, kind: str) -> None:
+        self.running[kind] -= 1
+        self._dispatch()
+
+    def _retry_after(self, kind: str) -> int:
+        slots = min(self.max_concurrent, self.kind_limits[kind])
+        ahead = len(self.waiting) + self.running[kind]
+        return max(1, round(self.durations[kind] * ahead / slots))
+
+    def _reject(self, kind: str, reason: str) -> AdmissionRejected:
+        self.rejected[kind] += 1
+        return AdmissionRejected(reason, self._retry_after(kind))
+
+    @asynccontextmanager
+    async def admit(self, kind: str, user_id: int) -> AsyncIterator[None]:
+        """
+        Hold a slot of the given kind for the duration of the block, waiting in the queue if needed
+        """
+        user_key = (kind, user_id)
+        with self.lock:
+            if self.in_flight[user_key] >= self.user_limits[kind]:
+                raise self._reject(kind, f"Too many {kind} requests in progress for this user")
+            ticket = _Ticket(kind)
+            heapq.heappush(self.waiting, (PRIORITIES[kind], next(self._sequence), ticket))
+            self._dispatch()
+            if not ticket.granted.done() and len(self.waiting) > self.max_queued:
+                self._remove(ticket)
+                raise self._reject(kind, "Server is busy")
+            self.in_flight[user_key] += 1
+
+        try:
+            try:
+                # Shielded: a timeout or a disconnected client must not cancel the grant itself
+                await asyncio.wait_for(asyncio.shield(ticket.granted), self.queue_timeout)
+            except BaseException as e:
+                with self.lock:
+                    if not ticket.granted.done():
+                        self._remove(ticket)
+                        if isinstance(e, asyncio.TimeoutError):
+                            raise self._reject(kind, "Server is busy")
+                        raise
+                    if not isinstance(e, asyncio.TimeoutError):
+                        # Granted, but the request is gone: hand the slot on
+                        self._release(kind)
+                        raise
+                    # Granted between the timeout and taking the lock: keep the slot
+
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                with self.lock:
+                    self.durations[kind] = 0.8 * self.durations[kind] + 0.2 * (time.monotonic() - started)
+                    self._release(kind)
+        finally:
+            with self.lock:
+                self.in_flight[user_key] -= 1
+                if not self.in_flight[user_key]:
+                    del self.in_flight[user_key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "running": dict(self.running),
+                "queued": {kind: sum(1 for entry in self.waiting if entry[2].kind == kind) for kind in PRIORITIES},
+                "rejected": dict(self.rejected),
+                "mean_seconds": {kind: round(seconds, 3) for kind, seconds in self.durations.items()},
+            }
+
+
+admission = AdmissionController(
+    max_concurrent=settings.ADMISSION_MAX_CONCURRENT,
+    max_queued=settings.ADMISSION_MAX_QUEUED,
+    kind_limits={"query": settings.ADMISSION_MAX_CONCURRENT, "ingest": settings.ADMISSION_INGEST_MAX_CONCURRENT},
+    user_limits={"query": settings.ADMISSION_USER_MAX_QUERIES, "ingest": settings.ADMISSION_USER_MAX_INGESTS},
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+)
@@ -0,0 +1,241 @@
+import re
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
+
+from app.core.config import settings
+from app.services.context_packer import estimate_tokens
+
+CHUNKING_STRATEGIES = ("adaptive", "recursive")
+
+# Image descriptions and table summaries are short and map 1:1 to database records
+WHOLE_CATEGORIES = ("Image", "Table")
+
+# Markdown headings, numbered headings ("2.1 Results") and short all-caps lines
+_HEADING = re.compile(r"^(?:#{1,6}\s+\S.*|(?:\d+\.)+\d*\s+[A-Z][^.!?]{0,80}|[A-Z][A-Z0-9 ,&:()/-]{2,80})$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+
+
+def recursive_splitter() -> RecursiveCharacterTextSplitter:
+    """
+    The original fixed-size character splitter, kept as the "recursive" strategy
+    """
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len,
+        add_start_index=True,
+    )
+
+
+def token_splitter(language: Optional[str] = None) -> RecursiveCharacterTextSplitter:
+    """
+    Splitter for units larger than one chunk, sized in tokens and aware of code syntax
+    """
+    kwargs = dict(
+        chunk_size=settings.CHUNK_TOKENS,
+        chunk_overlap=settings.CHUNK_OVERLAP_TOKENS,
+        length_function=estimate_tokens,
+    )
+    if language:
+        try:
+            return RecursiveCharacterTextSplitter.from_language(Language(language.lower()), **kwargs)
+        except ValueError:
+            pass
+    return RecursiveCharacterTextSplitter(**kwargs)
+
+
+def section_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    Split text into (start, end) spans at heading lines, keeping fenced code blocks whole
+    """
+    spans = []
+    start = offset = 0
+    in_fence = False
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if _FENCE.match(line):
+            if not in_fence and offset > start:
+                spans.append((start, offset))
+                start = offset
+            elif in_fence:
+                spans.append((start, offset + len(line)))
+                start = offset + len(line)
+            in_fence = not in_fence
+        elif not in_fence and stripped and _HEADING.match(stripped) and offset > start:
+            spans.append((start, offset))
+            start = offset
+        offset += len(line)
+    if offset > start:
+        spans.append((start, offset))
+    return spans
+
+
+def split_unit(unit: Document, language: Optional[str] = None) -> List[Document]:
+    """
+    Split a unit larger than one chunk, gluing a tiny leading piece (e.g. a lone heading) to the next
+    """
+    text = unit.page_content
+    spans = []
+    search_from = 0
+    for piece in token_splitter(language).split_text(text):
+        # The splitter's own start_index assumes a character overlap; locate pieces directly
+        start = text.find(piece, search_from)
+        if start < 0:
+            start = search_from
+        spans.append((start, start + len(piece)))
+        search_from = start + 1
+
+    if len(spans) > 1 and estimate_tokens(text[slice(*spans[0])]) < settings.CHUNK_TOKENS // 8:
+        spans[1] = (spans[0][0], spans[1][1])
+        spans = spans[1:]
+
+    offset = unit.metadata.get("start_index", 0)
+    return [
+        Document(page_content=text[start:end], metadata=dict(unit.metadata, start_index=offset + start))
+        for start, end in spans
+    ]
+
+
+class UnitPacker:
+    """
+    Greedily merge consecutive units (sections, cells, slides) into chunks of at most
+    CHUNK_TOKENS tokens; a unit larger than that is split on its own.
+
+    Units are fed one at a time, so only the chunk being filled is held in memory.
+    """
+
+    def __init__(self, join: Callable[[List[Document]], Document], language: Optional[str] = None):
+        self.join = join
+        self.language = language
+        self.current: List[Document] = []
+        self.current_tokens = 0
+
+    def add(self, unit: Document) -> List[Document]:
+        tokens = estimate_tokens(unit.page_content)
+        if tokens > settings.CHUNK_TOKENS:
+            return self.flush() + split_unit(unit, self.language or unit.metadata.get("language"))
+
+        chunks = []
+        if self.current and self.current_tokens + tokens > settings.CHUNK_TOKENS:
+            chunks = self.flush()
+        self.current.append(unit)
+        self.current_tokens += tokens
+        return chunks
+
+    def flush(self) -> List[Document]:
+        chunks = [self.join(self.current)] if self.current else []
+        self.current, self.current_tokens = [], 0
+        return chunks
+
+
+def pack_units(
+    units: Iterable[Document],
+    join: Callable[[List[Document]], Document],
+    language: Optional[str] = None,
+) -> List[Document]:
+    """
+    Pack a sequence of units into token-sized chunks
+    """
+    packer = UnitPacker(join, language)
+    chunks = [chunk for unit in units for chunk in packer.add(unit)]
+    return chunks + packer.flush()
+
+
+def chunk_prose(doc: Document) -> List[Document]:
+    """
+    Chunk a page of prose along its headings and code blocks
+    """
+    text = doc.page_content
+    units = []
+    for start, end in section_spans(text):
+        # Skip leading whitespace so start_index points at the first character kept
+        start += len(text[start:end]) - len(text[start:end].lstrip())
+        if start < end:
+            units.append(Document(page_content=text[start:end].rstrip(), metadata=dict(doc.metadata, start_index=start)))
+
+    def join(parts: List[Document]) -> Document:
+        # Sections are contiguous, so the chunk is the exact slice of the page
+        start = parts[0].metadata["start_index"]
+        end = parts[-1].metadata["start_index"] + len(parts[-1].page_content)
+        return Document(page_content=text[start:end], metadata=dict(parts[0].metadata))
+
+    return pack_units(units, join)
+
+
+def _join_cells(cells: List[Document]) -> Document:
+    metadata = {key: value for key, value in cells[0].metadata.items() if key not in ("cell", "cell_type")}
+    first, last = cells[0].metadata.get("cell"), cells[-1].metadata.get("cell")
+    metadata["cells"] = str(first) if first == last else f"{first}-{last}"
+    if all(cell.metadata.get("cell_type") == "code" for cell in cells):
+        metadata["category"] = "Code"
+    return Document(page_content="\n\n".join(cell.page_content for cell in cells), metadata=metadata)
+
+
+def _join_slides(slides: List[Document]) -> Document:
+    metadata = dict(slides[0].metadata)
+    metadata["pages"] = ",".join(str(slide.metadata.get("page")) for slide in slides)
+    return Document(page_content="\n\n".join(slide.page_content for slide in slides), metadata=metadata)
+
+
+def _unit_kind(doc: Document) -> Optional[str]:
+    if "cell_type" in doc.metadata:
+        return "cell"
+    if doc.metadata.get("category") == "Slide":
+        return "slide"
+    return None
+
+
+def iter_adaptive(documents: Iterable[Document]) -> Iterator[Document]:
+    """
+    Chunk by the structure of each file type: notebook cells, slides, then headings and code blocks
+    """
+    packer: Optional[UnitPacker] = None
+    run_key = None
+    for doc in documents:
+        # Notebook cells and slides arrive one per document; pack runs of them together
+        kind = _unit_kind(doc)
+        key = (kind, doc.metadata.get("source")) if kind else None
+        if packer is not None and key != run_key:
+            yield from packer.flush()
+            packer = None
+
+        if kind is not None:
+            if packer is None:
+                packer, run_key = UnitPacker(_join_cells if kind == "cell" else _join_slides), key
+            yield from packer.add(doc)
+        elif doc.metadata.get("category") in WHOLE_CATEGORIES:
+            yield doc
+        else:
+            yield from chunk_prose(doc)
+
+    if packer is not None:
+        yield from packer.flush()
+
+
+def iter_chunks(documents: Iterable[Document], strategy: Optional[str] = None) -> Iterator[Document]:
+    """
+    Lazily split parsed documents into chunks with the given (or configured) strategy
+    """
+    strategy = strategy or settings.CHUNKING_STRATEGY
+    if strategy not in CHUNKING_STRATEGIES:
+        raise ValueError(f"Unsupported chunking strategy: {strategy}")
+
+    if strategy == "adaptive":
+        yield from iter_adaptive(documents)
+        return
+
+    splitter = recursive_splitter()
+    for doc in documents:
+        if doc.metadata.get("category") in WHOLE_CATEGORIES:
+            yield doc
+        else:
+            yield from splitter.split_documents([doc])
+
+
+def chunk_documents(documents: List[Document], strategy: Optional[str] = None) -> List[Document]:
+    """
+    Split parsed documents into chunks with the given (or configured) strategy
+    """
+    return list(iter_chunks(documents, strategy))
@@ -0,0 +1,225 @@
+"""
+Background cleanup of deleted documents and garbage collection of stored data.
+
+Deleting a document only tombstones it; once no ingestion of it is running,
+this worker removes its sections, search entries, vectors and file, then
+periodically reclaims disk space left behind: orphaned vector stores, uploaded
+files, parse cache, OCR cache, image cache and table store entries no document
+uses, and flat vector stores with many deleted rows
+(compacted only while nobody is reading them).
+Run one pass by hand with:
+
+    python -m app.services.cleanup
+"""
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Set
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.document import Document, DocumentImage, IngestionJob
+from app.models.query import Query
+from app.services.flat_vector_store import FlatVectorStore, VECTORS_FILE
+from app.services.ingestion import clear_document_index
+
+_VECTOR_STORE_DIR = re.compile(r"^doc_(\d+)$")
+
+_wake = threading.Event()
+
+
+def purge_document(db: Session, document: Document) -> None:
+    """
+    Remove everything stored for a tombstoned document, then the document itself
+    """
+    document_id, file_path = document.id, document.file_path
+
+    # Bulk deletes of sections, images and search entries, then the vector store
+    clear_document_index(db, document_id)
+
+    # Past queries stay in the history without their document, as before
+    db.query(Query).filter(Query.document_id == document_id).update(
+        {Query.document_id: None}, synchronize_session=False
+    )
+    db.query(IngestionJob).filter(IngestionJob.document_id == document_id).delete(synchronize_session=False)
+    db.query(Document).filter(Document.id == document_id).delete(synchronize_session=False)
+    db.commit()
+
+    # The same path may back a newer upload of a file with the same name
+    if os.path.exists(file_path) and not db.query(Document.id).filter(Document.file_path == file_path).first():
+        os.remove(file_path)
+
+
+def purge_deleted_documents(db: Session) -> int:
+    """
+    Purge every tombstoned document that is not being ingested; returns how many were purged
+    """
+    # A live ingestion stops at its next batch once it sees the tombstone; a stale job is a dead worker's
+    stale_before = datetime.utcnow() - timedelta(seconds=settings.INGEST_JOB_STALE_SECONDS)
+    ingesting = db.query(IngestionJob.document_id).filter(
+        IngestionJob.status == "running", IngestionJob.updated_at >= stale_before
+    )
+    purged = 0
+    for document in db.query(Document).filter(Document.deleted_at.isnot(None), Document.id.notin_(ingesting)).all():
+        try:
+            purge_document(db, document)
+            purged += 1
+        except Exception as e:
+            # Left tombstoned, so the next pass retries it
+            db.rollback()
+            print(f"Purging document {document.id} failed: {e}")
+    return purged
+
+
+def _is_old(path: str) -> bool:
+    # Entries younger than the grace period may belong to an upload in progress
+    return time.time() - os.path.getmtime(path) > settings.CLEANUP_GRACE_SECONDS
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def collect_garbage(db: Session) -> Dict[str, int]:
+    """
+    Remove stored data no document references and compact flat vector stores
+    """
+    stats = {
+        "vector_stores": 0, "files": 0, "parse_cache": 0, "ocr_cache": 0, "image_cache": 0,
+        "table_store": 0, "compacted_rows": 0,
+    }
+
+    document_ids: Set[int] = set()
+    file_paths: Set[str] = set()
+    file_hashes: Set[str] = set()
+    for document_id, file_path, meta_data in db.query(Document.id, Document.file_path, Document.meta_data):
+        document_ids.add(document_id)
+        file_paths.add(os.path.abspath(file_path))
+        if meta_data and meta_data.get("file_hash"):
+            file_hashes.add(meta_data["file_hash"])
+
+    if os.path.isdir(settings.VECTOR_DB_PATH):
+        for name in os.listdir(settings.VECTOR_DB_PATH):
+            match = _VECTOR_STORE_DIR.match(name)
+            path = os.path.join(settings.VECTOR_DB_PATH, name)
+            if not match:
+                continue
+            if int(match.group(1)) not in document_ids:
+                if _is_old(path):
+                    _remove(path)
+                    stats["vector_stores"] += 1
+                continue
+
+            # Rows deleted from flat stores are only tombstoned until compaction
+            if os.path.exists(os.path.join(path, VECTORS_FILE)):
+                store = FlatVectorStore(persist_directory=path, embedding_function=None)
+                rows = 0 if store.vectors is None else len(store.vectors)
+                if rows and len(store.tombstones) / rows > settings.VECTOR_COMPACT_RATIO:
+                    stats["compacted_rows"] += store.compact()
+
+    if os.path.isdir(settings.DOCUMENT_STORAGE_PATH):
+        for name in os.listdir(settings.DOCUMENT_STORAGE_PATH):
+            path = os.path.join(settings.DOCUMENT_STORAGE_PATH, name)
+            if os.path.isfile(path) and os.path.abspath(path) not in file_paths and _is_old(path):
+                _remove(path)
+                stats["files"] += 1
+
+    if os.path.isdir(settings.PARSE_CACHE_PATH):
+        for name in os.listdir(settings.PARSE_CACHE_PATH):
+            path = os.path.join(settings.PARSE_CACHE_PATH, name)
+            # Entries are named <file hash>_<extension>.v<version>.jsonl.gz
+            if name.split("_", 1)[0] not in file_hashes and _is_old(path):
+                _remove(path)
+                stats["parse_cache"] += 1
+
+    if os.path.isdir(settings.OCR_CACHE_PATH):
+        # Entries are <hash prefix>/<file hash>.p<page>.<dpi>dpi.<language>.txt
+        for prefix in os.listdir(settings.OCR_CACHE_PATH):
+            prefix_dir = os.path.join(settings.OCR_CACHE_PATH, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, name)
+                if name.split(".", 1)[0] not in file_hashes and _is_old(path):
+                    _remove(path)
+                    stats["ocr_cache"] += 1
+            if not os.listdir(prefix_dir):
+                os.rmdir(prefix_dir)
+
+    if os.path.isdir(settings.IMAGE_CACHE_PATH):
+        # Entries are <content hash>.json, .<format> and .thumb.png; images point at the original
+        image_hashes = {
+            os.path.basename(image_path).split(".", 1)[0]
+            for (image_path,) in db.query(DocumentImage.image_path)
+            if image_path
+        }
+        for name in os.listdir(settings.IMAGE_CACHE_PATH):
+            path = os.path.join(settings.IMAGE_CACHE_PATH, name)
+            if name.split(".", 1)[0] not in image_hashes and _is_old(path):
+                _remove(path)
+                stats["image_cache"] += 1
+
+    if os.path.isdir(settings.TABLE_STORE_PATH):
+        table_dirs = {file_hash[:16] for file_hash in file_hashes}
+        for name in os.listdir(settings.TABLE_STORE_PATH):
+            path = os.path.join(settings.TABLE_STORE_PATH, name)
+            if name not in table_dirs and _is_old(path):
+                _remove(path)
+                stats["table_store"] += 1
+
+    return stats
+
+
+def wake_cleanup_worker() -> None:
+    """
+    Have the cleanup worker purge tombstoned documents now rather than at its next interval
+    """
+    _wake.set()
+
+
+def _cleanup_loop() -> None:
+    last_gc = 0.0
+    while True:
+        _wake.clear()
+        db = SessionLocal()
+        try:
+            purge_deleted_documents(db)
+            if time.monotonic() - last_gc > settings.CLEANUP_GC_INTERVAL_SECONDS:
+                collect_garbage(db)
+                last_gc = time.monotonic()
+        except Exception as e:
+            print(f"Cleanup failed: {e}")
+        finally:
+            db.close()
+        _wake.wait(settings.CLEANUP_INTERVAL_SECONDS)
+
+
+def start_cleanup_worker() -> threading.Thread:
+    """
+    Purge deleted documents and collect garbage in the background
+    """
+    thread = threading.Thread(target=_cleanup_loop, name="cleanup", daemon=True)
+    thread.start()
+    return thread
+
+
+def main() -> None:
+    db = SessionLocal()
+    try:
+        print(f"documents purged: {purge_deleted_documents(db)}")
+        for name, count in collect_garbage(db).items():
+            print(f"{name}: {count}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import hashlib
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional; fall back to a character estimate
+    _ENCODING = None
+
+# Reciprocal rank fusion constant; dampens the weight of the very first ranks
+RRF_K = 60
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Count prompt tokens, or estimate them at ~4 characters per token
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def chunk_key(doc: Document) -> Hashable:
+    """
+    Identify a chunk across retrievals: by position in its source when known, else by content
+    """
+    position = doc.metadata.get("position")
+    if position is not None:
+        return (doc.metadata.get("source"), position)
+    return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def fuse_rankings(rankings: List[List[Document]]) -> List[Document]:
+    """
+    Deduplicate chunks retrieved for several (sub-)queries, most relevant first.
+
+    Each retriever returns chunks in relevance order; a chunk's score is the sum
+    of 1 / (RRF_K + rank) over every ranking it appears in.
+    """
+    scores: Dict[Hashable, float] = {}
+    docs: Dict[Hashable, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = chunk_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+def _is_adjacent(previous: Document, current: Document) -> bool:
+    prev_meta, meta = previous.metadata, current.metadata
+    if prev_meta.get("source") != meta.get("source") or prev_meta.get("page") != meta.get("page"):
+        return False
+    # Merged chunks end at the last position they cover
+    prev_position = prev_meta.get("positions", [prev_meta.get("position")])[-1]
+    if prev_position is None or meta.get("position") is None:
+        return False
+    return meta["position"] - prev_position == 1
+
+
+def merge_adjacent(docs: List[Document]) -> List[Document]:
+    """
+    Merge consecutive chunks of the same page into one, dropping the splitter overlap.
+
+    The result is in document order; merged chunks list every position they cover
+    in metadata["positions"] so citations can still point at each section.
+    """
+    ordered = sorted(docs, key=lambda d: (str(d.metadata.get("source")), d.metadata.get("position") or 0))
+    merged: List[Document] = []
+    ends: List[Optional[int]] = []
+    for doc in ordered:
+        start = doc.metadata.get("start_index")
+        end = start + len(doc.page_content) if start is not None else None
+
+        if merged and _is_adjacent(merged[-1], doc):
+            previous, text = merged[-1], doc.page_content
+            overlap = ends[-1] - start if ends[-1] is not None and start is not None else 0
+            if overlap > 0:
+                # The chunks are contiguous in the source once the overlap is cut
+                previous.page_content += text[overlap:]
+            else:
+                previous.page_content += "\n" + text
+            previous.metadata["positions"].append(doc.metadata["position"])
+            ends[-1] = end
+            continue
+
+        metadata = dict(doc.metadata)
+        metadata["positions"] = [metadata.get("position")]
+        merged.append(Document(page_content=doc.page_content, metadata=metadata))
+        ends.append(end)
+
+    return merged
+
+
+def pack_context(rankings: List[List[Document]], token_budget: int) -> Tuple[List[Document], List[Document]]:
+    """
+    Assemble the "stuff" prompt context from one or more retrieval rankings.
+
+    Chunks are deduplicated across rankings, taken by relevance while they fit
+    in token_budget, then adjacent chunks are merged. Returns the documents to
+    put in the prompt and the selected source chunks to cite.
+    """
+    selected: List[Document] = []
+    used = 0
+    for doc in fuse_rankings(rankings):
+        tokens = estimate_tokens(doc.page_content)
+        if used + tokens > token_budget:
+            # A smaller, less relevant chunk may still fit
+            continue
+        selected.append(doc)
+        used += tokens
+
+    return merge_adjacent(selected), selected
@@ -0,0 +1,124 @@
+"""
+Near-duplicate chunk detection with SimHash.
+
+Headers, footers, disclaimers and boilerplate cells repeat on every page of a
+document. Each chunk gets a 64-bit SimHash over its word trigrams; two chunks
+are near-duplicates when their hashes differ in few enough bits. Candidates
+are found through band buckets: with at most d differing bits, splitting the
+hash into d + 1 bands guarantees one band is identical, so only chunks sharing
+a band are compared.
+"""
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+SIMHASH_BITS = 64
+
+_WORD = re.compile(r"\w+", flags=re.UNICODE)
+
+
+def _shingles(text: str, size: int = 3) -> List[str]:
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def simhash(text: str) -> Optional[int]:
+    """
+    64-bit SimHash of the word trigrams of a text, None for a text without words
+    """
+    shingles = _shingles(text)
+    if not shingles:
+        return None
+
+    hashes = np.frombuffer(
+        b"".join(hashlib.blake2b(shingle.encode(), digest_size=8).digest() for shingle in shingles), dtype=">u8"
+    )
+    # Each shingle votes +1 / -1 on every bit; the sign of the total sets the bit
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+
+class NearDuplicateDetector:
+    """
+    Find the chunks of a document that nearly repeat an earlier one.
+
+    similarity is the fraction of SimHash bits two chunks must share. The first
+    chunk of a group is its representative; later ones are marked with its
+    position in metadata["duplicate_of"].
+    """
+
+    def __init__(self, similarity: float):
+        similarity = min(max(similarity, 0.5), 1.0)
+        self.similarity = similarity
+        self.max_distance = int((1 - similarity) * SIMHASH_BITS)
+
+        bands = self.max_distance + 1
+        width = SIMHASH_BITS // bands
+        self.bands: List[Tuple[int, int]] = [
+            (i * width, SIMHASH_BITS - i * width if i == bands - 1 else width) for i in range(bands)
+        ]
+        self.buckets: List[Dict[int, List[int]]] = [{} for _ in self.bands]
+        # Representatives: (simhash, length, position)
+        self.representatives: List[Tuple[int, int, int]] = []
+
+        self.chunks = 0
+        self.duplicates = 0
+        self.duplicate_characters = 0
+
+    def _band_keys(self, signature: int) -> List[int]:
+        return [(signature >> shift) & ((1 << width) - 1) for shift, width in self.bands]
+
+    def _find(self, signature: int, length: int) -> Optional[int]:
+        seen = set()
+        for buckets, key in zip(self.buckets, self._band_keys(signature)):
+            for index in buckets.get(key, ()):
+                if index in seen:
+                    continue
+                seen.add(index)
+                other, other_length, position = self.representatives[index]
+                # A short chunk inside a long one can hash alike; near-duplicates are about the same size
+                if min(length, other_length) < self.similarity * max(length, other_length):
+                    continue
+                if bin(signature ^ other).count("1") <= self.max_distance:
+                    return position
+        return None
+
+    def check(self, chunk: Document) -> Optional[int]:
+        """
+        Mark a chunk that nearly repeats an earlier one, or remember it as a representative.
+
+        Returns the position of the representative for a duplicate, otherwise None.
+        """
+        self.chunks += 1
+        text = chunk.page_content or ""
+        signature = simhash(text)
+        if signature is None:
+            return None
+
+        representative = self._find(signature, len(text))
+        if representative is not None:
+            chunk.metadata["duplicate_of"] = representative
+            self.duplicates += 1
+            self.duplicate_characters += len(text)
+            return representative
+
+        index = len(self.representatives)
+        self.representatives.append((signature, len(text), chunk.metadata["position"]))
+        for buckets, key in zip(self.buckets, self._band_keys(signature)):
+            buckets.setdefault(key, []).append(index)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "similarity": self.similarity,
+            "chunks": self.chunks,
+            "duplicates": self.duplicates,
+            "duplicate_ratio": round(self.duplicates / self.chunks, 4) if self.chunks else 0.0,
+            "duplicate_characters": self.duplicate_characters,
+        }
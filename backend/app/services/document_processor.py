@@ -1,6 +1,8 @@
+import json
 import os
 import shutil
-from typing import Dict, List, Optional, Any, Tuple
+from itertools import groupby
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from pathlib import Path
 
 from langchain_community.document_loaders import (
@@ -11,15 +13,64 @@ from langchain_community.document_loaders import (
     UnstructuredExcelLoader,
     UnstructuredPowerPointLoader,
     UnstructuredImageLoader,
-    NotebookLoader,
 )
 from langchain_community.document_loaders.base import BaseLoader
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
 
 from app.core.config import settings
+from app.services.chunking import iter_chunks
+from app.services.image_processor import IMAGE_EXTENSIONS, process_images
+from app.services.parse_cache import cache_parsed, file_sha256, iter_cached
+from app.services.pdf_ocr import ocr_scanned_pages
+from app.services.table_store import TABULAR_EXTENSIONS, store_tables, table_documents
+from app.services.vector_store import build_vector_store, get_vector_store_path
+
+
+class NotebookCellLoader(BaseLoader):
+    """
+    Load a Jupyter notebook as one document per cell, so chunks can follow cell boundaries
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def lazy_load(self) -> Iterator[Document]:
+        with open(self.file_path, encoding="utf-8") as f:
+            notebook = json.load(f)
+
+        language = notebook.get("metadata", {}).get("kernelspec", {}).get("language", "python")
+        for index, cell in enumerate(notebook.get("cells", [])):
+            source = cell.get("source", "")
+            text = "".join(source) if isinstance(source, list) else source
+            if not text.strip():
+                continue
+            yield Document(
+                page_content=text,
+                metadata={
+                    "source": self.file_path,
+                    "cell": index,
+                    "cell_type": cell.get("cell_type", "code"),
+                    "language": language,
+                },
+            )
+
+
+def merge_slide_elements(elements: Iterable[Document]) -> Iterator[Document]:
+    """
+    Merge the (consecutive) elements of a presentation into one document per slide
+    """
+    for index, (page_number, slide_elements) in enumerate(
+        groupby(elements, key=lambda element: element.metadata.get("page_number"))
+    ):
+        slide_elements = list(slide_elements)
+        yield Document(
+            page_content="\n".join(element.page_content for element in slide_elements),
+            metadata={
+                "source": slide_elements[0].metadata.get("source"),
+                "category": "Slide",
+                "page": page_number - 1 if isinstance(page_number, int) else index,
+            },
+        )
 
 
 def get_loader_for_file(file_path: str) -> BaseLoader:
@@ -39,80 +90,130 @@ def get_loader_for_file(file_path: str) -> BaseLoader:
     elif file_extension in [".xlsx", ".xls"]:
         return UnstructuredExcelLoader(file_path)
     elif file_extension in [".ppt", ".pptx"]:
-        return UnstructuredPowerPointLoader(file_path)
+        # Elements carry their slide number, which merge_slide_elements groups by
+        return UnstructuredPowerPointLoader(file_path, mode="elements")
     elif file_extension in [".jpg", ".jpeg", ".png", ".gif"]:
         return UnstructuredImageLoader(file_path, mode="elements")
     elif file_extension == ".ipynb":
-        return NotebookLoader(file_path)
+        return NotebookCellLoader(file_path)
     else:
         raise ValueError(f"Unsupported file extension: {file_extension}")
 
 
-def save_uploaded_file(file_data: bytes, filename: str) -> str:
+def save_uploaded_file(file_data: Union[bytes, BinaryIO], filename: str) -> str:
     """
-    Save an uploaded file to the document storage directory
+    Save an uploaded file (its bytes or a file object, copied in blocks) to the document storage directory
     """
     os.makedirs(settings.DOCUMENT_STORAGE_PATH, exist_ok=True)
     
     file_path = os.path.join(settings.DOCUMENT_STORAGE_PATH, filename)
     
     with open(file_path, "wb") as f:
-        f.write(file_data)
+        if isinstance(file_data, bytes):
+            f.write(file_data)
+        else:
+            shutil.copyfileobj(file_data, f, 1 << 20)
     
     return file_path
 
 
-def process_document(file_path: str) -> Tuple[List[Document], Dict[str, Any]]:
-    """
-    Process a document using LangChain and extract its content and metadata
+def _parse_document(file_path: str, meta_data: Dict[str, Any]) -> Iterator[Document]:
+    file_extension = Path(file_path).suffix.lower()
+    meta_data.update(file_type=file_extension, file_name=Path(file_path).name)
+    
+    if file_extension in IMAGE_EXTENSIONS:
+        # Image files are OCR'd and captioned once, cached by content hash
+        documents = process_images(file_path)
+        yield from documents
+        meta_data.update(page_count=1, image_count=len(documents))
+        return
+    
+    if file_extension in TABULAR_EXTENSIONS:
+        # Tables are stored as Parquet; only their schema, stats and a sample are embedded
+        tables = store_tables(file_path)
+        yield from table_documents(file_path, tables)
+        meta_data.update(page_count=len(tables), image_count=0, tables=tables)
+        return
+    
+    # Pages are loaded one at a time where the loader supports it
+    documents = get_loader_for_file(file_path).lazy_load()
+    if file_extension in [".ppt", ".pptx"]:
+        documents = merge_slide_elements(documents)
+    ocr_stats: Dict[str, Any] = {}
+    if file_extension == ".pdf" and settings.OCR_ENABLED:
+        # Scanned pages have no text layer; only those are rasterized and OCR'd
+        documents = ocr_scanned_pages(file_path, documents, meta_data.get("file_hash") or file_sha256(file_path), ocr_stats)
+    page_count = 0
+    for doc in documents:
+        page_count += 1
+        yield doc
+    
+    # Embedded images become retrievable text chunks of their caption and OCR output;
+    # the scan of an OCR'd page is already in its text
+    ocr_pages = set(ocr_stats.pop("ocr_pages", []))
+    images = process_images(file_path, skip_pages=ocr_pages) if file_extension in [".pdf", ".docx", ".pptx"] else []
+    yield from images
+    meta_data.update(page_count=page_count, image_count=len(images))
+    if ocr_stats:
+        meta_data["ocr"] = {**ocr_stats, "ocr_pages": len(ocr_pages)}
+
+
+def iter_document(file_path: str, meta_data: Dict[str, Any], use_cache: bool = True) -> Iterator[Document]:
     """
-    loader = get_loader_for_file(file_path)
-    documents = loader.load()
+    Lazily parse a document, page by page where the loader allows it.
     
-    # Extract metadata
-    meta_data = {
-        "page_count": len(documents),
-        "file_type": Path(file_path).suffix.lower(),
-        "file_name": Path(file_path).name,
-    }
+    meta_data is filled in once the iterator is exhausted. Parser output is
+    cached by file hash and parser version, so re-chunking or re-embedding a
+    file never parses it again.
+    """
+    file_hash = file_sha256(file_path)
+    meta_data["file_hash"] = file_hash
+    if use_cache:
+        cached = iter_cached(file_path, meta_data, file_hash)
+        if cached is not None:
+            return cached
     
+    return cache_parsed(file_path, _parse_document(file_path, meta_data), meta_data, file_hash)
+
+
+def process_document(file_path: str, use_cache: bool = True) -> Tuple[List[Document], Dict[str, Any]]:
+    """
+    Process a document using LangChain and extract its content and metadata
+    """
+    meta_data: Dict[str, Any] = {}
+    documents = list(iter_document(file_path, meta_data, use_cache))
     return documents, meta_data
 
 
-def split_documents(documents: List[Document]) -> List[Document]:
+def iter_split_documents(documents: Iterable[Document], strategy: Optional[str] = None) -> Iterator[Document]:
+    """
+    Lazily split documents into smaller chunks for better processing.
+    
+    The strategy (settings.CHUNKING_STRATEGY by default) is either "adaptive",
+    which follows notebook cells, slides, headings and code blocks and sizes
+    chunks in tokens, or the original fixed-size "recursive" character splitter.
+    """
+    # Record each chunk's position so adjacent chunks can be merged at query time
+    for position, chunk in enumerate(iter_chunks(documents, strategy)):
+        chunk.metadata["position"] = position
+        yield chunk
+
+
+def split_documents(documents: List[Document], strategy: Optional[str] = None) -> List[Document]:
     """
     Split documents into smaller chunks for better processing
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len,
-    )
-    
-    return text_splitter.split_documents(documents)
+    return list(iter_split_documents(documents, strategy))
 
 
 def create_embeddings_for_documents(documents: List[Document], document_id: str) -> str:
     """
     Create embeddings for documents and store them in the vector database
     """
-    os.makedirs(settings.VECTOR_DB_PATH, exist_ok=True)
-    
-    # Use HuggingFace embeddings for technical content
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    
-    # Create vector store
-    vector_store_path = os.path.join(settings.VECTOR_DB_PATH, f"doc_{document_id}")
-    vectorstore = Chroma.from_documents(
-        documents=documents,
-        embedding=embeddings,
-        persist_directory=vector_store_path,
-    )
-    
-    # Persist the vector store
-    vectorstore.persist()
+    # The backend (Chroma or quantized) is chosen by settings.VECTOR_BACKEND
+    build_vector_store(documents, document_id)
     
-    return vector_store_path
+    return get_vector_store_path(document_id)
 
 
 def extract_document_structure(documents: List[Document]) -> List[Dict[str, Any]]:
@@ -120,11 +221,10 @@ def extract_document_structure(documents: List[Document]) -> List[Dict[str, Any]
     Extract document structure including sections, images, tables, etc.
     """
     sections = []
-    position = 0
     
     for doc in documents:
         section_type = "text"
-        if "image" in doc.metadata.get("source", "").lower():
+        if doc.metadata.get("category") == "Image" or "image" in doc.metadata.get("source", "").lower():
             section_type = "image"
         elif "table" in doc.metadata.get("category", "").lower():
             section_type = "table"
@@ -135,11 +235,10 @@ def extract_document_structure(documents: List[Document]) -> List[Dict[str, Any]
             "section_type": section_type,
             "content": doc.page_content,
             "page_num": doc.metadata.get("page", None),
-            "position": position,
+            "position": doc.metadata.get("position", len(sections)),
             "meta_data": doc.metadata,  # Changed from metadata to meta_data
         }
         
         sections.append(section)
-        position += 1
     
     return sections 
\ No newline at end of file
@@ -0,0 +1,272 @@
+"""
+Embedding server shared by every API worker and ingestion job on the host.
+
+One process holds the model and encodes the texts of concurrent requests from
+all workers together, in batches formed dynamically: a batch starts with the
+first waiting request and takes every request that arrives within
+EMBEDDING_MAX_WAIT_MS, up to EMBEDDING_MAX_BATCH texts. Workers connect over a
+Unix socket when EMBEDDING_SERVER_SOCKET is set.
+
+Requests are pickled, so every connection must pass the authkey handshake
+before anything is read from it. The key is EMBEDDING_SERVER_AUTHKEY or, when
+that is unset, a random one the server writes to <socket>.key, readable only by
+the user running it (like the socket itself):
+
+    python -m app.services.embedding_server
+    python -m app.services.embedding_server --stats
+"""
+import argparse
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Deque, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+
+# Requests whose latency is kept for the percentiles
+LATENCY_WINDOW = 1000
+
+
+@dataclass
+class _Request:
+    connection: Connection
+    texts: List[str]
+    received: float = field(default_factory=time.perf_counter)
+
+
+def get_key_path(address: str) -> str:
+    return f"{address}.key"
+
+
+def _authkey(address: str) -> bytes:
+    """
+    The configured authkey, or the one the server generated next to its socket
+    """
+    if settings.EMBEDDING_SERVER_AUTHKEY:
+        return settings.EMBEDDING_SERVER_AUTHKEY.encode()
+    with open(get_key_path(address), "rb") as f:
+        return f.read()
+
+
+def _write_authkey(address: str) -> None:
+    key_path = get_key_path(address)
+    tmp_path = f"{key_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    # Created 0600 from the start, so it is never readable by others, even briefly
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(secrets.token_hex(32).encode())
+    os.replace(tmp_path, key_path)
+
+
+class EmbeddingServer:
+    """
+    Accepts connections on a Unix socket and encodes their requests in shared batches
+    """
+
+    def __init__(self, address: str, embeddings: Embeddings, max_batch: int, max_wait_ms: float):
+        self.address = address
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.requests: "queue.Queue[_Request]" = queue.Queue()
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.batch_sizes: Deque[int] = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {"requests": 0, "texts": 0, "batches": 0, "connections": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            batch_sizes = list(self.batch_sizes)
+            stats: Dict[str, Any] = dict(self.counters)
+        stats["queue_depth"] = self.requests.qsize()
+        stats["mean_batch_size"] = round(sum(batch_sizes) / len(batch_sizes), 2) if batch_sizes else 0
+        for name, q in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            stats[name] = round(latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000, 2) if latencies else 0
+        return stats
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self.address):
+            # A socket left behind by a previous server
+            os.remove(self.address)
+        if not settings.EMBEDDING_SERVER_AUTHKEY:
+            _write_authkey(self.address)
+        # Requests are unpickled: only the owner of the server may connect. The socket
+        # is created with the restrictive umask, so there is no window before a chmod
+        umask = os.umask(0o077)
+        try:
+            listener = Listener(self.address, family="AF_UNIX", authkey=_authkey(self.address))
+        finally:
+            os.umask(umask)
+
+        threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True).start()
+        print(f"Embedding server listening on {self.address}")
+        try:
+            while True:
+                try:
+                    connection = listener.accept()
+                except Exception as e:  # failed handshake; keep serving the others
+                    print(f"Rejected embedding client: {e}")
+                    continue
+                threading.Thread(target=self._read_loop, args=(connection,), daemon=True).start()
+        finally:
+            listener.close()
+
+    def _read_loop(self, connection: Connection) -> None:
+        with self._lock:
+            self.counters["connections"] += 1
+        try:
+            while True:
+                message = connection.recv()
+                if message[0] == "embed":
+                    self.requests.put(_Request(connection, message[1]))
+                elif message[0] == "stats":
+                    connection.send(("ok", self.stats()))
+                else:
+                    connection.send(("error", f"Unknown request: {message[0]}"))
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self.counters["connections"] -= 1
+
+    def _next_batch(self) -> List[_Request]:
+        batch = [self.requests.get()]
+        size = len(batch[0].texts)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _batch_loop(self) -> None:
+        while True:
+            batch = self._next_batch()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+                replies = []
+                offset = 0
+                for request in batch:
+                    replies.append(("ok", vectors[offset:offset + len(request.texts)]))
+                    offset += len(request.texts)
+            except Exception as e:
+                replies = [("error", str(e))] * len(batch)
+
+            done = time.perf_counter()
+            for request, reply in zip(batch, replies):
+                try:
+                    request.connection.send(reply)
+                except OSError:
+                    pass  # the client went away
+
+            with self._lock:
+                self.counters["requests"] += len(batch)
+                self.counters["texts"] += len(texts)
+                self.counters["batches"] += 1
+                self.counters["errors"] += sum(1 for reply in replies if reply[0] == "error")
+                self.batch_sizes.append(len(texts))
+                self.latencies.extend(done - request.received for request in batch)
+
+
+class RemoteEmbeddings(Embeddings):
+    """
+    Embeddings computed by the embedding server, with one connection per thread.
+
+    Falls back to a local model if the server can't be reached.
+    """
+
+    def __init__(self, address: str, model_name: str):
+        self.address = address
+        self.model_name = model_name
+        self._local = threading.local()
+        self._fallback: Optional[Embeddings] = None
+
+    def _connection(self) -> Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Read per connection: a restarted server generates a new key
+            connection = Client(self.address, family="AF_UNIX", authkey=_authkey(self.address))
+            self._local.connection = connection
+        return connection
+
+    def _request(self, message: tuple) -> Any:
+        # One reconnect covers a restarted server
+        for attempt in range(2):
+            try:
+                connection = self._connection()
+                connection.send(message)
+                status, result = connection.recv()
+                break
+            except (EOFError, OSError):
+                self._local.connection = None
+                if attempt:
+                    raise
+        if status != "ok":
+            raise RuntimeError(f"Embedding server error: {result}")
+        return result
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        try:
+            return self._request(("embed", list(texts))).tolist()
+        except (EOFError, OSError) as e:
+            if self._fallback is None:
+                print(f"WARNING: embedding server unavailable ({e}); loading the model in this process")
+                from langchain_community.embeddings import HuggingFaceEmbeddings
+
+                self._fallback = HuggingFaceEmbeddings(model_name=self.model_name)
+            return self._fallback.embed_documents(texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return self._request(("stats",))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=settings.EMBEDDING_SERVER_SOCKET or "./embedding_server.sock")
+    parser.add_argument("--stats", action="store_true", help="print the stats of a running server and exit")
+    args = parser.parse_args()
+
+    if args.stats:
+        print(json.dumps(RemoteEmbeddings(args.socket, settings.EMBEDDING_MODEL_NAME).stats(), indent=2))
+        return
+
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    server = EmbeddingServer(
+        args.socket,
+        HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL_NAME),
+        max_batch=settings.EMBEDDING_MAX_BATCH,
+        max_wait_ms=settings.EMBEDDING_MAX_WAIT_MS,
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
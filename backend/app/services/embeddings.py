@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Embeddings with a bounded LRU cache of query vectors.
+
+    Keys are (model, text with whitespace collapsed): the tokenizer ignores
+    whitespace runs, so a cached vector is exactly what the model would return.
+    Document embeddings go straight to the model; they are computed once per chunk.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, max_size: int):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_size = max_size
+        self._cache: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> Tuple[str, str]:
+        return self.model_name, " ".join(text.split())
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return list(vector)
+            self.misses += 1
+
+        # Computed outside the lock; concurrent misses for one text both run the model
+        vector = self.embeddings.embed_query(text)
+        with self._lock:
+            self._cache[key] = list(vector)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return vector
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+@lru_cache(maxsize=None)
+def get_embedding_model(model_name: str = settings.EMBEDDING_MODEL_NAME) -> Embeddings:
+    """
+    Get the embedding model, loading it only once per process.
+
+    With EMBEDDING_SERVER_SOCKET set, embeddings are computed by the shared
+    embedding server instead of a model loaded in this process. Query
+    embeddings are cached either way.
+    """
+    if settings.EMBEDDING_SERVER_SOCKET and model_name == settings.EMBEDDING_MODEL_NAME:
+        from app.services.embedding_server import RemoteEmbeddings
+
+        embeddings: Embeddings = RemoteEmbeddings(settings.EMBEDDING_SERVER_SOCKET, model_name)
+    else:
+        # Use HuggingFace embeddings for technical content
+        embeddings = HuggingFaceEmbeddings(model_name=model_name)
+
+    if settings.QUERY_EMBEDDING_CACHE_SIZE <= 0:
+        return embeddings
+    return CachedQueryEmbeddings(embeddings, model_name, settings.QUERY_EMBEDDING_CACHE_SIZE)
+
+
+def query_embedding_cache_stats() -> Dict[str, Any]:
+    """
+    Hit rate and size of the query embedding cache of the default model
+    """
+    embeddings = get_embedding_model()
+    if isinstance(embeddings, CachedQueryEmbeddings):
+        return embeddings.stats()
+    return {"size": 0, "max_size": 0, "hits": 0, "misses": 0, "hit_rate": 0.0}
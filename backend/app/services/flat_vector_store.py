@@ -0,0 +1,387 @@
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from app.services.quantization import normalize
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, compaction is still crash-safe
+    fcntl = None
+
+VECTORS_FILE = "vectors.f32"
+RECORDS_FILE = "records.jsonl"
+OFFSETS_FILE = "offsets.u64"
+TOMBSTONES_FILE = "tombstones.i64"
+META_FILE = "meta.json"
+LOCK_FILE = "lock"
+# Written once every compacted file is complete: from then on they replace the live ones
+COMPACTED_MARKER = "compacted"
+COMPACTED_SUFFIX = ".compacted"
+
+
+class FlatVectorStore(VectorStore):
+    """
+    Exact-search vector store over a memory-mapped float32 matrix.
+
+    Every collection is a directory of append-only files: normalized vectors
+    (one row per chunk), a JSONL sidecar with the chunk id, text and metadata,
+    the byte offset of every sidecar line, and the rows deleted so far. Opening
+    only maps the files, so the OS page cache is shared by every worker reading
+    the same collection, and records are read from disk only for search hits.
+
+    Searches hold a shared lock on the collection, writes an exclusive one.
+    compact() rewrites the files under temporary names and swaps them in only
+    when it gets the exclusive lock without waiting, i.e. while nobody reads.
+    """
+
+    def __init__(self, persist_directory: str, embedding_function: Embeddings):
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.dim: Optional[int] = None
+        self.vectors: Optional[np.ndarray] = None
+        self.offsets: Optional[np.ndarray] = None
+        self.tombstones: Set[int] = set()
+        # Bumped by every compaction, so readers know to re-map the swapped files
+        self.generation: Optional[int] = None
+
+        if os.path.exists(self._path(META_FILE)):
+            with self._lock(exclusive=False):
+                pass
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_directory, name)
+
+    def _read_meta(self) -> Dict[str, Any]:
+        with open(self._path(META_FILE)) as f:
+            return json.load(f)
+
+    @contextmanager
+    def _lock(self, exclusive: bool, blocking: bool = True) -> Iterator[bool]:
+        """
+        Hold the collection lock, re-mapping the files first if a compaction swapped them.
+
+        Yields False, without the lock, when blocking is off and someone else holds it.
+        """
+        if fcntl is None or not os.path.isdir(self.persist_directory):
+            self._sync()
+            yield True
+            return
+        with open(self._path(LOCK_FILE), "a") as f:
+            try:
+                fcntl.flock(f, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            if not exclusive and os.path.exists(self._path(COMPACTED_MARKER)):
+                # A compaction crashed halfway through its swap: finish it before reading
+                fcntl.flock(f, fcntl.LOCK_EX)
+                self._sync()
+                fcntl.flock(f, fcntl.LOCK_SH)
+            self._sync()
+            yield True
+
+    def _sync(self) -> None:
+        if os.path.exists(self._path(COMPACTED_MARKER)):
+            self._finish_compaction()
+        if os.path.exists(self._path(META_FILE)) and self._read_meta().get("generation", 0) != self.generation:
+            self.refresh()
+
+    def __len__(self) -> int:
+        return 0 if self.vectors is None else len(self.vectors) - len(self.tombstones)
+
+    def refresh(self) -> None:
+        """
+        Re-map the collection files to pick up rows appended since opening
+        """
+        meta = self._read_meta()
+        self.dim = meta["dim"]
+        self.generation = meta.get("generation", 0)
+
+        # Vectors are written before their records, so a crash mid-append can leave
+        # extra vector rows; they are not mapped, and the next append truncates them
+        count = os.path.getsize(self._path(OFFSETS_FILE)) // 8
+        self.offsets = np.memmap(self._path(OFFSETS_FILE), dtype=np.uint64, mode="r", shape=(count,)) if count else None
+        self.vectors = (
+            np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode="r", shape=(count, self.dim))
+            if count else np.empty((0, self.dim), dtype=np.float32)
+        )
+
+        self.tombstones = set()
+        if os.path.exists(self._path(TOMBSTONES_FILE)):
+            self.tombstones = set(np.fromfile(self._path(TOMBSTONES_FILE), dtype=np.int64).tolist())
+
+    def _read_records(self, rows: Iterable[int]) -> List[Dict[str, Any]]:
+        records = []
+        with open(self._path(RECORDS_FILE), "rb") as f:
+            for row in rows:
+                f.seek(int(self.offsets[row]))
+                records.append(json.loads(f.readline()))
+        return records
+
+    def _truncate_to_records(self) -> None:
+        """
+        Cut what a crashed append wrote past the last complete offset, so row i stays record i
+        """
+        count = os.path.getsize(self._path(OFFSETS_FILE)) // 8
+        records_end = 0
+        if count:
+            with open(self._path(OFFSETS_FILE), "rb") as f:
+                f.seek((count - 1) * 8)
+                last = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            with open(self._path(RECORDS_FILE), "rb") as f:
+                f.seek(last)
+                records_end = last + len(f.readline())
+
+        for name, size in (
+            (OFFSETS_FILE, count * 8),
+            (VECTORS_FILE, count * self.dim * 4),
+            (RECORDS_FILE, records_end),
+        ):
+            if os.path.exists(self._path(name)) and os.path.getsize(self._path(name)) > size:
+                os.truncate(self._path(name), size)
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """
+        Append precomputed embeddings to the collection
+        """
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = normalize(np.asarray(embeddings, dtype=np.float32))
+
+        os.makedirs(self.persist_directory, exist_ok=True)
+        with self._lock(exclusive=True):
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self._path(META_FILE), "w") as f:
+                    json.dump({"dim": self.dim, "generation": 0}, f)
+                open(self._path(OFFSETS_FILE), "ab").close()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {vectors.shape[1]}")
+            else:
+                self._truncate_to_records()
+
+            with open(self._path(VECTORS_FILE), "ab") as f:
+                f.write(vectors.tobytes())
+
+            offsets = []
+            with open(self._path(RECORDS_FILE), "ab") as f:
+                for id_, text, metadata in zip(ids, texts, metadatas):
+                    offsets.append(f.tell())
+                    f.write((json.dumps({"id": id_, "text": text, "metadata": metadata}) + "\n").encode("utf-8"))
+
+            with open(self._path(OFFSETS_FILE), "ab") as f:
+                f.write(np.asarray(offsets, dtype=np.uint64).tobytes())
+
+            self.refresh()
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas, ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """
+        Tombstone the rows with the given ids; space is reclaimed by compact()
+        """
+        if not ids or self.vectors is None:
+            return False
+        wanted = set(ids)
+        with self._lock(exclusive=True):
+            # Rows appended by another instance since opening are deletable too
+            self.refresh()
+            rows = [
+                row for row, record in enumerate(self._read_records(range(len(self.vectors))))
+                if record["id"] in wanted and row not in self.tombstones
+            ]
+            if rows:
+                with open(self._path(TOMBSTONES_FILE), "ab") as f:
+                    f.write(np.asarray(rows, dtype=np.int64).tobytes())
+                self.tombstones.update(rows)
+        return bool(rows)
+
+    def compact(self) -> int:
+        """
+        Rewrite the collection without tombstoned rows; returns the rows dropped.
+
+        Skipped (returning 0) while the collection is being read or written. The
+        compacted files are written next to the live ones and swapped in only once
+        all of them are complete, so a crash leaves either collection whole.
+        """
+        with self._lock(exclusive=True, blocking=False) as locked:
+            if not locked or not self.tombstones or self.vectors is None:
+                return 0
+            live = [row for row in range(len(self.vectors)) if row not in self.tombstones]
+
+            offsets = []
+            with open(self._path(RECORDS_FILE), "rb") as src, open(self._path(RECORDS_FILE + COMPACTED_SUFFIX), "wb") as dst:
+                for row in live:
+                    src.seek(int(self.offsets[row]))
+                    offsets.append(dst.tell())
+                    dst.write(src.readline())
+                dst.flush()
+                os.fsync(dst.fileno())
+            for name, data in (
+                (VECTORS_FILE, np.asarray(self.vectors[live]).tobytes()),
+                (OFFSETS_FILE, np.asarray(offsets, dtype=np.uint64).tobytes()),
+                (META_FILE, json.dumps({"dim": self.dim, "generation": self.generation + 1}).encode()),
+            ):
+                with open(self._path(name + COMPACTED_SUFFIX), "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+            open(self._path(COMPACTED_MARKER), "w").close()
+
+            dropped = len(self.vectors) - len(live)
+            self._finish_compaction()
+            self.refresh()
+        return dropped
+
+    def _finish_compaction(self) -> None:
+        # Idempotent, so a crash in the middle is finished by whoever opens the collection next;
+        # META_FILE goes last, so its new generation only shows once every file is swapped
+        for name in (VECTORS_FILE, RECORDS_FILE, OFFSETS_FILE, META_FILE):
+            if os.path.exists(self._path(name + COMPACTED_SUFFIX)):
+                os.replace(self._path(name + COMPACTED_SUFFIX), self._path(name))
+        if os.path.exists(self._path(TOMBSTONES_FILE)):
+            os.remove(self._path(TOMBSTONES_FILE))
+        os.remove(self._path(COMPACTED_MARKER))
+
+    def _matches(self, metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+        return not filter or all(metadata.get(key) == value for key, value in filter.items())
+
+    def _search(
+        self, embedding: List[float], k: int, filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[int, float, Dict[str, Any]]]:
+        """
+        Exact k-NN by dot product over the live rows, as (row, score, record)
+        """
+        if self.vectors is None or not len(self):
+            return []
+        query = normalize(np.asarray(embedding, dtype=np.float32))
+        scores = self.vectors @ query
+        if self.tombstones:
+            scores[list(self.tombstones)] = -np.inf
+
+        if filter:
+            # Walk the ranking until enough records satisfy the metadata filter
+            order = np.argsort(-scores)
+        else:
+            k = min(k, len(self))
+            order = np.argpartition(-scores, k - 1)[:k]
+            order = order[np.argsort(-scores[order])]
+
+        results = []
+        for start in range(0, len(order), max(k, 64)):
+            rows = [row for row in order[start:start + max(k, 64)] if np.isfinite(scores[row])]
+            for row, record in zip(rows, self._read_records(rows)):
+                if self._matches(record["metadata"], filter):
+                    results.append((int(row), float(scores[row]), record))
+                    if len(results) == k:
+                        return results
+        return results
+
+    def _to_document(self, record: Dict[str, Any]) -> Document:
+        return Document(page_content=record["text"], metadata=record["metadata"])
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = self.embedding_function.embed_query(query)
+        with self._lock(exclusive=False):
+            results = self._search(embedding, k, filter)
+        return [(self._to_document(record), score) for _, score, record in results]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        with self._lock(exclusive=False):
+            results = self._search(embedding, k, filter)
+        return [self._to_document(record) for _, _, record in results]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k, filter)
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        with self._lock(exclusive=False):
+            candidates = self._search(embedding, fetch_k, filter)
+            if not candidates:
+                return []
+            candidate_vectors = np.asarray(self.vectors[[row for row, _, _ in candidates]])
+        selected = maximal_marginal_relevance(
+            normalize(np.asarray(embedding, dtype=np.float32)),
+            candidate_vectors,
+            lambda_mult=lambda_mult,
+            k=k,
+        )
+        return [self._to_document(candidates[i][2]) for i in selected]
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self.embedding_function.embed_query(query), k, fetch_k, lambda_mult, filter
+        )
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        persist_directory: Optional[str] = None,
+        **kwargs: Any,
+    ) -> "FlatVectorStore":
+        if persist_directory is None:
+            raise ValueError("FlatVectorStore requires a persist_directory")
+        store = cls(persist_directory, embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=kwargs.get("ids"))
+        return store
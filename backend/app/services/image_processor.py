@@ -0,0 +1,236 @@
+import hashlib
+import io
+import json
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Set
+
+from langchain_core.documents import Document
+from PIL import Image
+
+from app.core.config import settings
+
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".gif"]
+
+# Where embedded media live inside Office Open XML packages
+_MEDIA_PREFIXES = {".docx": "word/media/", ".pptx": "ppt/media/"}
+
+
+def extract_images(file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily extract the raw images embedded in a PDF, DOCX or PPTX file, or the image file itself
+    """
+    file_extension = Path(file_path).suffix.lower()
+
+    if file_extension in IMAGE_EXTENSIONS:
+        with open(file_path, "rb") as f:
+            yield {"data": f.read(), "name": Path(file_path).name, "page": None, "embedded": False}
+    elif file_extension == ".pdf":
+        from pypdf import PdfReader
+
+        for page_num, page in enumerate(PdfReader(file_path).pages):
+            try:
+                page_images = list(page.images)
+            except Exception:  # unsupported filters/colour spaces; the page text still loads
+                continue
+            for image in page_images:
+                yield {"data": image.data, "name": image.name, "page": page_num, "embedded": True}
+    elif file_extension in _MEDIA_PREFIXES:
+        with zipfile.ZipFile(file_path) as package:
+            for name in sorted(package.namelist()):
+                if name.startswith(_MEDIA_PREFIXES[file_extension]):
+                    yield {"data": package.read(name), "name": Path(name).name, "page": None, "embedded": True}
+
+
+def check_image_file(file_path: str) -> None:
+    """
+    Raise ValueError unless the image file can be decoded
+    """
+    try:
+        with Image.open(file_path) as opened:
+            opened.verify()
+    except Exception as e:
+        raise ValueError(f"{Path(file_path).name} is not a readable image: {e}")
+
+
+def average_hash(image: Image.Image) -> int:
+    """
+    64-bit perceptual hash: which pixels of an 8x8 grayscale thumbnail are above the mean
+    """
+    pixels = list(image.convert("L").resize((8, 8), Image.LANCZOS).getdata())
+    mean = sum(pixels) / len(pixels)
+    return sum(1 << i for i, pixel in enumerate(pixels) if pixel > mean)
+
+
+@lru_cache(maxsize=None)
+def _get_captioner():
+    from transformers import pipeline
+
+    return pipeline("image-to-text", model=settings.IMAGE_CAPTION_MODEL)
+
+
+def analyze_image_file(image_path: str) -> Dict[str, Any]:
+    """
+    Analyze an image on disk, reusing the cached result when it was seen before
+    """
+    with open(image_path, "rb") as f:
+        return analyze_image(f.read())
+
+
+def analyze_image(data: bytes, content_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    OCR (and optionally caption) an image, caching the result and a thumbnail by content hash
+    """
+    content_hash = content_hash or hashlib.sha256(data).hexdigest()
+    os.makedirs(settings.IMAGE_CACHE_PATH, exist_ok=True)
+    cache_path = os.path.join(settings.IMAGE_CACHE_PATH, f"{content_hash}.json")
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            return json.load(f)
+
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    image_format = (image.format or "png").lower()
+
+    # Keep the original so DocumentImage.image_path points at a real file
+    image_path = os.path.join(settings.IMAGE_CACHE_PATH, f"{content_hash}.{image_format}")
+    with open(image_path, "wb") as f:
+        f.write(data)
+
+    rgb = image.convert("RGB")
+    thumbnail = rgb.copy()
+    thumbnail.thumbnail((settings.IMAGE_THUMBNAIL_SIZE, settings.IMAGE_THUMBNAIL_SIZE))
+    thumbnail_path = os.path.join(settings.IMAGE_CACHE_PATH, f"{content_hash}.thumb.png")
+    thumbnail.save(thumbnail_path)
+
+    import pytesseract
+
+    cacheable = True
+    try:
+        ocr_text = " ".join(pytesseract.image_to_string(rgb).split())
+    except pytesseract.TesseractError:
+        ocr_text = ""
+    except pytesseract.TesseractNotFoundError:
+        # Don't cache: the image is analyzed again once tesseract is installed
+        ocr_text = ""
+        cacheable = False
+
+    caption = None
+    if settings.IMAGE_CAPTION_MODEL:
+        caption = _get_captioner()(rgb)[0]["generated_text"].strip()
+
+    result = {
+        "hash": content_hash,
+        "image_path": image_path,
+        "thumbnail_path": thumbnail_path,
+        "image_type": image_format,
+        "width": image.width,
+        "height": image.height,
+        "ocr_text": ocr_text,
+        "caption": caption,
+    }
+    if cacheable:
+        with open(cache_path, "w") as f:
+            json.dump(result, f)
+    return result
+
+
+def deduplicate_images(images: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Collapse identical and perceptually near-identical images, keeping every page they appear on.
+
+    Unique images are yielded as they are found; the pages of a yielded image keep
+    growing while later duplicates are consumed.
+    """
+    unique: List[Dict[str, Any]] = []
+    by_hash: Dict[str, Dict[str, Any]] = {}
+
+    for image in images:
+        content_hash = hashlib.sha256(image["data"]).hexdigest()
+        if content_hash in by_hash:
+            by_hash[content_hash]["pages"].append(image["page"])
+            continue
+
+        try:
+            with Image.open(io.BytesIO(image["data"])) as opened:
+                if image["embedded"] and min(opened.size) < settings.IMAGE_MIN_SIDE:
+                    # Bullets, icons and spacers carry no content worth indexing
+                    continue
+                perceptual_hash = average_hash(opened)
+        except Exception as e:  # not a format PIL can decode (e.g. EMF, JBIG2)
+            if not image["embedded"]:
+                # An uploaded image is the whole document: fail instead of indexing nothing
+                raise ValueError(f"{image['name']} is not a readable image: {e}")
+            continue
+
+        duplicate = next(
+            (
+                kept for kept in unique
+                if bin(kept["perceptual_hash"] ^ perceptual_hash).count("1") <= settings.IMAGE_HASH_DISTANCE
+            ),
+            None,
+        )
+        if duplicate is not None:
+            duplicate["pages"].append(image["page"])
+            by_hash[content_hash] = duplicate
+            continue
+
+        kept = {**image, "hash": content_hash, "perceptual_hash": perceptual_hash, "pages": [image["page"]]}
+        unique.append(kept)
+        by_hash[content_hash] = kept
+        yield kept
+
+
+def process_images(file_path: str, skip_pages: Optional[Set[int]] = None) -> List[Document]:
+    """
+    Turn the images of a file into retrievable documents of their caption and OCR text.
+
+    Images are analyzed while they are extracted, with at most two per worker in
+    flight; only their analysis is kept, so memory doesn't grow with the page count.
+    Images on skip_pages (e.g. scans of pages OCR'd whole) are left out.
+    """
+    analyzed = []
+    with ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS) as pool:
+        pending: Deque[Future] = deque()
+        images = extract_images(file_path)
+        if skip_pages:
+            images = (image for image in images if image["page"] not in skip_pages)
+        for image in deduplicate_images(images):
+            pending.append(pool.submit(analyze_image, image.pop("data"), image["hash"]))
+            analyzed.append((image, pending[-1]))
+            if len(pending) >= 2 * settings.IMAGE_WORKERS:
+                pending.popleft().result()
+
+    documents = []
+    for image, future in analyzed:
+        analysis = future.result()
+        if not analysis["ocr_text"] and not analysis["caption"] and image["embedded"]:
+            # Embedded images without text or caption add nothing retrievable
+            continue
+
+        pages = sorted({page for page in image["pages"] if page is not None})
+        parts = [f"Image {image['name']}" + (f" (page {pages[0] + 1})" if pages else "")]
+        if analysis["caption"]:
+            parts.append(f"Caption: {analysis['caption']}")
+        if analysis["ocr_text"]:
+            parts.append(f"Text in image: {analysis['ocr_text']}")
+
+        metadata = {
+            "source": file_path,
+            "category": "Image",
+            "image_hash": analysis["hash"],
+            "image_path": analysis["image_path"],
+            "image_type": analysis["image_type"],
+            "pages": ",".join(str(page) for page in pages),
+        }
+        if pages:
+            metadata["page"] = pages[0]
+        if analysis["caption"]:
+            metadata["caption"] = analysis["caption"]
+        documents.append(Document(page_content="\n".join(parts), metadata=metadata))
+
+    return documents
@@ -0,0 +1,371 @@
+import gc
+import os
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from langchain_core.documents import Document as LangChainDocument
+from langchain_core.vectorstores import VectorStore
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.document import Document, DocumentImage, DocumentSection, IngestionJob
+from app.services.dedup import NearDuplicateDetector
+from app.services.document_processor import extract_document_structure, iter_document, iter_split_documents
+from app.services.search_index import index_sections, remove_document_from_index, remove_sections_from_index
+from app.services.tracing import span
+from app.services.vector_store import create_vector_store, get_vector_store_path, persist_vector_store
+
+
+class DocumentDeleted(Exception):
+    """
+    Raised when the document being ingested was deleted meanwhile
+    """
+
+
+def _check_not_deleted(db: Session, document_id: int) -> None:
+    # The purge waits for running jobs to stop, so nothing is written after a delete is seen
+    if db.query(Document.deleted_at).filter(Document.id == document_id).scalar() is not None:
+        raise DocumentDeleted(f"Document {document_id} was deleted during ingestion")
+
+
+def current_rss_mb() -> float:
+    """
+    Resident memory of this process, or its peak where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def _next_batch_size(batch_size: int, baseline_mb: float) -> int:
+    """
+    Adapt the batch size to the memory the ingestion added over baseline_mb, the RSS it started at.
+
+    Batches halve while the growth is above INGEST_MEMORY_LIMIT_MB and double back
+    towards INGEST_BATCH_SIZE once it is below half of it. The ingestion fails,
+    instead of letting the worker be OOM-killed, only when even one chunk per
+    batch keeps the growth above the limit.
+    """
+    limit = settings.INGEST_MEMORY_LIMIT_MB
+    if not limit:
+        return batch_size
+    growth = current_rss_mb() - baseline_mb
+    if growth < limit / 2:
+        return min(settings.INGEST_BATCH_SIZE, batch_size * 2)
+    if growth <= limit:
+        return batch_size
+
+    gc.collect()
+    growth = current_rss_mb() - baseline_mb
+    if growth <= limit:
+        return batch_size
+    if batch_size == 1:
+        raise MemoryError(f"Ingestion grew memory by {growth:.0f} MB, above the {limit} MB limit")
+    return max(1, batch_size // 2)
+
+
+def vector_id(document_id: int, position: int) -> str:
+    """
+    Deterministic id of a chunk's vector, so what an interrupted run wrote past its checkpoint can be found.
+
+    The vector stores append rather than upsert: adding an id again duplicates
+    its row, so _discard_from must delete these ids before a batch is re-run.
+    """
+    return f"doc{document_id}-{position}"
+
+
+def _index_batch(db: Session, db_document: Document, chunks: List[LangChainDocument], vectorstore: VectorStore) -> None:
+    # Extract document structure
+    sections = extract_document_structure(chunks)
+
+    # Create document sections
+    db_sections = []
+    for section_data in sections:
+        db_section = DocumentSection(
+            section_type=section_data["section_type"],
+            content=section_data["content"],
+            page_num=section_data["page_num"],
+            position=section_data["position"],
+            meta_data=section_data["meta_data"],  # Changed from metadata to meta_data
+            # Near-duplicates share the vector of their representative
+            vector_id=vector_id(db_document.id, section_data["meta_data"].get("duplicate_of", section_data["position"])),
+            document_id=db_document.id,
+        )
+        db.add(db_section)
+        db_sections.append(db_section)
+
+    # One flush assigns every section id without a round trip per row
+    db.flush()
+
+    for section_data, db_section in zip(sections, db_sections):
+        # If this is an image section, create image record
+        if section_data["section_type"] == "image" and "source" in section_data["meta_data"]:  # Changed from metadata to meta_data
+            image_meta = section_data["meta_data"]
+            db_image = DocumentImage(
+                image_path=image_meta.get("image_path", image_meta["source"]),
+                image_type=image_meta.get("image_type", "unknown"),  # Changed from metadata to meta_data
+                caption=image_meta.get("caption"),
+                meta_data={
+                    "image_hash": image_meta.get("image_hash"),
+                    "pages": image_meta.get("pages"),
+                    "ocr_text": section_data["content"],
+                },
+                section_id=db_section.id,
+            )
+            db.add(db_image)
+
+    # Make the section content searchable without going through the LLM
+    index_sections(db, db_sections)
+
+    db.commit()
+
+    # Link every chunk to its section so citations point at the right one
+    for chunk, db_section in zip(chunks, db_sections):
+        chunk.metadata["section_id"] = db_section.id
+
+    # Create embeddings, one per representative
+    unique = [(chunk, db_section) for chunk, db_section in zip(chunks, db_sections) if "duplicate_of" not in chunk.metadata]
+    if unique:
+        with span("ingest.vectors", vectors=len(unique)):
+            vectorstore.add_documents(
+                [chunk for chunk, _ in unique], ids=[db_section.vector_id for _, db_section in unique]
+            )
+
+
+def _discard_from(db: Session, document_id: int, position: int, vectorstore: VectorStore) -> None:
+    """
+    Remove what an interrupted run wrote past its last checkpoint
+    """
+    section_ids = [
+        section_id for (section_id,) in db.query(DocumentSection.id).filter(
+            DocumentSection.document_id == document_id, DocumentSection.position >= position
+        )
+    ]
+    if section_ids:
+        db.query(DocumentImage).filter(DocumentImage.section_id.in_(section_ids)).delete(synchronize_session=False)
+        db.query(DocumentSection).filter(DocumentSection.id.in_(section_ids)).delete(synchronize_session=False)
+        remove_sections_from_index(db, section_ids)
+        db.commit()
+
+    # Vectors are written before the checkpoint advances, so at most one batch is past it
+    vectorstore.delete(ids=[vector_id(document_id, p) for p in range(position, position + settings.INGEST_BATCH_SIZE)])
+
+
+@contextmanager
+def _heartbeat(job: IngestionJob) -> Iterator[None]:
+    """
+    Keep a running job's updated_at fresh from a background thread.
+
+    Checkpoints only happen between batches; parsing a large file or embedding
+    a slow first batch can take longer than INGEST_JOB_STALE_SECONDS, and the
+    resumer must not mistake such a live job for a crashed one.
+    """
+    job_id, attempts = job.id, job.attempts
+    stop = threading.Event()
+
+    def beat() -> None:
+        while not stop.wait(settings.INGEST_JOB_STALE_SECONDS / 4):
+            db = SessionLocal()
+            try:
+                # Only while this run still owns the job
+                db.query(IngestionJob).filter(
+                    IngestionJob.id == job_id, IngestionJob.attempts == attempts, IngestionJob.status == "running"
+                ).update({IngestionJob.updated_at: func.now()}, synchronize_session=False)
+                db.commit()
+            except Exception as e:
+                print(f"Ingestion job {job_id} heartbeat failed: {e}")
+            finally:
+                db.close()
+
+    thread = threading.Thread(target=beat, name=f"ingestion-heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def index_document(
+    db: Session,
+    db_document: Document,
+    documents: Iterable[LangChainDocument],
+    job: Optional[IngestionJob] = None,
+    meta_data: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    Chunk parsed documents, store their sections and images, and embed them.
+
+    Runs as a pipeline over batches of INGEST_BATCH_SIZE chunks, so only the
+    current batch (and the page being split) is held in memory; documents may
+    be a lazy iterator. With a job, progress is checkpointed after every batch
+    and a job that already has a checkpoint resumes after it; its heartbeat
+    keeps beating in between. Raises DocumentDeleted, before writing the next
+    batch, once the document has been deleted. Near-duplicate
+    chunks get a section but no vector of their own; with meta_data, how many
+    were collapsed is recorded under "deduplication". Returns the number of
+    chunks indexed.
+    """
+    if job is None:
+        return _index_document(db, db_document, documents, None, meta_data)
+    with _heartbeat(job):
+        return _index_document(db, db_document, documents, job, meta_data)
+
+
+def _index_document(
+    db: Session,
+    db_document: Document,
+    documents: Iterable[LangChainDocument],
+    job: Optional[IngestionJob],
+    meta_data: Optional[Dict[str, Any]],
+) -> int:
+    count = (job.chunks_indexed or 0) if job is not None else 0
+    # Parsing is lazy, so this span covers parse, split, embed and persist
+    with span("ingest", document_id=db_document.id, resumed_from=count) as ingest_span:
+        vectorstore = create_vector_store(str(db_document.id))
+        if job is not None:
+            _discard_from(db, db_document.id, count, vectorstore)
+
+        batch_size = settings.INGEST_BATCH_SIZE
+        # Other requests and caches share the process: only what this ingestion adds counts
+        baseline_mb = current_rss_mb()
+        batch: List[LangChainDocument] = []
+
+        def flush() -> None:
+            nonlocal count, batch
+            _check_not_deleted(db, db_document.id)
+            with span("ingest.batch", start_position=count, chunks=len(batch)):
+                _index_batch(db, db_document, batch, vectorstore)
+            count += len(batch)
+            batch = []
+            if job is not None:
+                job.chunks_indexed = count
+                db.commit()
+
+        detector = NearDuplicateDetector(settings.DEDUP_SIMILARITY) if settings.DEDUP_ENABLED else None
+        for chunk in iter_split_documents(documents):
+            if detector is not None:
+                detector.check(chunk)
+            # Chunking is deterministic, so the chunks before the checkpoint are skipped, not re-embedded;
+            # they still go through the detector, so later duplicates resolve to the same representatives
+            if chunk.metadata["position"] < count:
+                continue
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                flush()
+                batch_size = _next_batch_size(batch_size, baseline_mb)
+
+        if batch:
+            flush()
+
+        _check_not_deleted(db, db_document.id)
+        with span("ingest.persist"):
+            persist_vector_store(vectorstore)
+        ingest_span.set(chunks=count)
+        if detector is not None and meta_data is not None:
+            meta_data["deduplication"] = detector.stats()
+    return count
+
+
+def clear_document_index(db: Session, document_id: int) -> None:
+    """
+    Remove the sections, images, search entries and vectors of a document, keeping the document
+    """
+    section_ids = db.query(DocumentSection.id).filter(DocumentSection.document_id == document_id)
+    db.query(DocumentImage).filter(DocumentImage.section_id.in_(section_ids)).delete(synchronize_session=False)
+    db.query(DocumentSection).filter(DocumentSection.document_id == document_id).delete(synchronize_session=False)
+    remove_document_from_index(db, document_id)
+    db.commit()
+
+    vector_store_path = get_vector_store_path(str(document_id))
+    if os.path.exists(vector_store_path):
+        shutil.rmtree(vector_store_path)
+
+
+def resume_ingestion_job(db: Session, job: IngestionJob) -> None:
+    """
+    Finish an interrupted ingestion job from its last checkpoint
+    """
+    document = job.document
+    meta_data = {}
+    try:
+        index_document(db, document, iter_document(document.file_path, meta_data), job, meta_data)
+    except Exception as e:
+        db.rollback()
+        job.status = "cancelled" if isinstance(e, DocumentDeleted) else "failed"
+        job.error = str(e)
+        db.commit()
+        raise
+
+    document.meta_data = meta_data
+    job.status = "completed"
+    db.commit()
+
+
+def resume_ingestion_jobs() -> int:
+    """
+    Resume every running job whose worker stopped checkpointing; returns how many were resumed
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=settings.INGEST_JOB_STALE_SECONDS)
+    resumed = 0
+    db = SessionLocal()
+    try:
+        stale = db.query(IngestionJob).join(Document).filter(
+            IngestionJob.status == "running",
+            IngestionJob.updated_at < stale_before,
+            Document.deleted_at.is_(None),
+        )
+        for job in stale.all():
+            if job.attempts >= settings.INGEST_JOB_MAX_ATTEMPTS:
+                job.status = "failed"
+                job.error = job.error or f"Interrupted {job.attempts} times"
+                db.commit()
+                continue
+
+            # Claim the job: only one worker's update matches the attempt count it saw
+            claimed = db.query(IngestionJob).filter(
+                IngestionJob.id == job.id, IngestionJob.attempts == job.attempts
+            ).update({IngestionJob.attempts: job.attempts + 1, IngestionJob.updated_at: func.now()}, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                continue
+
+            db.refresh(job)
+            try:
+                resume_ingestion_job(db, job)
+                resumed += 1
+            except Exception as e:
+                print(f"Ingestion job {job.id} failed to resume: {e}")
+    finally:
+        db.close()
+    return resumed
+
+
+def _resume_loop() -> None:
+    while True:
+        try:
+            resume_ingestion_jobs()
+        except Exception as e:
+            print(f"Resuming ingestion jobs failed: {e}")
+        time.sleep(settings.INGEST_JOB_STALE_SECONDS / 2)
+
+
+def start_resuming_ingestion_jobs() -> threading.Thread:
+    """
+    Periodically resume interrupted ingestion jobs in the background
+    """
+    thread = threading.Thread(target=_resume_loop, name="ingestion-resume", daemon=True)
+    thread.start()
+    return thread
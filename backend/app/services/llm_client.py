@@ -0,0 +1,271 @@
+import json
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from app.core.config import settings
+
+LLM_BACKENDS = ("openai", "fake")
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: `rate` requests per second with bursts up to `capacity`
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take one token, sleeping until one is available; returns the time waited
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class LLMStats:
+    """
+    Process-wide counters for every LLM HTTP call
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.latency_ms = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, call: Dict[str, Any]) -> None:
+        with self.lock:
+            self.calls += 1
+            self.errors += call["status_code"] >= 400
+            self.retries += call["retries"]
+            self.latency_ms += call["latency_ms"]
+            self.prompt_tokens += call["prompt_tokens"]
+            self.completion_tokens += call["completion_tokens"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "retries": self.retries,
+                "avg_latency_ms": round(self.latency_ms / self.calls, 1) if self.calls else 0.0,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
+
+
+stats = LLMStats()
+_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+
+def add_call_listener(listener: Callable[[Dict[str, Any]], None]) -> None:
+    """
+    Register a callback receiving the accounting record of every LLM call
+    """
+    _listeners.append(listener)
+
+
+def _usage(response: httpx.Response) -> Dict[str, int]:
+    if "json" not in response.headers.get("content-type", ""):
+        return {}
+    try:
+        return json.loads(response.read()).get("usage") or {}
+    except ValueError:
+        return {}
+
+
+def _request_model(request: httpx.Request) -> Optional[str]:
+    try:
+        return json.loads(request.content or b"{}").get("model")
+    except (httpx.RequestNotRead, ValueError):
+        return None
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    # Full jitter: spread retries of concurrent callers over the backoff window
+    return random.uniform(0, settings.LLM_BACKOFF_BASE_SECONDS * 2 ** attempt)
+
+
+class ThrottledTransport(httpx.BaseTransport):
+    """
+    httpx transport shared by all LLM clients.
+
+    Caps concurrent calls with a semaphore, paces them with a token bucket,
+    retries 429/5xx responses with jittered exponential backoff and records
+    latency and token usage for every call.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, max_concurrency: int, requests_per_minute: float):
+        self.transport = transport
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.bucket = TokenBucket(requests_per_minute / 60.0, max(1.0, min(max_concurrency, requests_per_minute)))
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        retries = 0
+        with self.semaphore:
+            while True:
+                self.bucket.acquire()
+                try:
+                    response = self.transport.handle_request(request)
+                except httpx.TransportError:
+                    if retries >= settings.LLM_MAX_RETRIES:
+                        raise
+                    time.sleep(random.uniform(0, settings.LLM_BACKOFF_BASE_SECONDS * 2 ** retries))
+                    retries += 1
+                    continue
+
+                if response.status_code in RETRY_STATUS_CODES and retries < settings.LLM_MAX_RETRIES:
+                    delay = _retry_delay(response, retries)
+                    response.close()
+                    time.sleep(delay)
+                    retries += 1
+                    continue
+                break
+
+        usage = _usage(response)
+        call = {
+            "url": str(request.url),
+            "status_code": response.status_code,
+            "retries": retries,
+            "latency_ms": (time.perf_counter() - started) * 1000,
+            "model": _request_model(request),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+        }
+        stats.record(call)
+        for listener in _listeners:
+            listener(call)
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class FakeLLMTransport(httpx.BaseTransport):
+    """
+    Offline stand-in for the OpenAI chat completions API.
+
+    Answers every request with a canned completion echoing the last message,
+    optionally failing the first `fail_first` calls with `fail_status`.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, fail_first: int = 0, fail_status: int = 429):
+        self.latency_seconds = latency_seconds
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.requests: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content or b"{}")
+        with self.lock:
+            self.requests.append(body)
+            failing = len(self.requests) <= self.fail_first
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if failing:
+            return httpx.Response(self.fail_status, json={"error": {"message": "fake failure"}}, request=request)
+
+        messages = body.get("messages") or [{"content": ""}]
+        prompt = " ".join(str(message.get("content", "")) for message in messages)
+        answer = f"Fake response to: {str(messages[-1].get('content', ''))[-200:]}"
+        return httpx.Response(
+            200,
+            json={
+                "id": f"fake-{len(self.requests)}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}
+                ],
+                "usage": {
+                    "prompt_tokens": len(prompt.split()),
+                    "completion_tokens": len(answer.split()),
+                    "total_tokens": len(prompt.split()) + len(answer.split()),
+                },
+            },
+            request=request,
+        )
+
+
+def _get_backend() -> str:
+    backend = settings.LLM_BACKEND
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Unsupported LLM backend: {backend}")
+    return backend
+
+
+def is_llm_available() -> bool:
+    """
+    Whether LLM calls can be made: a real API key or the fake backend
+    """
+    return bool(settings.OPENAI_API_KEY) or _get_backend() == "fake"
+
+
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    """
+    The keep-alive HTTP client every LLM call in this process goes through
+    """
+    if _get_backend() == "fake":
+        inner: httpx.BaseTransport = FakeLLMTransport()
+    else:
+        inner = httpx.HTTPTransport(
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONCURRENCY,
+                max_keepalive_connections=settings.LLM_MAX_CONCURRENCY,
+            ),
+        )
+
+    return httpx.Client(
+        transport=ThrottledTransport(inner, settings.LLM_MAX_CONCURRENCY, settings.LLM_REQUESTS_PER_MINUTE),
+        timeout=settings.LLM_TIMEOUT_SECONDS,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(temperature: float = 0, model_name: Optional[str] = None) -> ChatOpenAI:
+    """
+    Get a shared chat model; retries are handled by the transport, not the SDK
+    """
+    return ChatOpenAI(
+        temperature=temperature,
+        model_name=model_name or settings.LLM_MODEL_NAME,
+        openai_api_key=settings.OPENAI_API_KEY or "fake",
+        http_client=get_http_client(),
+        max_retries=0,
+    )
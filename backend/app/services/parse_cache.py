@@ -0,0 +1,91 @@
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from langchain_core.documents import Document
+
+from app.core.config import settings
+
+# Bump when a loader, its post-processing or the cache format changes
+PARSER_VERSION = 5
+
+
+def file_sha256(file_path: str) -> str:
+    """
+    Content hash of a file, read in 1 MB blocks
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_cache_path(file_hash: str, file_extension: str) -> str:
+    """
+    Cache entry of a parsed file; the extension selects the loader, so it is part of the key
+    """
+    return os.path.join(
+        settings.PARSE_CACHE_PATH,
+        f"{file_hash}{file_extension.replace('.', '_')}.v{PARSER_VERSION}.jsonl.gz",
+    )
+
+
+def iter_cached(file_path: str, meta_data: Dict[str, Any], file_hash: Optional[str] = None) -> Optional[Iterator[Document]]:
+    """
+    Stream the cached documents of a file, or return None on a miss.
+
+    meta_data is filled in once the iterator is exhausted.
+    """
+    file_hash = file_hash or file_sha256(file_path)
+    cache_path = get_cache_path(file_hash, Path(file_path).suffix.lower())
+    if not os.path.exists(cache_path):
+        return None
+
+    def documents() -> Iterator[Document]:
+        with gzip.open(cache_path, "rt", encoding="utf-8") as f:
+            f.readline()
+            for record in map(json.loads, f):
+                if "meta_data" in record:
+                    # The cached metadata describes the file, not where this copy of it lives
+                    meta_data.update(record["meta_data"], file_name=Path(file_path).name)
+                    return
+                if "source" in record["metadata"]:
+                    record["metadata"]["source"] = file_path
+                yield Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    return documents()
+
+
+def cache_parsed(
+    file_path: str,
+    documents: Iterable[Document],
+    meta_data: Dict[str, Any],
+    file_hash: Optional[str] = None,
+) -> Iterator[Document]:
+    """
+    Pass parsed documents through while persisting them: a header line, one line per
+    page/element, then a trailer with meta_data, which is complete only at the end.
+
+    The entry is published only if the documents are consumed to the end.
+    """
+    file_hash = file_hash or file_sha256(file_path)
+    os.makedirs(settings.PARSE_CACHE_PATH, exist_ok=True)
+    cache_path = get_cache_path(file_hash, Path(file_path).suffix.lower())
+
+    # Write under a temporary name so readers never see a partial entry
+    tmp_path = f"{cache_path}.{os.getpid()}.{id(documents)}.tmp"
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"version": PARSER_VERSION, "file_hash": file_hash}) + "\n")
+            for doc in documents:
+                f.write(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}, default=str) + "\n")
+                yield doc
+            f.write(json.dumps({"meta_data": meta_data}, default=str) + "\n")
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,178 @@
+"""
+OCR of the PDF pages that have no text layer.
+
+Scanned pages come out of PyPDFLoader empty. Only those pages are rasterized
+(pdf2image, one page per call, at OCR_DPI) and OCR'd (pytesseract) in a
+process pool; the other pages pass through untouched, in order. Each worker
+rasterizes its own page, so no image crosses process boundaries and, with a
+bounded number of pages in flight, memory doesn't grow with the page count.
+Page text is cached by (file hash, page, DPI, language), so re-ingesting a
+file never OCRs it again; pages that failed are not cached.
+"""
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Any, Deque, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from langchain_core.documents import Document
+
+from app.core.config import settings
+
+
+def ocr_workers() -> int:
+    return settings.OCR_WORKERS or os.cpu_count() or 1
+
+
+def _init_worker() -> None:
+    # One tesseract thread per process: parallelism comes from the pool, not OpenMP
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """
+    The process pool shared by every OCR'd document, started on first use.
+
+    Spawned rather than forked: the API process runs threads, which fork doesn't carry over safely.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=ocr_workers(), mp_context=get_context("spawn"), initializer=_init_worker)
+        return _pool
+
+
+def _replace_pool(broken: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        # Another page may have replaced it already
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False)
+
+
+def _submit(file_path: str, page: int, dpi: int, language: str) -> Future:
+    pool = _get_pool()
+    try:
+        return pool.submit(ocr_page, file_path, page, dpi, language)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory) and took the pool down: start a new one
+        _replace_pool(pool)
+        return _get_pool().submit(ocr_page, file_path, page, dpi, language)
+
+
+def ocr_page(file_path: str, page: int, dpi: int, language: str) -> Optional[str]:
+    """
+    Rasterize and OCR one page (0-based).
+
+    None when it failed: poppler or tesseract is not installed, or either of
+    them can't handle the page. The page is then left empty, and not cached.
+    """
+    import pytesseract
+    from pdf2image import convert_from_path
+    from pdf2image.exceptions import PDFInfoNotInstalledError, PDFPageCountError, PDFSyntaxError
+
+    try:
+        images = convert_from_path(file_path, dpi=dpi, first_page=page + 1, last_page=page + 1, grayscale=True)
+    except (PDFInfoNotInstalledError, PDFPageCountError, PDFSyntaxError):
+        return None
+    try:
+        return "\n".join(pytesseract.image_to_string(image, lang=language).strip() for image in images)
+    except (pytesseract.TesseractNotFoundError, pytesseract.TesseractError):
+        return None
+    finally:
+        for image in images:
+            image.close()
+
+
+def get_cache_path(file_hash: str, page: int, dpi: int, language: str) -> str:
+    return os.path.join(settings.OCR_CACHE_PATH, file_hash[:2], f"{file_hash}.p{page}.{dpi}dpi.{language}.txt")
+
+
+def _read_cached(cache_path: str) -> Optional[str]:
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _write_cached(cache_path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, cache_path)
+
+
+def needs_ocr(doc: Document) -> bool:
+    """
+    Whether a page has (almost) no text layer
+    """
+    return len(doc.page_content.strip()) < settings.OCR_MIN_TEXT_CHARS and isinstance(doc.metadata.get("page"), int)
+
+
+def ocr_scanned_pages(
+    file_path: str,
+    pages: Iterable[Document],
+    file_hash: str,
+    stats: Dict[str, Any],
+) -> Iterator[Document]:
+    """
+    Pass PDF pages through in order, replacing the text of pages without a text layer by their OCR.
+
+    At most two pages per worker are in flight. stats counts the pages without
+    a text layer and those found in the cache, and lists the pages that got
+    text from OCR; it is complete once the iterator is exhausted.
+    """
+    dpi, language = settings.OCR_DPI, settings.OCR_LANGUAGE
+    stats.update(dpi=dpi, pages=0, cached=0, ocr_pages=[])
+    window = 2 * ocr_workers()
+    # Each page with its cache path and its text: known, or a future of the OCR
+    pending: Deque[Tuple[Document, Optional[str], Union[Future, str, None]]] = deque()
+
+    def finish() -> Document:
+        doc, cache_path, text = pending.popleft()
+        if isinstance(text, Future):
+            try:
+                text = text.result()
+            except BrokenProcessPool:
+                # Retry the page once in a new pool; a page that kills its worker again is left empty
+                try:
+                    text = _submit(file_path, doc.metadata["page"], dpi, language).result()
+                except BrokenProcessPool:
+                    text = None
+            if text is not None:
+                _write_cached(cache_path, text)
+        if text:
+            doc.page_content = text
+            doc.metadata["ocr"] = True
+            stats["ocr_pages"].append(doc.metadata["page"])
+        return doc
+
+    for doc in pages:
+        if not needs_ocr(doc):
+            pending.append((doc, None, None))
+        else:
+            stats["pages"] += 1
+            cache_path = get_cache_path(file_hash, doc.metadata["page"], dpi, language)
+            text = _read_cached(cache_path)
+            if text is not None:
+                stats["cached"] += 1
+                pending.append((doc, cache_path, text))
+            else:
+                pending.append((doc, cache_path, _submit(file_path, doc.metadata["page"], dpi, language)))
+        # Pages leave in order: text pages queued behind an OCR'd one wait for it
+        while pending and (
+            len(pending) > window or not isinstance(pending[0][2], Future) or pending[0][2].done()
+        ):
+            yield finish()
+
+    while pending:
+        yield finish()
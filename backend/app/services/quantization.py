@@ -0,0 +1,295 @@
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+QUANTIZATIONS = ("int8", "float16")
+
+# Number of set bits for every possible byte, used for Hamming distances
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+FULL_VECTORS_FILE = "full.f32.npy"
+CODES_FILE = "codes.npy"
+BINARY_FILE = "binary.npy"
+PARAMS_FILE = "index.json"
+
+# Rows quantized at a time by build(), so building never holds a second copy of the collection
+BUILD_BLOCK_ROWS = 8192
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize vectors so that dot products are cosine similarities
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def fit_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fit per-dimension scalar quantization parameters (offset, scale) to the vectors
+    """
+    low = vectors.min(axis=0)
+    high = vectors.max(axis=0)
+    scale = (high - low) / 255.0
+    scale[scale == 0] = 1.0
+    return low.astype(np.float32), scale.astype(np.float32)
+
+
+def quantize_int8(vectors: np.ndarray, low: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """
+    Map float vectors onto 256 levels per dimension, stored as int8
+    """
+    levels = np.rint((vectors - low) / scale)
+    return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """
+    Keep only the sign of every dimension, packed 8 dimensions per byte
+    """
+    return np.packbits(vectors > 0, axis=-1)
+
+
+def _blocks(parts: Sequence[np.ndarray]) -> Iterator[np.ndarray]:
+    for part in parts:
+        for start in range(0, len(part), BUILD_BLOCK_ROWS):
+            yield normalize(part[start:start + BUILD_BLOCK_ROWS])
+
+
+def hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    """
+    Hamming distance between a packed query code and every packed row
+    """
+    return _POPCOUNT[np.bitwise_xor(codes, query_code)].sum(axis=1, dtype=np.int32)
+
+
+class QuantizedIndex:
+    """
+    Exact-rescoring vector index over compact embeddings.
+
+    Search runs in up to three stages: an optional sign-bit pass picks coarse
+    candidates by Hamming distance, the int8/float16 codes score those candidates,
+    and the best ones are rescored against the full-precision vectors, which
+    stay memory-mapped on disk instead of in RAM.
+
+    Vectors added with extend() are encoded with the parameters already fitted
+    and kept in memory until the index is rebuilt with build().
+    """
+
+    def __init__(
+        self,
+        codes: np.ndarray,
+        full: np.ndarray,
+        quantization: str,
+        binary: Optional[np.ndarray] = None,
+        low: Optional[np.ndarray] = None,
+        scale: Optional[np.ndarray] = None,
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self._codes = codes
+        self._full = full
+        self.quantization = quantization
+        self._binary = binary
+        self.low = low
+        self.scale = scale
+        # Batches added since the last build: (codes, binary, full), concatenated on first use
+        self._extensions: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+
+    def _consolidate(self) -> None:
+        if not self._extensions:
+            return
+        codes, binary, full = zip(*self._extensions)
+        self._codes = np.concatenate([self._codes, *codes])
+        if self._binary is not None:
+            self._binary = np.concatenate([self._binary, *binary])
+        # Reads the memory-mapped rows into RAM until the next build maps them again
+        self._full = np.concatenate([self._full, *full])
+        self._extensions = []
+
+    @property
+    def codes(self) -> np.ndarray:
+        self._consolidate()
+        return self._codes
+
+    @property
+    def binary(self) -> Optional[np.ndarray]:
+        self._consolidate()
+        return self._binary
+
+    @property
+    def full(self) -> np.ndarray:
+        self._consolidate()
+        return self._full
+
+    def __len__(self) -> int:
+        return len(self._codes) + sum(len(codes) for codes, _, _ in self._extensions)
+
+    @property
+    def dim(self) -> int:
+        return self._full.shape[1]
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Compact codes of normalized vectors with the fitted parameters
+        """
+        if self.quantization == "int8":
+            # Values outside the fitted range are clipped; rescoring uses the full vectors anyway
+            return quantize_int8(vectors, self.low, self.scale)
+        return vectors.astype(np.float16)
+
+    def extend(self, vectors: np.ndarray) -> None:
+        """
+        Add vectors in memory without refitting; build() over full persists and refits them
+        """
+        vectors = normalize(vectors)
+        self._extensions.append((self.encode(vectors), quantize_binary(vectors), vectors))
+
+    def truncate(self, rows: int) -> None:
+        """
+        Keep only the first rows (in memory), e.g. to drop vectors written without their records
+        """
+        self._consolidate()
+        self._codes, self._full = self._codes[:rows], self._full[:rows]
+        if self._binary is not None:
+            self._binary = self._binary[:rows]
+
+    @classmethod
+    def build(
+        cls, vectors: Union[np.ndarray, Sequence[np.ndarray]], path: str, quantization: str = "int8"
+    ) -> "QuantizedIndex":
+        """
+        Quantize vectors and persist the compact and full-precision copies to path.
+
+        vectors may be split in parts (e.g. memory-mapped files), which are read
+        in blocks of BUILD_BLOCK_ROWS. Files are written under temporary names and
+        swapped in, so a file that is still memory-mapped (possibly the source of
+        vectors) is never overwritten.
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        os.makedirs(path, exist_ok=True)
+        parts = [vectors] if isinstance(vectors, np.ndarray) else list(vectors)
+        rows, dim = sum(len(part) for part in parts), int(parts[0].shape[1])
+
+        index = cls(np.empty((0, dim), np.int8), np.empty((0, dim), np.float32), quantization)
+        params: Dict[str, Any] = {"quantization": quantization, "dim": dim}
+        if quantization == "int8":
+            # The range over every block: fitted on the per-block minima and maxima
+            index.low, index.scale = fit_int8(np.vstack([
+                bound for block in _blocks(parts) for bound in (block.min(axis=0), block.max(axis=0))
+            ]))
+            params.update({"low": index.low.tolist(), "scale": index.scale.tolist()})
+
+        outputs = {
+            FULL_VECTORS_FILE: (np.float32, dim),
+            CODES_FILE: (np.int8 if quantization == "int8" else np.float16, dim),
+            BINARY_FILE: (np.uint8, (dim + 7) // 8),
+        }
+        arrays = {
+            name: np.lib.format.open_memmap(os.path.join(path, f"{name}.tmp"), mode="w+", dtype=dtype, shape=(rows, width))
+            for name, (dtype, width) in outputs.items()
+        }
+        start = 0
+        for block in _blocks(parts):
+            end = start + len(block)
+            arrays[FULL_VECTORS_FILE][start:end] = block
+            arrays[CODES_FILE][start:end] = index.encode(block)
+            arrays[BINARY_FILE][start:end] = quantize_binary(block)
+            start = end
+        for name in outputs:
+            # Unmapped before the swap
+            array = arrays.pop(name)
+            array.flush()
+            del array
+            os.replace(os.path.join(path, f"{name}.tmp"), os.path.join(path, name))
+        tmp_path = os.path.join(path, f"{PARAMS_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(params, f)
+        os.replace(tmp_path, os.path.join(path, PARAMS_FILE))
+
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path: str) -> "QuantizedIndex":
+        """
+        Load an index; full-precision vectors are memory-mapped, not read into RAM
+        """
+        with open(os.path.join(path, PARAMS_FILE)) as f:
+            params = json.load(f)
+
+        low = scale = None
+        if params["quantization"] == "int8":
+            low = np.asarray(params["low"], dtype=np.float32)
+            scale = np.asarray(params["scale"], dtype=np.float32)
+
+        return cls(
+            codes=np.load(os.path.join(path, CODES_FILE)),
+            full=np.load(os.path.join(path, FULL_VECTORS_FILE), mmap_mode="r"),
+            quantization=params["quantization"],
+            binary=np.load(os.path.join(path, BINARY_FILE)),
+            low=low,
+            scale=scale,
+        )
+
+    def compact_scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Approximate cosine similarities computed from the compact codes
+        """
+        codes = self.codes if rows is None else self.codes[rows]
+        if self.quantization == "int8":
+            # q . (low + (code + 128) * scale) == q . low + (code + 128) . (q * scale)
+            return (codes.astype(np.float32) + 128.0) @ (query * self.scale) + float(query @ self.low)
+        return codes.astype(np.float32) @ query
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int = 4,
+        coarse_candidates: int = 200,
+        rescore_candidates: int = 50,
+        use_binary: bool = True,
+        rescore: bool = True,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return (row indices, cosine similarities) of the k nearest vectors
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = normalize(query)
+        k = min(k, len(self))
+
+        rows = None
+        if use_binary and self.binary is not None and len(self) > coarse_candidates:
+            distances = hamming_distances(self.binary, quantize_binary(query))
+            rows = np.argpartition(distances, coarse_candidates - 1)[:coarse_candidates]
+
+        scores = self.compact_scores(query, rows)
+        candidates = rows if rows is not None else np.arange(len(self))
+
+        keep = max(rescore_candidates, k) if rescore else k
+        if keep < len(candidates):
+            best = np.argpartition(-scores, keep - 1)[:keep]
+            candidates, scores = candidates[best], scores[best]
+
+        if rescore:
+            # Sorted reads keep the memory-mapped access mostly sequential
+            order = np.argsort(candidates)
+            candidates = candidates[order]
+            scores = np.asarray(self.full[candidates]) @ query
+
+        top = np.argsort(-scores)[:k]
+        return candidates[top], scores[top].astype(np.float32)
+
+    def memory_bytes(self) -> int:
+        """
+        Bytes held in RAM by the compact representation
+        """
+        total = self.codes.nbytes
+        if self.binary is not None:
+            total += self.binary.nbytes
+        return total
@@ -0,0 +1,309 @@
+import json
+import os
+import shutil
+import uuid
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from app.core.config import settings
+from app.services.quantization import CODES_FILE, FULL_VECTORS_FILE, PARAMS_FILE, QuantizedIndex, normalize
+
+DOCUMENTS_FILE = "docs.jsonl"
+# Normalized float32 rows added since the codes were last fitted, folded in by persist()
+PENDING_FILE = "pending.f32"
+
+
+class QuantizedVectorStore(VectorStore):
+    """
+    LangChain vector store backed by a QuantizedIndex plus a JSONL sidecar
+    holding the chunk ids, text and metadata.
+
+    The first batch fits the quantization parameters. Later batches are only
+    appended to disk, their vectors to PENDING_FILE and their records to the
+    sidecar, so filling a store holds no more than the current batch in memory;
+    persist() refits the codes over the whole collection once, block by block.
+    The index is loaded, with any pending rows, on the first search, and records
+    are read from the sidecar only for search hits.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str,
+        embedding_function: Embeddings,
+        quantization: Optional[str] = None,
+    ):
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.quantization = quantization or settings.VECTOR_QUANTIZATION
+        self.dim: Optional[int] = None
+        # Rows backed by a complete record, the bytes of the sidecar they use, and where each starts
+        self.rows = 0
+        self.documents_size = 0
+        self.offsets: Optional[array] = None
+        # Rows of the fitted index files; -1 when they hold rows without a record and need a refit
+        self.fitted_rows = 0
+        self._index: Optional[QuantizedIndex] = None
+
+        if os.path.exists(os.path.join(persist_directory, DOCUMENTS_FILE)):
+            self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_directory, name)
+
+    def _load(self) -> None:
+        if not os.path.exists(self._path(PARAMS_FILE)):
+            # Records are written after the vectors: without an index none of them is complete
+            return
+        with open(self._path(PARAMS_FILE)) as f:
+            params = json.load(f)
+        self.quantization, self.dim = params["quantization"], params["dim"]
+        self.fitted_rows = len(np.load(self._path(CODES_FILE), mmap_mode="r"))
+
+        self.offsets = array("Q")
+        with open(self._path(DOCUMENTS_FILE), "rb") as f:
+            for line in f:
+                try:
+                    json.loads(line)
+                except ValueError:
+                    # A record torn by a crash mid-write; it is overwritten by the next append
+                    break
+                self.offsets.append(self.documents_size)
+                self.documents_size += len(line)
+
+        available = self.fitted_rows + self._pending_rows_on_disk()
+        # Records written by a batch whose vectors were lost have nothing to point at
+        self.rows = min(len(self.offsets), available)
+        if self.rows < len(self.offsets):
+            self.documents_size = self.offsets[self.rows]
+            del self.offsets[self.rows:]
+        if self.fitted_rows > self.rows:
+            # Vectors written by a crashed batch before its records: refit before appending after them
+            self.fitted_rows = -1
+
+    def _pending_rows_on_disk(self) -> int:
+        if self.dim is None or not os.path.exists(self._path(PENDING_FILE)):
+            return 0
+        return os.path.getsize(self._path(PENDING_FILE)) // (self.dim * 4)
+
+    def _pending(self) -> np.ndarray:
+        """
+        The pending rows backed by a record, memory-mapped
+        """
+        rows = self.rows - max(self.fitted_rows, 0)
+        if rows <= 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(self._path(PENDING_FILE), dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    @property
+    def index(self) -> Optional[QuantizedIndex]:
+        """
+        The index over every row, loaded on first use with the pending rows folded in
+        """
+        if self._index is None and self.rows:
+            index = QuantizedIndex.load(self.persist_directory)
+            if len(index) > self.rows:
+                index.truncate(self.rows)
+            elif self.rows > len(index):
+                index.extend(np.asarray(self._pending()))
+            self._index = index
+        return self._index
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """
+        Embed and add texts, appended to disk to be encoded by persist()
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+
+        vectors = normalize(np.asarray(self.embedding_function.embed_documents(texts), dtype=np.float32))
+        if self.fitted_rows < 0:
+            full = np.load(self._path(FULL_VECTORS_FILE), mmap_mode="r")[:self.rows]
+            self._build([full, vectors])
+        elif not self.rows:
+            self._build([vectors])
+        else:
+            # Drop rows a crashed batch left past the last complete record, so rows keep matching records
+            with open(self._path(PENDING_FILE), "ab") as f:
+                f.truncate((self.rows - self.fitted_rows) * self.dim * 4)
+                f.write(vectors.tobytes())
+        self._index = None
+
+        with open(self._path(DOCUMENTS_FILE), "ab") as f:
+            f.truncate(self.documents_size)
+            for id_, text, metadata in zip(ids, texts, metadatas):
+                if self.offsets is not None:
+                    self.offsets.append(f.tell())
+                f.write(self._encode_document(id_, text, metadata))
+            self.documents_size = f.tell()
+        self.rows += len(texts)
+        return ids
+
+    def _build(self, parts: List[np.ndarray]) -> None:
+        QuantizedIndex.build(parts, self.persist_directory, self.quantization)
+        self.dim = int(parts[0].shape[1])
+        self.fitted_rows = sum(len(part) for part in parts)
+        if os.path.exists(self._path(PENDING_FILE)):
+            os.remove(self._path(PENDING_FILE))
+
+    def _encode_document(self, id_: str, text: str, metadata: Dict[str, Any]) -> bytes:
+        return (json.dumps({"id": id_, "text": text, "metadata": metadata}) + "\n").encode()
+
+    def _get_offsets(self) -> array:
+        if self.offsets is None:
+            self.offsets = array("Q")
+            with open(self._path(DOCUMENTS_FILE), "rb") as f:
+                for _ in range(self.rows):
+                    self.offsets.append(f.tell())
+                    f.readline()
+        return self.offsets
+
+    def _read_records(self, rows: Iterable[int]) -> List[Dict[str, Any]]:
+        offsets = self._get_offsets()
+        records = []
+        with open(self._path(DOCUMENTS_FILE), "rb") as f:
+            for row in rows:
+                f.seek(offsets[row])
+                records.append(json.loads(f.readline()))
+        return records
+
+    def persist(self) -> None:
+        """
+        Refit the compact codes over the whole collection, folding in the appended batches
+        """
+        if not self.rows or self.rows == self.fitted_rows:
+            return
+        full = np.load(self._path(FULL_VECTORS_FILE), mmap_mode="r")
+        self._build([full[:self.rows]] if self.fitted_rows < 0 else [full[:self.fitted_rows], self._pending()])
+        self._index = None
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """
+        Remove the rows with the given ids, refitting the compact codes over the rest
+        """
+        wanted = set(ids or [])
+        if not wanted or not self.rows:
+            return False
+        keep = []
+        with open(self._path(DOCUMENTS_FILE), "rb") as f:
+            for row in range(self.rows):
+                if json.loads(f.readline())["id"] not in wanted:
+                    keep.append(row)
+        if len(keep) == self.rows:
+            return False
+
+        if not keep:
+            # An empty index can't be fitted; drop the collection files instead
+            shutil.rmtree(self.persist_directory)
+            self._index, self.offsets = None, None
+            self.rows = self.fitted_rows = self.documents_size = 0
+            return True
+
+        self._build([np.asarray(self.index.full)[keep]])
+        tmp_path = self._path(f"{DOCUMENTS_FILE}.tmp")
+        offsets = self._get_offsets()
+        self.offsets = array("Q")
+        with open(self._path(DOCUMENTS_FILE), "rb") as src, open(tmp_path, "wb") as dst:
+            for row in keep:
+                src.seek(offsets[row])
+                self.offsets.append(dst.tell())
+                dst.write(src.readline())
+            self.documents_size = dst.tell()
+        os.replace(tmp_path, self._path(DOCUMENTS_FILE))
+        self.rows = len(keep)
+        self._index = None
+        return True
+
+    def _to_documents(self, rows: Iterable[int]) -> List[Document]:
+        return [Document(page_content=record["text"], metadata=record["metadata"]) for record in self._read_records(rows)]
+
+    def _search(self, embedding: List[float], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.index is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self.index.search(
+            np.asarray(embedding, dtype=np.float32),
+            k=k,
+            coarse_candidates=settings.VECTOR_COARSE_CANDIDATES,
+            rescore_candidates=settings.VECTOR_RESCORE_CANDIDATES,
+            use_binary=settings.VECTOR_BINARY_PASS,
+        )
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        rows, scores = self._search(self.embedding_function.embed_query(query), k)
+        return list(zip(self._to_documents(rows), (float(score) for score in scores)))
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        rows, _ = self._search(embedding, k)
+        return self._to_documents(rows)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        **kwargs: Any,
+    ) -> List[Document]:
+        rows, _ = self._search(embedding, fetch_k)
+        if len(rows) == 0:
+            return []
+        rows = np.sort(rows)
+        selected = maximal_marginal_relevance(
+            normalize(np.asarray(embedding, dtype=np.float32)),
+            np.asarray(self.index.full[rows]),
+            lambda_mult=lambda_mult,
+            k=k,
+        )
+        return self._to_documents(rows[i] for i in selected)
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        **kwargs: Any,
+    ) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self.embedding_function.embed_query(query), k, fetch_k, lambda_mult, **kwargs
+        )
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        persist_directory: Optional[str] = None,
+        **kwargs: Any,
+    ) -> "QuantizedVectorStore":
+        if persist_directory is None:
+            raise ValueError("QuantizedVectorStore requires a persist_directory")
+        store = cls(persist_directory, embedding, quantization=kwargs.get("quantization"))
+        store.add_texts(texts, metadatas=metadatas, ids=kwargs.get("ids"))
+        return store
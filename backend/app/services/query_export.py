@@ -0,0 +1,166 @@
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import groupby
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import select
+
+from app.db.session import SessionLocal
+from app.models.document import Document
+from app.models.query import Citation, Query
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "markdown": ("text/markdown", "md"),
+}
+
+CSV_COLUMNS = [
+    "query_id", "created_at", "document_id", "document_title", "query_text", "response",
+    "is_favorite", "citation_id", "citation_section_id", "citation_content",
+]
+
+# Rows fetched per round trip from the server-side cursor
+FETCH_SIZE = 1000
+
+# Bytes buffered before a chunk is sent to the client
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_query_records(
+    user_id: int,
+    document_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream a user's queries with their citations, oldest first, one record per query.
+
+    Plain rows are fetched in batches from a server-side cursor, so memory stays
+    constant whatever the size of the history. The generator owns its session:
+    it outlives the request's dependency-managed one while the response streams.
+    """
+    statement = (
+        select(
+            Query.id, Query.created_at, Query.document_id, Document.title, Query.query_text,
+            Query.response, Query.is_favorite, Query.meta_data,
+            Citation.id.label("citation_id"), Citation.document_section_id,
+            Citation.content.label("citation_content"), Citation.meta_data.label("citation_meta_data"),
+        )
+        .outerjoin(Document, Document.id == Query.document_id)
+        .outerjoin(Citation, Citation.query_id == Query.id)
+        .where(Query.user_id == user_id)
+        .order_by(Query.id, Citation.id)
+        .execution_options(yield_per=FETCH_SIZE)
+    )
+    if document_id is not None:
+        statement = statement.where(Query.document_id == document_id)
+    if since is not None:
+        statement = statement.where(Query.created_at >= since)
+    if until is not None:
+        statement = statement.where(Query.created_at < until)
+
+    db = SessionLocal()
+    try:
+        # Citations of a query are consecutive rows
+        for _, rows in groupby(db.execute(statement), key=lambda row: row.id):
+            rows = list(rows)
+            first = rows[0]
+            yield {
+                "id": first.id,
+                "created_at": first.created_at.isoformat() if first.created_at else None,
+                "document_id": first.document_id,
+                "document_title": first.title,
+                "query_text": first.query_text,
+                "response": first.response,
+                "is_favorite": first.is_favorite,
+                "meta_data": first.meta_data,
+                "citations": [
+                    {
+                        "id": row.citation_id,
+                        "document_section_id": row.document_section_id,
+                        "content": row.citation_content,
+                        "meta_data": row.citation_meta_data,
+                    }
+                    for row in rows
+                    if row.citation_id is not None
+                ],
+            }
+    finally:
+        db.close()
+
+
+def _ndjson(records: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    for record in records:
+        yield json.dumps(record, default=str) + "\n"
+
+
+def _csv(records: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    # One row per citation; a query without citations still gets one row
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for record in records:
+        query_columns = [
+            record["id"], record["created_at"], record["document_id"], record["document_title"],
+            record["query_text"], record["response"], record["is_favorite"],
+        ]
+        for citation in record["citations"] or [None]:
+            citation_columns = [citation["id"], citation["document_section_id"], citation["content"]] if citation else ["", "", ""]
+            writer.writerow(query_columns + citation_columns)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _quote(text: str) -> str:
+    return "\n".join(f"> {line}" for line in (text or "").splitlines()) or ">"
+
+
+def _markdown(records: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    yield "# Query history\n\n"
+    for record in records:
+        lines: List[str] = [f"## Query {record['id']} ({record['created_at']})", ""]
+        if record["document_title"]:
+            lines += [f"Document: {record['document_title']}", ""]
+        lines += [f"**Question:** {record['query_text']}", "", "**Answer:**", "", record["response"] or "_No response_", ""]
+        if record["citations"]:
+            lines += ["**Citations:**", ""]
+            for number, citation in enumerate(record["citations"], 1):
+                lines += [f"{number}. Section {citation['document_section_id']}", "", _quote(citation["content"]), ""]
+        lines += ["---", "", ""]
+        yield "\n".join(lines)
+
+
+_WRITERS = {"ndjson": _ndjson, "csv": _csv, "markdown": _markdown}
+
+
+def iter_export(
+    user_id: int,
+    export_format: str,
+    document_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Iterator[bytes]:
+    """
+    Stream a user's query history in the given format, in chunks of about CHUNK_SIZE bytes
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+    records = iter_query_records(user_id, document_id, since, until)
+    buffer: List[bytes] = []
+    size = 0
+    # The first record goes out at once so the download starts without waiting for a full chunk
+    threshold = 1
+    for text in _WRITERS[export_format](records):
+        data = text.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= threshold:
+            yield b"".join(buffer)
+            buffer, size, threshold = [], 0, CHUNK_SIZE
+    if buffer:
+        yield b"".join(buffer)
@@ -1,12 +1,10 @@
 import os
+import time
 from typing import Dict, List, Optional, Any, Tuple
 
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.chains import RetrievalQA
+from langchain.chains.question_answering import load_qa_chain
 from langchain.chains.query_constructor.base import AttributeInfo
 from langchain.retrievers.self_query.base import SelfQueryRetriever
-from langchain_community.chat_models import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 from langchain.agents import initialize_agent, Tool, AgentType
@@ -14,29 +12,31 @@ from langchain.memory import ConversationBufferMemory
 from langchain_core.documents import Document
 
 from app.core.config import settings
+from app.services.context_packer import pack_context
+from app.services.image_processor import analyze_image_file
+from app.services.llm_client import get_chat_model, is_llm_available
+from app.services.query_router import legacy_route, record_llm_latency, route_query
+from app.services.single_flight import SingleFlight
+from app.services.table_store import answer_table_query
+from app.services.tracing import span
+from app.services.vector_store import get_index_version, open_vector_store
+
+# Identical queries in flight at the same time share one pipeline run
+_query_flight = SingleFlight()
 
 
 def load_vector_store(document_id: str):
     """
     Load the vector store for a specific document
     """
-    vector_store_path = os.path.join(settings.VECTOR_DB_PATH, f"doc_{document_id}")
-    
-    if not os.path.exists(vector_store_path):
-        raise ValueError(f"Vector store not found for document {document_id}")
-    
-    # Use HuggingFace embeddings for technical content
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    
-    # Load the vector store
-    return Chroma(persist_directory=vector_store_path, embedding_function=embeddings)
+    return open_vector_store(document_id)
 
 
 def create_metadata_filter_retriever(vectorstore, metadata_field_info):
     """
     Create a retriever with metadata filtering capabilities
     """
-    llm = ChatOpenAI(temperature=0, openai_api_key=settings.OPENAI_API_KEY)
+    llm = get_chat_model()
     
     return SelfQueryRetriever.from_llm(
         llm=llm,
@@ -51,7 +51,7 @@ def decompose_query(query_text: str):
     """
     Decompose a complex query into simpler sub-queries
     """
-    llm = ChatOpenAI(temperature=0, openai_api_key=settings.OPENAI_API_KEY)
+    llm = get_chat_model()
     
     prompt_template = """
     You are an expert at breaking down complex questions into simpler sub-questions.
@@ -78,35 +78,93 @@ def decompose_query(query_text: str):
 
 def process_image_query(query_text: str, image_path: str):
     """
-    Process a query about an image using a vision model
+    Answer a question about an image from its ingest-time caption and OCR text
     """
-    # This would integrate with GPT-4V or Claude Vision
-    # For now, we'll use a placeholder implementation
-    llm = ChatOpenAI(temperature=0, openai_api_key=settings.OPENAI_API_KEY)
+    # Cached by image hash at upload, so this normally doesn't touch OCR or a vision model
+    analysis = analyze_image_file(image_path)
+    llm = get_chat_model()
     
     prompt_template = """
-    Analyze the image at {image_path} and answer the following question:
+    Answer the following question about an image using its description.
+    
+    Caption: {caption}
+    Text found in the image: {ocr_text}
     
     Question: {question}
     """
     
     prompt = PromptTemplate(
-        input_variables=["image_path", "question"],
+        input_variables=["caption", "ocr_text", "question"],
         template=prompt_template,
     )
     
     chain = LLMChain(llm=llm, prompt=prompt)
-    result = chain.run(image_path=image_path, question=query_text)
+    result = chain.run(
+        caption=analysis["caption"] or "(none)",
+        ocr_text=analysis["ocr_text"] or "(none)",
+        question=query_text,
+    )
     
     return result
 
 
-def process_query(query_text: str, document_id: Optional[str] = None):
+def build_citations(source_documents: List[Document]) -> List[Dict[str, Any]]:
+    """
+    Turn the retrieved chunks an answer was based on into citation records
+    """
+    citations = []
+    for doc in source_documents:
+        citation = {
+            "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
+            "meta_data": doc.metadata,  # Changed from metadata to meta_data
+            "document_section_id": doc.metadata.get("section_id", 0)  # Set from the section row at upload time
+        }
+        citations.append(citation)
+    
+    return citations
+
+
+def quote_passage(doc: Document) -> str:
+    """
+    Present a retrieved chunk as a quotation so it is not mistaken for a generated answer
+    """
+    # Loaders number pages from 0
+    page = doc.metadata.get("page")
+    source = f"page {page + 1}" if isinstance(page, int) else "the document"
+    quoted = "\n".join(f"> {line}" if line else ">" for line in doc.page_content.splitlines())
+    return f"Quoted passage from {source}:\n\n{quoted}"
+
+
+def retrieve(retriever, query_text: str) -> List[Document]:
+    """
+    Run the retriever in a span recording which chunks it returned
+    """
+    with span("retrieve", query=query_text) as retrieve_span:
+        documents = retriever.get_relevant_documents(query_text)
+        retrieve_span.set(chunk_ids=[doc.metadata.get("section_id") for doc in documents])
+    return documents
+
+
+def process_query(
+    query_text: str,
+    document_id: Optional[str] = None,
+    tables: Optional[List[Dict[str, Any]]] = None,
+):
     """
     Process a query using LangChain and return the response with citations
     """
-    # Check if OpenAI API key is available
-    if not settings.OPENAI_API_KEY:
+    # Aggregations over tabular documents are computed exactly, without retrieval or an LLM
+    if tables:
+        table_answer = answer_table_query(query_text, tables)
+        if table_answer is not None:
+            return {
+                "response": table_answer.pop("response"),
+                "citations": [],
+                "meta_data": {"routing": {"route": "table", **table_answer}},
+            }
+    
+    # Check if OpenAI API key (or the fake LLM backend) is available
+    if not is_llm_available():
         print("Using mock implementation for testing (OpenAI API key not available)")
         # Return a mock response for testing
         return {
@@ -124,85 +182,78 @@ def process_query(query_text: str, document_id: Optional[str] = None):
         # If document_id is provided, load the specific vector store
         if document_id:
             vectorstore = load_vector_store(document_id)
+            if settings.RETRIEVER_SEARCH_TYPE == "mmr":
+                search_kwargs = {
+                    "k": settings.RETRIEVER_K,
+                    "fetch_k": settings.RETRIEVER_FETCH_K,
+                    "lambda_mult": settings.RETRIEVER_LAMBDA,
+                }
+            else:
+                search_kwargs = {"k": settings.RETRIEVER_K}
             retriever = vectorstore.as_retriever(
-                search_type="mmr",
-                search_kwargs={"k": 5, "fetch_k": 10}
+                search_type=settings.RETRIEVER_SEARCH_TYPE,
+                search_kwargs=search_kwargs
             )
         else:
             # Load all vector stores and create a unified retriever
             # This is a placeholder for now
             raise NotImplementedError("Querying across all documents not yet implemented")
         
-        # Check if the query is complex and needs decomposition
-        if len(query_text.split()) > 15 or "?" in query_text[1:]:
-            sub_queries = decompose_query(query_text)
-            
-            # Process each sub-query
-            sub_results = []
-            for sub_query in sub_queries:
-                qa_chain = RetrievalQA.from_chain_type(
-                    llm=ChatOpenAI(temperature=0, openai_api_key=settings.OPENAI_API_KEY),
-                    chain_type="stuff",
-                    retriever=retriever,
-                    return_source_documents=True
-                )
-                sub_result = qa_chain({"query": sub_query})
-                sub_results.append(sub_result)
-            
-            # Combine the results
-            llm = ChatOpenAI(temperature=0, openai_api_key=settings.OPENAI_API_KEY)
-            prompt_template = """
-            Based on the following information, please answer the original question.
-            
-            Original question: {original_question}
-            
-            Information:
-            {sub_results}
-            
-            Answer:
-            """
-            
-            prompt = PromptTemplate(
-                input_variables=["original_question", "sub_results"],
-                template=prompt_template,
-            )
+        # Route on cheap local signals before paying for any LLM call
+        with span("route") as route_span:
+            if settings.QUERY_ROUTER_ENABLED:
+                route, hits = route_query(query_text, vectorstore)
+            else:
+                route, hits = {"route": legacy_route(query_text)}, []
+            route_span.set(route=route["route"], chunk_ids=[doc.metadata.get("section_id") for doc, _ in hits])
+        
+        if route["route"] == "retrieval_only":
+            # The query asked for the source text: quote the matching passage, no LLM call
+            source_documents = [doc for doc, _ in hits[:1]]
+            final_answer = "\n\n".join(quote_passage(doc) for doc in source_documents)
+            return {
+                "response": final_answer,
+                "citations": build_citations(source_documents),
+                "meta_data": {"routing": route},
+            }
+        
+        if route["route"] == "decompose":
+            started = time.perf_counter()
+            with span("decompose") as decompose_span:
+                sub_queries = decompose_query(query_text)
+                decompose_span.set(sub_queries=len(sub_queries))
+            record_llm_latency((time.perf_counter() - started) * 1000)
             
-            chain = LLMChain(llm=llm, prompt=prompt)
-            final_answer = chain.run(
-                original_question=query_text,
-                sub_results="\n\n".join([f"Sub-question: {q}\nAnswer: {r['result']}" for q, r in zip(sub_queries, sub_results)])
+            # Retrieve for each sub-query; the packed context is shared, so chunks
+            # found by several sub-queries are only sent once
+            rankings = [retrieve(retriever, sub_query) for sub_query in sub_queries]
+            question = (
+                f"{query_text}\n\nAddress each of these sub-questions in the answer:\n"
+                + "\n".join(sub_queries)
             )
-            
-            # Collect all source documents
-            source_documents = []
-            for result in sub_results:
-                source_documents.extend(result.get("source_documents", []))
         else:
-            # For simpler queries, use a direct QA chain
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=ChatOpenAI(temperature=0, openai_api_key=settings.OPENAI_API_KEY),
-                chain_type="stuff",
-                retriever=retriever,
-                return_source_documents=True
-            )
-            
-            result = qa_chain({"query": query_text})
-            final_answer = result["result"]
-            source_documents = result.get("source_documents", [])
+            rankings = [retrieve(retriever, query_text)]
+            question = query_text
         
-        # Extract citations
-        citations = []
-        for doc in source_documents:
-            citation = {
-                "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-                "meta_data": doc.metadata,  # Changed from metadata to meta_data
-                "document_section_id": doc.metadata.get("section_id", 0)  # This would need to be properly set during indexing
-            }
-            citations.append(citation)
+        # Deduplicate, merge adjacent chunks and trim to the prompt token budget
+        with span("pack_context") as pack_span:
+            context_documents, source_documents = pack_context(rankings, settings.CONTEXT_TOKEN_BUDGET)
+            pack_span.set(chunk_ids=[doc.metadata.get("section_id") for doc in source_documents])
+        
+        qa_chain = load_qa_chain(
+            llm=get_chat_model(),
+            chain_type="stuff",
+        )
+        started = time.perf_counter()
+        with span("answer"):
+            result = qa_chain({"input_documents": context_documents, "question": question})
+        record_llm_latency((time.perf_counter() - started) * 1000)
+        final_answer = result["output_text"]
         
         return {
             "response": final_answer,
-            "citations": citations
+            "citations": build_citations(source_documents),
+            "meta_data": {"routing": route},
         }
     except Exception as e:
         import traceback
@@ -213,4 +264,29 @@ def process_query(query_text: str, document_id: Optional[str] = None):
         return {
             "response": f"I'm sorry, I couldn't process your query due to an error: {str(e)}. This is a mock response for testing purposes.",
             "citations": []
-        } 
\ No newline at end of file
+        } 
+
+
+def normalize_query_text(query_text: str) -> str:
+    """
+    Normalize a query for identity checks: case and whitespace don't change the question
+    """
+    return " ".join(query_text.lower().split())
+
+
+def process_query_coalesced(
+    query_text: str,
+    document_id: Optional[str] = None,
+    tables: Optional[List[Dict[str, Any]]] = None,
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Process a query, sharing the run with identical concurrent queries.
+
+    Queries are identical when they target the same document, index version and
+    normalized text. Returns the result and whether it came from another request.
+    """
+    index_version = get_index_version(document_id) if document_id else 0
+    key = (document_id, normalize_query_text(query_text), index_version)
+    return _query_flight.do(
+        key, lambda: process_query(query_text=query_text, document_id=document_id, tables=tables)
+    )
@@ -0,0 +1,149 @@
+import json
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from app.core.config import settings
+
+ROUTES = ("retrieval_only", "direct", "decompose")
+
+# LLM calls each route makes: decomposition adds one call before the answer
+LLM_CALLS = {"retrieval_only": 0, "direct": 1, "decompose": 2}
+
+_CONJUNCTIONS = re.compile(
+    r"\b(and|or|versus|vs\.?|compare[sd]?|comparison|difference[s]?|between|both|respectively|as well as)\b",
+    re.IGNORECASE,
+)
+_INTERROGATIVES = re.compile(r"\b(what|why|how|when|where|which|who|whom|whose)\b", re.IGNORECASE)
+
+# Queries asking for the document's own words; only these may be answered with a quoted passage
+_SOURCE_TEXT_REQUEST = re.compile(
+    r"\b(quote[sd]?|quotation|verbatim|word for word|exact (wording|words|text|passage|sentence)"
+    r"|original (wording|text)|(show|give|cite|print) (me )?the (passage|paragraph|sentence|text|section)"
+    r"|what does (it|the \w+) say)\b",
+    re.IGNORECASE,
+)
+
+# Weights of the decomposition classifier (logistic regression over the features
+# below), fitted on labelled queries with `python -m app.benchmarks.query_router --fit`
+WEIGHTS_PATH = os.path.join(os.path.dirname(__file__), "query_router_weights.json")
+
+
+def load_weights(path: str = WEIGHTS_PATH) -> Tuple[Dict[str, float], float]:
+    """
+    Read the fitted classifier weights and bias
+    """
+    with open(path) as f:
+        fitted = json.load(f)
+    return fitted["weights"], fitted["bias"]
+
+
+_WEIGHTS, _BIAS = load_weights()
+
+# Running average of one LLM call, used to estimate the latency a route saves
+_llm_latency_ms = 1500.0
+
+
+def record_llm_latency(latency_ms: float) -> None:
+    """
+    Fold an observed LLM call latency into the running average
+    """
+    global _llm_latency_ms
+    _llm_latency_ms = 0.9 * _llm_latency_ms + 0.1 * latency_ms
+
+
+def legacy_route(query_text: str) -> str:
+    """
+    The word-count heuristic the router replaces, kept for comparison
+    """
+    if len(query_text.split()) > 15 or "?" in query_text[1:]:
+        return "decompose"
+    return "direct"
+
+
+def text_features(query_text: str) -> Dict[str, float]:
+    """
+    Signals computed from the query text alone
+    """
+    # A trailing question mark is normal; only extra ones suggest several questions
+    question_marks = max(query_text.count("?") - 1, 0)
+    return {
+        "question_marks": float(question_marks),
+        "interrogatives": float(max(len(_INTERROGATIVES.findall(query_text)) - 1, 0)),
+        "conjunctions": float(len(_CONJUNCTIONS.findall(query_text))),
+        "log_words": math.log1p(len(query_text.split())),
+    }
+
+
+def hit_features(scores: List[float]) -> Dict[str, float]:
+    """
+    Signals from the relevance scores of the top hits.
+
+    A strong, isolated top hit means a single passage answers the question; low,
+    flat scores mean the relevant content is spread over the document.
+    """
+    if not scores:
+        return {"top_score": 0.0, "top_score_gap": 1.0, "hit_spread": 0.0}
+    top = max(scores)
+    mean = sum(scores) / len(scores)
+    return {
+        "top_score": top,
+        "top_score_gap": 1.0 - top,
+        "hit_spread": 1.0 - (top - mean) if len(scores) > 1 else 0.0,
+    }
+
+
+def asks_for_source_text(query_text: str) -> bool:
+    """
+    Whether the query explicitly asks to see the document's text rather than an answer
+    """
+    return _SOURCE_TEXT_REQUEST.search(query_text) is not None
+
+
+def decomposition_probability(features: Dict[str, float]) -> float:
+    z = _BIAS + sum(weight * features.get(name, 0.0) for name, weight in _WEIGHTS.items())
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+def route_query(
+    query_text: str,
+    vectorstore: Optional[VectorStore] = None,
+    k: int = 5,
+) -> Tuple[Dict[str, Any], List[Tuple[Document, float]]]:
+    """
+    Choose between a retrieval-only answer, a direct answer and decomposition.
+
+    A retrieval-only answer quotes the top passage, so it is only chosen when the
+    query asks for the source text and that passage matches it closely.
+    Returns the decision (recorded in Query.meta_data) and the scored hits, which
+    a retrieval-only answer reuses.
+    """
+    hits: List[Tuple[Document, float]] = []
+    if vectorstore is not None:
+        hits = vectorstore.similarity_search_with_relevance_scores(query_text, k=k)
+
+    features = text_features(query_text)
+    features.update(hit_features([score for _, score in hits]))
+    probability = decomposition_probability(features)
+
+    if asks_for_source_text(query_text) and features["top_score"] >= settings.ROUTER_RETRIEVAL_ONLY_SCORE:
+        route = "retrieval_only"
+    elif probability >= settings.ROUTER_DECOMPOSE_THRESHOLD:
+        route = "decompose"
+    else:
+        route = "direct"
+
+    legacy = legacy_route(query_text)
+    decision = {
+        "route": route,
+        "legacy_route": legacy,
+        "decompose_probability": round(probability, 4),
+        "features": {name: round(value, 4) for name, value in features.items()},
+        "llm_calls_saved": LLM_CALLS[legacy] - LLM_CALLS[route],
+        "estimated_latency_saved_ms": round((LLM_CALLS[legacy] - LLM_CALLS[route]) * _llm_latency_ms),
+    }
+    return decision, hits
@@ -0,0 +1,76 @@
+"""
+Rebuild chunks, sections and vectors of stored documents from the parse cache.
+
+Use after changing chunking or the embedding model; parsers only run for files
+that have no cache entry yet:
+
+    python -m app.services.reindex --all
+    python -m app.services.reindex --document-id 3 --document-id 7
+"""
+import argparse
+import os
+import time
+
+from app.db.session import SessionLocal
+from app.models.document import Document
+from app.services.document_processor import iter_document
+from app.services.ingestion import clear_document_index, index_document
+from app.services.parse_cache import file_sha256, iter_cached
+
+
+def reindex_document(db, document: Document) -> str:
+    """
+    Re-chunk and re-embed one document; returns how its parsed content was obtained
+    """
+    # The recorded hash lets the cache serve documents whose source file is gone
+    file_hash = (document.meta_data or {}).get("file_hash")
+    if file_hash is None and os.path.exists(document.file_path):
+        file_hash = file_sha256(document.file_path)
+
+    # Both sources are streamed straight into the indexing pipeline
+    meta_data = {}
+    documents = iter_cached(document.file_path, meta_data, file_hash) if file_hash else None
+    source = "cache"
+    if documents is None:
+        if not os.path.exists(document.file_path):
+            return "missing file"
+        documents = iter_document(document.file_path, meta_data, use_cache=False)
+        source = "parsed"
+
+    clear_document_index(db, document.id)
+    index_document(db, document, documents, meta_data=meta_data)
+
+    document.meta_data = meta_data
+    db.commit()
+    return source
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--all", action="store_true", help="reindex every document")
+    group.add_argument("--document-id", type=int, action="append", help="document to reindex (repeatable)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        # Deleted documents only wait for the cleanup worker's purge
+        query = db.query(Document).filter(Document.deleted_at.is_(None)).order_by(Document.id)
+        if args.document_id:
+            query = query.filter(Document.id.in_(args.document_id))
+
+        for document in query.all():
+            started = time.perf_counter()
+            try:
+                source = reindex_document(db, document)
+            except Exception as e:
+                db.rollback()
+                print(f"document {document.id}: failed: {e}")
+                continue
+            print(f"document {document.id}: {source}, {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import html
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models.document import Document, DocumentSection
+
+FTS_TABLE = "document_sections_fts"
+
+SEARCH_MODES = ("match", "phrase", "prefix")
+
+# Private-use characters marking matches in raw snippets, turned into <mark> after escaping
+_MATCH_START, _MATCH_END = "\ue000", "\ue001"
+
+
+def _to_html(snippet: str) -> str:
+    """
+    Escape a snippet of section text and highlight its marked matches: the text is the user's, never markup
+    """
+    return html.escape(snippet).replace(_MATCH_START, "<mark>").replace(_MATCH_END, "</mark>")
+
+
+def is_fts_available(bind) -> bool:
+    """
+    Full-text search relies on SQLite FTS5; other databases fall back to LIKE
+    """
+    return bind.dialect.name == "sqlite"
+
+
+def ensure_search_index(engine: Engine) -> None:
+    """
+    Create the FTS5 index over document section content if it doesn't exist.
+
+    A newly created index is filled from the sections already in the database.
+    """
+    if not is_fts_available(engine):
+        return
+
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).first()
+        if exists:
+            return
+
+        conn.execute(text(
+            f"""
+            CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+                content,
+                section_id UNINDEXED,
+                document_id UNINDEXED,
+                section_type UNINDEXED,
+                page_num UNINDEXED,
+                tokenize = 'porter unicode61'
+            )
+            """
+        ))
+        conn.execute(text(
+            f"INSERT INTO {FTS_TABLE} (content, section_id, document_id, section_type, page_num) "
+            f"SELECT content, id, document_id, section_type, page_num FROM {DocumentSection.__tablename__} "
+            "WHERE content IS NOT NULL AND content != ''"
+        ))
+
+
+def index_sections(db: Session, sections: Iterable[DocumentSection]) -> None:
+    """
+    Add document sections to the full-text index (caller commits)
+    """
+    if not is_fts_available(db.get_bind()):
+        return
+
+    rows = [
+        {
+            "content": section.content or "",
+            "section_id": section.id,
+            "document_id": section.document_id,
+            "section_type": section.section_type,
+            "page_num": section.page_num,
+        }
+        for section in sections
+        if section.content
+    ]
+    if not rows:
+        return
+
+    db.execute(
+        text(
+            f"INSERT INTO {FTS_TABLE} (content, section_id, document_id, section_type, page_num) "
+            "VALUES (:content, :section_id, :document_id, :section_type, :page_num)"
+        ),
+        rows,
+    )
+
+
+def remove_document_from_index(db: Session, document_id: int) -> None:
+    """
+    Remove every indexed section of a document (caller commits)
+    """
+    if not is_fts_available(db.get_bind()):
+        return
+
+    db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE document_id = :document_id"), {"document_id": document_id})
+
+
+def remove_sections_from_index(db: Session, section_ids: List[int]) -> None:
+    """
+    Remove the given sections from the full-text index (caller commits)
+    """
+    if not section_ids or not is_fts_available(db.get_bind()):
+        return
+
+    db.execute(
+        text(f"DELETE FROM {FTS_TABLE} WHERE section_id = :section_id"),
+        [{"section_id": section_id} for section_id in section_ids],
+    )
+
+
+def build_match_expression(query_text: str, mode: str = "match") -> str:
+    """
+    Turn user input into a safe FTS5 MATCH expression.
+
+    Every term is quoted so FTS operators typed by the user are treated as text.
+    "phrase" matches the terms in order, "prefix" treats each term as a prefix.
+    """
+    terms = re.findall(r"\w+", query_text, flags=re.UNICODE)
+    if not terms:
+        raise ValueError("Search query must contain at least one word")
+
+    if mode == "phrase":
+        return '"' + " ".join(terms) + '"'
+    if mode == "prefix":
+        return " ".join(f'"{term}"*' for term in terms)
+    if mode == "match":
+        return " ".join(f'"{term}"' for term in terms)
+    raise ValueError(f"Unsupported search mode: {mode}")
+
+
+def search_sections(
+    db: Session,
+    owner_id: int,
+    query_text: str,
+    mode: str = "match",
+    document_id: Optional[int] = None,
+    section_type: Optional[str] = None,
+    page_num: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 20,
+) -> List[Dict[str, Any]]:
+    """
+    Search the content of a user's document sections and return ranked snippets
+    """
+    if not is_fts_available(db.get_bind()):
+        return _search_sections_like(
+            db, owner_id, query_text, document_id, section_type, page_num, skip, limit
+        )
+
+    filters = ["f.content MATCH :match", "d.owner_id = :owner_id", "d.deleted_at IS NULL"]
+    params: Dict[str, Any] = {
+        "match": build_match_expression(query_text, mode),
+        "match_start": _MATCH_START,
+        "match_end": _MATCH_END,
+        "owner_id": owner_id,
+        "skip": skip,
+        "limit": limit,
+    }
+    if document_id is not None:
+        filters.append("f.document_id = :document_id")
+        params["document_id"] = document_id
+    if section_type is not None:
+        filters.append("f.section_type = :section_type")
+        params["section_type"] = section_type
+    if page_num is not None:
+        filters.append("f.page_num = :page_num")
+        params["page_num"] = page_num
+
+    rows = db.execute(
+        text(
+            f"""
+            SELECT f.section_id, f.document_id, d.title, f.section_type, f.page_num,
+                   snippet({FTS_TABLE}, 0, :match_start, :match_end, '...', 16) AS snippet,
+                   bm25({FTS_TABLE}) AS rank
+            FROM {FTS_TABLE} AS f
+            JOIN documents AS d ON d.id = f.document_id
+            WHERE {" AND ".join(filters)}
+            ORDER BY rank
+            LIMIT :limit OFFSET :skip
+            """
+        ),
+        params,
+    ).mappings().all()
+
+    return [
+        {
+            "section_id": row["section_id"],
+            "document_id": row["document_id"],
+            "document_title": row["title"],
+            "section_type": row["section_type"],
+            "page_num": row["page_num"],
+            "snippet": _to_html(row["snippet"]),
+            # bm25() is lower-is-better; flip it so higher scores rank first
+            "score": -row["rank"],
+        }
+        for row in rows
+    ]
+
+
+def _search_sections_like(
+    db: Session,
+    owner_id: int,
+    query_text: str,
+    document_id: Optional[int],
+    section_type: Optional[str],
+    page_num: Optional[int],
+    skip: int,
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """
+    Substring search used when the database has no FTS support
+    """
+    query = (
+        db.query(DocumentSection, Document.title)
+        .join(Document, Document.id == DocumentSection.document_id)
+        .filter(
+            Document.owner_id == owner_id,
+            Document.deleted_at.is_(None),
+            DocumentSection.content.ilike(f"%{query_text}%"),
+        )
+    )
+    if document_id is not None:
+        query = query.filter(DocumentSection.document_id == document_id)
+    if section_type is not None:
+        query = query.filter(DocumentSection.section_type == section_type)
+    if page_num is not None:
+        query = query.filter(DocumentSection.page_num == page_num)
+
+    results = []
+    for section, title in query.offset(skip).limit(limit).all():
+        content = section.content or ""
+        found = content.lower().find(query_text.lower())
+        start = max(found - 80, 0)
+        snippet = content[start:start + 200]
+        if found >= 0:
+            end = found - start + len(query_text)
+            snippet = snippet[:found - start] + _MATCH_START + snippet[found - start:end] + _MATCH_END + snippet[end:]
+        results.append({
+            "section_id": section.id,
+            "document_id": section.document_id,
+            "document_title": title,
+            "section_type": section.section_type,
+            "page_num": section.page_num,
+            "snippet": _to_html(snippet),
+            "score": 0.0,
+        })
+    return results
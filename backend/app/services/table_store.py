@@ -0,0 +1,211 @@
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.services.parse_cache import file_sha256
+
+TABULAR_EXTENSIONS = [".csv", ".xlsx", ".xls"]
+
+# Question wording -> pandas aggregation
+_AGGREGATIONS = [
+    (re.compile(r"\b(average|mean|avg)\b", re.IGNORECASE), "mean"),
+    (re.compile(r"\b(sum|total)\b", re.IGNORECASE), "sum"),
+    (re.compile(r"\b(maximum|max|highest|largest|most)\b", re.IGNORECASE), "max"),
+    (re.compile(r"\b(minimum|min|lowest|smallest|least)\b", re.IGNORECASE), "min"),
+    (re.compile(r"\b(how many|count|number of)\b", re.IGNORECASE), "count"),
+]
+_GROUP_BY = re.compile(r"\b(?:by|per|for each|grouped by)\s+(.+)$", re.IGNORECASE)
+# Words a plain aggregation question may contain besides its aggregation and columns
+_FILLER = {
+    "what", "whats", "is", "are", "was", "were", "the", "a", "an", "of", "in", "for", "each", "by", "per",
+    "grouped", "all", "table", "rows", "row", "records", "entries", "value", "values", "show", "me", "give",
+    "compute", "calculate", "tell", "there", "do", "does", "we", "have", "across", "overall", "please",
+}
+
+MAX_RESULT_ROWS = 50
+
+
+def read_tables(file_path: str) -> Dict[str, pd.DataFrame]:
+    """
+    Read every table (CSV file or Excel sheet) of a tabular file
+    """
+    if Path(file_path).suffix.lower() == ".csv":
+        return {Path(file_path).stem: pd.read_csv(file_path)}
+    return pd.read_excel(file_path, sheet_name=None)
+
+
+def column_stats(series: pd.Series) -> Dict[str, Any]:
+    """
+    Compact statistics describing a column
+    """
+    stats: Dict[str, Any] = {"name": str(series.name), "dtype": str(series.dtype), "nulls": int(series.isna().sum())}
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        described = series.describe()
+        for key in ("min", "max", "mean"):
+            if key in described and pd.notna(described[key]):
+                stats[key] = round(float(described[key]), 4)
+    else:
+        stats["distinct"] = int(series.nunique())
+        stats["top_values"] = [str(value) for value in series.value_counts().head(5).index]
+    return stats
+
+
+def store_tables(file_path: str) -> List[Dict[str, Any]]:
+    """
+    Persist each table of a tabular file as Parquet and return its schema and statistics
+    """
+    table_dir = os.path.join(settings.TABLE_STORE_PATH, file_sha256(file_path)[:16])
+    os.makedirs(table_dir, exist_ok=True)
+
+    tables = []
+    for name, frame in read_tables(file_path).items():
+        frame.columns = [str(column) for column in frame.columns]
+        file_name = re.sub(r"[^\w-]+", "_", str(name))
+        path = os.path.join(table_dir, f"{file_name}.parquet")
+        if not os.path.exists(path):
+            frame.to_parquet(path, index=False)
+
+        tables.append({
+            "name": str(name),
+            "path": path,
+            "rows": len(frame),
+            "columns": [column_stats(frame[column]) for column in frame.columns],
+            "sample": frame.head(settings.TABLE_SAMPLE_ROWS).to_csv(index=False),
+        })
+    return tables
+
+
+def table_documents(file_path: str, tables: List[Dict[str, Any]]) -> List[Document]:
+    """
+    The compact representation of each table that gets embedded: schema, stats and a sample
+    """
+    documents = []
+    for page, table in enumerate(tables):
+        lines = [f"Table {table['name']} with {table['rows']} rows and {len(table['columns'])} columns:"]
+        for column in table["columns"]:
+            details = ", ".join(f"{key} {value}" for key, value in column.items() if key not in ("name", "dtype"))
+            lines.append(f"- {column['name']} ({column['dtype']}): {details}")
+
+        metadata = {"source": file_path, "category": "Table", "table": table["name"], "page": page}
+        documents.append(Document(page_content="\n".join(lines), metadata=metadata))
+        # The sample is embedded but not kept in the document metadata
+        documents.append(Document(
+            page_content=f"Sample rows of table {table['name']}:\n{table.pop('sample')}",
+            metadata=dict(metadata),
+        ))
+    return documents
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[\W_]+", " ", name).strip().lower()
+
+
+def _find_column(text: str, columns: List[Dict[str, Any]], numeric: Optional[bool] = None) -> Optional[str]:
+    """
+    The longest column name mentioned in text, optionally restricted to numeric columns
+    """
+    text = f" {_normalize(text)} "
+    candidates = [
+        column["name"] for column in columns
+        if numeric is None or ("mean" in column) == numeric
+    ]
+    mentioned = [name for name in candidates if _normalize(name) and f" {_normalize(name)} " in text]
+    return max(mentioned, key=len) if mentioned else None
+
+
+def _fully_covered(question: str, table: Dict[str, Any], columns: List[str]) -> bool:
+    """
+    Whether every word of question is an aggregation, one of columns, the table name or filler
+    """
+    text = f" {_normalize(question)} "
+    for pattern, _ in _AGGREGATIONS:
+        text = pattern.sub(" ", text)
+    for name in [table["name"], *columns]:
+        while f" {_normalize(name)} " in text:
+            text = text.replace(f" {_normalize(name)} ", " ")
+    return all(word in _FILLER for word in text.split())
+
+
+def parse_table_question(question: str, table: Dict[str, Any]) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    Parse a numeric question into (aggregation, value column, group-by column).
+
+    Only plain aggregations parse: any other word (a filter value such as a
+    country or quarter, a column used another way, "which") means the question
+    asks something a whole-column aggregate would answer wrongly.
+    """
+    aggregation = next((agg for pattern, agg in _AGGREGATIONS if pattern.search(question)), None)
+    if aggregation is None:
+        return None
+
+    group_by = None
+    match = _GROUP_BY.search(question)
+    main = question
+    if match:
+        group_by = _find_column(match.group(1), table["columns"])
+        if group_by:
+            main = question[:match.start()]
+
+    value = _find_column(main, table["columns"], numeric=True)
+    if value is None and aggregation != "count":
+        return None
+    if not _fully_covered(question, table, [column for column in (value, group_by) if column]):
+        return None
+    return aggregation, value, group_by
+
+
+def answer_table_query(question: str, tables: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Answer an aggregation question by computing it over the stored table.
+
+    Returns None when the question isn't a recognizable aggregation, so the
+    caller can fall back to retrieval.
+    """
+    for table in tables:
+        parsed = parse_table_question(question, table)
+        if parsed is None:
+            continue
+        aggregation, value, group_by = parsed
+
+        # Parquet is columnar: only the referenced columns are read
+        columns = [column for column in (value, group_by) if column]
+        try:
+            frame = pd.read_parquet(table["path"], columns=columns or None)
+        except OSError:
+            # The Parquet copy is gone (e.g. the table store was cleared): let retrieval answer
+            continue
+
+        if group_by:
+            grouped = frame.groupby(group_by)
+            result = grouped.size() if value is None else grouped[value].agg(aggregation)
+            result = result.sort_values(ascending=aggregation == "min").head(MAX_RESULT_ROWS)
+            header = f"{aggregation} of {value or 'rows'} by {group_by}"
+            answer = f"{header} (table {table['name']}):\n\n| {group_by} | {aggregation} |\n|---|---|\n" + "\n".join(
+                f"| {key} | {_format(val)} |" for key, val in result.items()
+            )
+        else:
+            result = len(frame) if value is None else frame[value].agg(aggregation)
+            answer = f"The {aggregation} of {value or 'rows'} in table {table['name']} is {_format(result)}."
+
+        return {
+            "response": answer,
+            "table": table["name"],
+            "aggregation": aggregation,
+            "value_column": value,
+            "group_by": group_by,
+        }
+    return None
+
+
+def _format(value: Any) -> str:
+    if hasattr(value, "item"):
+        # numpy scalars
+        value = value.item()
+    if isinstance(value, float):
+        return f"{value:,.4f}".rstrip("0").rstrip(".")
+    return f"{value:,}" if isinstance(value, int) else str(value)
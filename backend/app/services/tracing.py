@@ -0,0 +1,304 @@
+"""
+Trace spans for the upload and query pipelines.
+
+A span times one stage and carries its attributes (retrieved chunk ids, token
+counts, ...). Spans opened inside another one become its children through a
+context variable, so nested stages need no handle passed around; the
+outermost span of a thread starts a trace. LLM calls are recorded as spans
+under the current one by a listener on the LLM transport, with their token
+usage and estimated cost. Finished traces are exported in the background, as
+JSON lines or as OTLP/HTTP JSON to a local collector, per TRACE_EXPORTER.
+"""
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.llm_client import add_call_listener
+
+TRACE_EXPORTERS = ("none", "jsonl", "otlp")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Trace:
+    """
+    The spans of one upload or query, with the LLM usage they add up to
+    """
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.lock = threading.Lock()
+        self.root: Optional[Span] = None
+        self.spans: List[Span] = []
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+
+    def add(self, span: "Span") -> None:
+        with self.lock:
+            self.spans.append(span)
+
+    def record_llm_call(self, prompt_tokens: int, completion_tokens: int, cost_usd: float) -> None:
+        with self.lock:
+            self.llm_calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost_usd += cost_usd
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Duration, LLM usage and time per stage, compact enough for Query.meta_data
+        """
+        with self.lock:
+            spans = list(self.spans)
+        stages: Dict[str, float] = {}
+        for span in spans:
+            if span is not self.root:
+                stages[span.name] = stages.get(span.name, 0.0) + span.duration_ms
+        return {
+            "trace_id": self.trace_id,
+            "duration_ms": round(self.root.duration_ms, 1) if self.root else 0.0,
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "stages_ms": {name: round(ms, 1) for name, ms in stages.items()},
+        }
+
+
+class Span:
+    def __init__(self, name: str, trace: Trace, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.time()) - self.start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration_ms, 3),
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Time a stage as a child of the current span, or as the root of a new trace.
+
+    The trace is exported when its root span ends.
+    """
+    parent = _current.get()
+    trace = parent.trace if parent is not None else Trace()
+    current = Span(name, trace, parent.span_id if parent is not None else None, attributes)
+    if parent is None:
+        trace.root = current
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end = time.time()
+        _current.reset(token)
+        trace.add(current)
+        if parent is None:
+            export(trace)
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Estimated USD cost of a call from LLM_PRICES, matched on the longest model name prefix
+    """
+    matches = [name for name in settings.LLM_PRICES if model and model.startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, completion_price = settings.LLM_PRICES[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def _record_llm_call(call: Dict[str, Any]) -> None:
+    parent = _current.get()
+    if parent is None:
+        return
+    cost = estimate_cost(call["model"], call["prompt_tokens"], call["completion_tokens"])
+    # The call already happened: its span is created finished, backdated by its latency
+    llm_span = Span(
+        "llm.call",
+        parent.trace,
+        parent.span_id,
+        {
+            "model": call["model"],
+            "status_code": call["status_code"],
+            "retries": call["retries"],
+            "prompt_tokens": call["prompt_tokens"],
+            "completion_tokens": call["completion_tokens"],
+            "cost_usd": round(cost, 6),
+        },
+    )
+    llm_span.end = time.time()
+    llm_span.start = llm_span.end - call["latency_ms"] / 1000
+    if call["status_code"] >= 400:
+        llm_span.error = f"HTTP {call['status_code']}"
+    parent.trace.add(llm_span)
+    parent.trace.record_llm_call(call["prompt_tokens"], call["completion_tokens"], cost)
+
+
+add_call_listener(_record_llm_call)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    if isinstance(value, str):
+        return {"stringValue": value}
+    return {"stringValue": json.dumps(value, default=str)}
+
+
+def to_otlp(traces: List[Trace]) -> Dict[str, Any]:
+    """
+    Traces in the OTLP/HTTP JSON encoding, as accepted on a collector's /v1/traces
+    """
+    spans = []
+    for trace in traces:
+        for finished in trace.spans:
+            spans.append({
+                "traceId": trace.trace_id,
+                "spanId": finished.span_id,
+                "parentSpanId": finished.parent_id or "",
+                "name": finished.name,
+                "kind": 1,  # internal
+                "startTimeUnixNano": str(int(finished.start * 1e9)),
+                "endTimeUnixNano": str(int((finished.end or finished.start) * 1e9)),
+                "attributes": [
+                    {"key": key, "value": _otlp_value(value)}
+                    for key, value in finished.attributes.items() if value is not None
+                ],
+                "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1},
+            })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": settings.TRACE_SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+        }]
+    }
+
+
+class TraceExporter:
+    """
+    Background writer of finished traces.
+
+    Requests only put traces on a bounded queue; when the exporter falls
+    behind, traces are dropped and counted rather than slowing requests down.
+    """
+
+    def __init__(self, exporter: str, max_queued: int = 1000, max_batch: int = 100):
+        if exporter not in TRACE_EXPORTERS:
+            raise ValueError(f"Unsupported trace exporter: {exporter}")
+        self.exporter = exporter
+        self.queue: "queue.Queue[Trace]" = queue.Queue(maxsize=max_queued)
+        self.max_batch = max_batch
+        self.exported = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self.thread.start()
+
+    def submit(self, trace: Trace) -> None:
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self, traces: List[Trace]) -> None:
+        if self.exporter == "jsonl":
+            os.makedirs(os.path.dirname(os.path.abspath(settings.TRACE_EXPORT_PATH)), exist_ok=True)
+            with open(settings.TRACE_EXPORT_PATH, "a") as f:
+                for trace in traces:
+                    f.write(json.dumps({**trace.summary(), "spans": [finished.to_dict() for finished in trace.spans]}, default=str) + "\n")
+        elif self.exporter == "otlp":
+            response = httpx.post(settings.TRACE_OTLP_ENDPOINT, json=to_otlp(traces), timeout=10)
+            response.raise_for_status()
+
+    def _run(self) -> None:
+        while True:
+            traces = [self.queue.get()]
+            while len(traces) < self.max_batch:
+                try:
+                    traces.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(traces)
+                self.exported += len(traces)
+            except Exception as e:
+                self.errors += 1
+                print(f"Exporting {len(traces)} traces failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "exporter": self.exporter,
+            "queued": self.queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+_exporter: Optional[TraceExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def export(trace: Trace) -> None:
+    """
+    Hand a finished trace to the exporter, started on first use
+    """
+    global _exporter
+    if settings.TRACE_EXPORTER == "none":
+        return
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = TraceExporter(settings.TRACE_EXPORTER, settings.TRACE_EXPORT_MAX_QUEUED)
+    _exporter.submit(trace)
+
+
+def exporter_stats() -> Dict[str, Any]:
+    return _exporter.stats() if _exporter is not None else {"exporter": settings.TRACE_EXPORTER}
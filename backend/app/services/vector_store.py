@@ -0,0 +1,97 @@
+import os
+from typing import List
+
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from app.core.config import settings
+from app.services.embeddings import get_embedding_model
+from app.services.flat_vector_store import FlatVectorStore, VECTORS_FILE
+from app.services.quantized_vector_store import DOCUMENTS_FILE, QuantizedVectorStore
+
+VECTOR_BACKENDS = ("chroma", "quantized", "flat")
+
+
+def get_vector_store_path(document_id: str) -> str:
+    """
+    Get the directory holding the vector store of a document
+    """
+    return os.path.join(settings.VECTOR_DB_PATH, f"doc_{document_id}")
+
+
+def get_index_version(document_id: str) -> int:
+    """
+    Version of a document's vector store: the latest modification time of its files
+    """
+    vector_store_path = get_vector_store_path(document_id)
+    if not os.path.exists(vector_store_path):
+        return 0
+
+    version = os.stat(vector_store_path).st_mtime_ns
+    for root, _, files in os.walk(vector_store_path):
+        for name in files:
+            version = max(version, os.stat(os.path.join(root, name)).st_mtime_ns)
+    return version
+
+
+def _get_backend() -> str:
+    backend = settings.VECTOR_BACKEND
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f"Unsupported vector backend: {backend}")
+    return backend
+
+
+def create_vector_store(document_id: str) -> VectorStore:
+    """
+    Create an empty vector store for a document with the configured backend, to be filled in batches
+    """
+    os.makedirs(settings.VECTOR_DB_PATH, exist_ok=True)
+    vector_store_path = get_vector_store_path(document_id)
+
+    backend = _get_backend()
+    if backend == "quantized":
+        # Batches are appended with the codes fitted on the first one; persist refits them
+        return QuantizedVectorStore(persist_directory=vector_store_path, embedding_function=get_embedding_model())
+    if backend == "flat":
+        return FlatVectorStore(persist_directory=vector_store_path, embedding_function=get_embedding_model())
+
+    return Chroma(persist_directory=vector_store_path, embedding_function=get_embedding_model())
+
+
+def persist_vector_store(vectorstore: VectorStore) -> None:
+    """
+    Flush a vector store filled by create_vector_store to disk
+    """
+    # The quantized and flat stores write every batch as it is added; the quantized one refits its codes
+    if isinstance(vectorstore, (Chroma, QuantizedVectorStore)):
+        vectorstore.persist()
+
+
+def build_vector_store(documents: List[Document], document_id: str) -> VectorStore:
+    """
+    Embed documents into a new vector store for a document using the configured backend
+    """
+    vectorstore = create_vector_store(document_id)
+    if documents:
+        vectorstore.add_documents(documents)
+    persist_vector_store(vectorstore)
+    return vectorstore
+
+
+def open_vector_store(document_id: str) -> VectorStore:
+    """
+    Open the existing vector store of a document
+    """
+    vector_store_path = get_vector_store_path(document_id)
+
+    if not os.path.exists(vector_store_path):
+        raise ValueError(f"Vector store not found for document {document_id}")
+
+    # Stores keep the backend they were built with, whatever the current setting
+    if os.path.exists(os.path.join(vector_store_path, DOCUMENTS_FILE)):
+        return QuantizedVectorStore(persist_directory=vector_store_path, embedding_function=get_embedding_model())
+    if os.path.exists(os.path.join(vector_store_path, VECTORS_FILE)):
+        return FlatVectorStore(persist_directory=vector_store_path, embedding_function=get_embedding_model())
+
+    return Chroma(persist_directory=vector_store_path, embedding_function=get_embedding_model())
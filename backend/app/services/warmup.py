@@ -0,0 +1,129 @@
+"""
+Warm-up at application startup, so the first requests after a deploy don't pay
+for model loading and connection setup.
+
+Warm-up runs in the background while the port is already open: `/` answers
+liveness checks at once, `/ready` only reports healthy once warm-up is done.
+"""
+import threading
+import time
+from contextlib import ExitStack
+from typing import Any, Dict, List
+
+from sqlalchemy import func, text
+
+from app.core.config import settings
+from app.db.session import SessionLocal, engine
+from app.models.document import Document
+from app.models.query import Query
+
+_ready = threading.Event()
+_status: Dict[str, Any] = {"ready": False, "steps": {}, "errors": {}}
+
+
+def _warm_db_pool() -> None:
+    # Open as many connections as the pool keeps, so none is created under load
+    size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    with ExitStack() as stack:
+        for _ in range(max(size, 1)):
+            stack.enter_context(engine.connect()).execute(text("SELECT 1"))
+
+
+def _warm_embedding_model() -> None:
+    from app.services.embeddings import get_embedding_model
+
+    # embed_documents, so the dummy text doesn't count in the query cache stats
+    get_embedding_model().embed_documents(["warm up"])
+
+
+def _warm_llm_client() -> None:
+    from app.services.llm_client import get_chat_model, get_http_client, is_llm_available
+
+    get_http_client()
+    if is_llm_available():
+        get_chat_model()
+
+
+def recent_document_ids(limit: int) -> List[int]:
+    """
+    Documents queried most recently, newest first
+    """
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Query.document_id)
+            .join(Document, Document.id == Query.document_id)
+            .filter(Document.deleted_at.is_(None))
+            .group_by(Query.document_id)
+            .order_by(func.max(Query.created_at).desc())
+            .limit(limit)
+            .all()
+        )
+        return [document_id for document_id, in rows]
+    finally:
+        db.close()
+
+
+def _warm_vector_stores() -> None:
+    from app.services.embeddings import get_embedding_model
+    from app.services.vector_store import open_vector_store
+
+    if settings.WARMUP_VECTOR_STORES <= 0:
+        return
+    vector = get_embedding_model().embed_documents(["warm up"])[0]
+    for document_id in recent_document_ids(settings.WARMUP_VECTOR_STORES):
+        try:
+            # A search pages the index in and initializes the backend's client
+            open_vector_store(str(document_id)).similarity_search_by_vector(vector, k=1)
+        except ValueError:
+            pass  # not indexed (yet)
+
+
+WARMUP_STEPS: List[tuple] = [
+    ("db_pool", _warm_db_pool),
+    ("embedding_model", _warm_embedding_model),
+    ("llm_client", _warm_llm_client),
+    ("vector_stores", _warm_vector_stores),
+]
+
+
+def warm_up(steps: List[tuple] = WARMUP_STEPS) -> Dict[str, Any]:
+    """
+    Run every warm-up step, then mark the application ready.
+
+    A failing step is recorded and skipped: the application still becomes
+    ready, it just serves its first requests cold.
+    """
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            _status["errors"][name] = str(e)
+            print(f"Warm-up step {name} failed: {e}")
+        _status["steps"][name] = round(time.perf_counter() - started, 3)
+
+    _status["ready"] = True
+    _ready.set()
+    return _status
+
+
+def start_warm_up() -> threading.Thread:
+    """
+    Warm up in the background, or mark the application ready at once if WARMUP_ENABLED is off
+    """
+    steps = WARMUP_STEPS if settings.WARMUP_ENABLED else []
+    thread = threading.Thread(target=warm_up, args=(steps,), name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def warm_up_status() -> Dict[str, Any]:
+    """
+    Whether warm-up is done, the seconds each finished step took and the errors of failed ones
+    """
+    return {"ready": _status["ready"], "steps": dict(_status["steps"]), "errors": dict(_status["errors"])}
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from app.services.admission import AdmissionController, AdmissionRejected
+
+
+def controller(max_concurrent=1, max_queued=8, ingest_limit=1, user_limit=8, queue_timeout=5.0):
+    return AdmissionController(
+        max_concurrent=max_concurrent,
+        max_queued=max_queued,
+        kind_limits={"query": max_concurrent, "ingest": ingest_limit},
+        user_limits={"query": user_limit, "ingest": user_limit},
+        queue_timeout=queue_timeout,
+    )
+
+
+async def hold(admission, kind, user_id, order, release):
+    async with admission.admit(kind, user_id):
+        order.append(f"{kind}-{user_id}")
+        await release.wait()
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_queued_queries_go_before_queued_ingestions():
+    async def scenario():
+        admission = controller()
+        order = []
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(admission, "query", 0, order, release))]
+        await settle()
+        # Queued while the only slot is taken: the ingestion first, then two queries
+        for kind, user_id in (("ingest", 1), ("query", 2), ("query", 3)):
+            tasks.append(asyncio.create_task(hold(admission, kind, user_id, order, release)))
+            await settle()
+        assert admission.stats()["queued"] == {"query": 2, "ingest": 1}
+
+        release.set()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["query-0", "query-2", "query-3", "ingest-1"]
+
+
+def test_ingestions_over_their_cap_do_not_block_queries():
+    async def scenario():
+        admission = controller(max_concurrent=2, ingest_limit=1)
+        order = []
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(admission, "ingest", 1, order, release))]
+        await settle()
+        tasks.append(asyncio.create_task(hold(admission, "ingest", 2, order, release)))
+        await settle()
+        tasks.append(asyncio.create_task(hold(admission, "query", 3, order, release)))
+        await settle()
+        running = list(order)
+
+        release.set()
+        await asyncio.gather(*tasks)
+        return running
+
+    assert asyncio.run(scenario()) == ["ingest-1", "query-3"]
+
+
+def test_full_queue_and_user_cap_are_rejected():
+    async def scenario():
+        admission = controller(max_queued=1, user_limit=1)
+        order = []
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(admission, "query", 1, order, release))]
+        await settle()
+
+        with pytest.raises(AdmissionRejected, match="for this user"):
+            async with admission.admit("query", 1):
+                pass
+
+        tasks.append(asyncio.create_task(hold(admission, "query", 2, order, release)))
+        await settle()
+        with pytest.raises(AdmissionRejected, match="busy") as rejected:
+            async with admission.admit("query", 3):
+                pass
+        assert rejected.value.retry_after >= 1
+
+        release.set()
+        await asyncio.gather(*tasks)
+        return admission.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["rejected"] == {"query": 2}
+    assert stats["running"] == {"query": 0}
+
+
+def test_queue_timeout_is_rejected_and_frees_the_place():
+    async def scenario():
+        admission = controller(queue_timeout=0.05)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(admission, "query", 1, [], release))
+        await settle()
+
+        with pytest.raises(AdmissionRejected, match="busy"):
+            async with admission.admit("query", 2):
+                pass
+        queued = admission.stats()["queued"]
+
+        release.set()
+        await holder
+        return queued
+
+    assert asyncio.run(scenario()) == {"query": 0, "ingest": 0}
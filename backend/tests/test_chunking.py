@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("langchain_text_splitters")
+
+from langchain_core.documents import Document  # noqa: E402
+
+from app.services.chunking import CHUNKING_STRATEGIES, chunk_documents, iter_chunks  # noqa: E402
+
+PARAGRAPH = (
+    "The survey was sent to every household in the region, and the answers were "
+    "weighted by age and income before any of the results below were computed. "
+)
+
+PAGE = (
+    "\n\n  # Introduction\n\n"
+    + PARAGRAPH * 3
+    + "\n## Methods\n\n"
+    + PARAGRAPH * 40
+    + "\n```python\nfor row in rows:\n    print(row)\n```\n\n"
+    + "2.1 Results\n\n"
+    + PARAGRAPH * 5
+)
+
+
+@pytest.mark.parametrize("strategy", CHUNKING_STRATEGIES)
+def test_start_index_points_at_the_chunk_in_its_page(strategy):
+    pages = [
+        Document(page_content=PAGE, metadata={"page": 0, "source": "report.pdf"}),
+        Document(page_content=PARAGRAPH * 2, metadata={"page": 1, "source": "report.pdf"}),
+    ]
+    chunks = list(iter_chunks(pages, strategy))
+
+    assert len(chunks) > 3
+    for chunk in chunks:
+        text = pages[chunk.metadata["page"]].page_content
+        start = chunk.metadata["start_index"]
+        assert text[start:start + len(chunk.page_content)] == chunk.page_content
+
+
+def test_adaptive_chunks_follow_the_page_structure():
+    chunks = chunk_documents([Document(page_content=PAGE, metadata={"page": 0})], "adaptive")
+    starts = [chunk.metadata["start_index"] for chunk in chunks]
+    assert starts == sorted(starts)
+    # Leading whitespace is skipped, so the first chunk starts at the first heading
+    assert starts[0] == PAGE.index("# Introduction")
+    # The code block is kept whole
+    assert any("```python\nfor row in rows:\n    print(row)\n```" in chunk.page_content for chunk in chunks)
+
+
+def test_whole_categories_are_not_split():
+    table = Document(page_content="| a | b |\n" * 500, metadata={"category": "Table", "page": 0})
+    assert chunk_documents([table], "adaptive") == [table]
+    assert chunk_documents([table], "recursive") == [table]
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        list(iter_chunks([], "sentences"))
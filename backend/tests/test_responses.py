@@ -0,0 +1,94 @@
+import pytest
+from starlette.requests import Request
+
+from app.api.responses import CACHE_CONTROL, make_etag, not_modified
+
+
+def request_with(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match is not None else []
+    return Request({"type": "http", "headers": headers})
+
+
+def test_etag_is_weak_and_versioned():
+    etag = make_etag("document", 1, "2024-01-01")
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert etag == make_etag("document", 1, "2024-01-01")
+    assert etag != make_etag("document", 1, "2024-01-02")
+    assert make_etag(b"body") == make_etag(b"body") != make_etag(b"other body")
+
+
+@pytest.mark.parametrize("if_none_match, matches", [
+    (None, False),
+    ('W/"other"', False),
+    ("{etag}", True),
+    ("{strong}", True),
+    ('W/"other", {etag}', True),
+    ("*", True),
+])
+def test_not_modified(if_none_match, matches):
+    etag = make_etag("document", 1)
+    if if_none_match is not None:
+        if_none_match = if_none_match.format(etag=etag, strong=etag.removeprefix("W/"))
+
+    response = not_modified(request_with(if_none_match), etag)
+    if not matches:
+        assert response is None
+        return
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.headers["cache-control"] == CACHE_CONTROL
+    assert not response.body
+
+
+@pytest.fixture
+def document(db, user):
+    from app.models.document import Document, DocumentSection
+
+    document = Document(title="report", file_path="report.pdf", file_type=".pdf", file_size=1, meta_data={}, owner_id=user.id)
+    db.add(document)
+    db.flush()
+    db.add(DocumentSection(section_type="Text", content="Results", page_num=0, position=0, meta_data={}, document_id=document.id))
+    db.commit()
+    return document
+
+
+def test_document_revalidation(client, login, db, user, document):
+    document_id = document.id
+    login(db, user)
+
+    first = client.get(f"/api/v1/documents/{document_id}")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    again = client.get(f"/api/v1/documents/{document_id}", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    assert not again.content
+
+    # Updating the document changes its version
+    from app.models.document import Document
+
+    db.query(Document).filter(Document.id == document_id).update({"title": "renamed"})
+    db.commit()
+    changed = client.get(f"/api/v1/documents/{document_id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["title"] == "renamed"
+
+
+def test_query_history_revalidation(client, login, db, user, document):
+    from app.models.query import Query
+
+    db.add(Query(query_text="Question", response="Answer", user_id=user.id, document_id=document.id))
+    db.commit()
+    query_id = db.query(Query.id).filter(Query.user_id == user.id).scalar()
+    login(db, user)
+
+    first = client.get("/api/v1/queries/")
+    etag = first.headers["etag"]
+    assert client.get("/api/v1/queries/", headers={"If-None-Match": etag}).status_code == 304
+
+    # The history ETag is taken over the body, so an in-place change is seen
+    db.query(Query).filter(Query.id == query_id).update({"is_favorite": True})
+    db.commit()
+    assert client.get("/api/v1/queries/", headers={"If-None-Match": etag}).status_code == 200
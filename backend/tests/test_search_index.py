@@ -0,0 +1,100 @@
+import pytest
+
+from app.models.document import Document, DocumentSection
+from app.services.search_index import build_match_expression, index_sections, search_sections
+
+
+def add_document(db, owner, title, sections):
+    document = Document(title=title, file_path=f"{title}.pdf", file_type=".pdf", file_size=1, meta_data={}, owner_id=owner.id)
+    db.add(document)
+    db.flush()
+    rows = [
+        DocumentSection(
+            section_type=section_type, content=content, page_num=page_num, position=position,
+            meta_data={}, document_id=document.id,
+        )
+        for position, (section_type, page_num, content) in enumerate(sections)
+    ]
+    db.add_all(rows)
+    db.flush()
+    index_sections(db, rows)
+    db.commit()
+    return document
+
+
+@pytest.fixture
+def documents(db, user):
+    report = add_document(db, user, "report", [
+        ("Text", 0, "The results of the survey are summarised below."),
+        ("Table", 1, "Results by region: north, south."),
+        ("Text", 2, "Survey methodology and sampling."),
+    ])
+    notes = add_document(db, user, "notes", [
+        ("Text", 0, "Preliminary results, not reviewed."),
+    ])
+    return report, notes
+
+
+def section_ids(results):
+    return sorted(result["section_id"] for result in results)
+
+
+def test_match_is_limited_to_the_owner(db, user, documents):
+    from app.models.user import User
+
+    other = User(email=f"other-{user.email}", hashed_password="-", full_name="Other", is_active=True)
+    db.add(other)
+    db.flush()
+    add_document(db, other, "theirs", [("Text", 0, "Their own results.")])
+
+    results = search_sections(db, owner_id=user.id, query_text="results")
+    assert {result["document_title"] for result in results} == {"report", "notes"}
+    assert len(results) == 3
+
+
+def test_document_filter(db, user, documents):
+    report, notes = documents
+    results = search_sections(db, owner_id=user.id, query_text="results", document_id=notes.id)
+    assert [result["document_id"] for result in results] == [notes.id]
+
+
+def test_section_type_and_page_filters(db, user, documents):
+    report, _ = documents
+    tables = search_sections(db, owner_id=user.id, query_text="results", section_type="Table")
+    assert [(result["document_id"], result["section_type"]) for result in tables] == [(report.id, "Table")]
+
+    first_pages = search_sections(db, owner_id=user.id, query_text="results", page_num=0)
+    assert {result["page_num"] for result in first_pages} == {0}
+    assert len(first_pages) == 2
+
+    assert search_sections(db, owner_id=user.id, query_text="results", section_type="Table", page_num=0) == []
+
+
+def test_deleted_documents_are_not_found(db, user, documents):
+    from sqlalchemy.sql import func
+
+    _, notes = documents
+    notes.deleted_at = func.now()
+    db.commit()
+    results = search_sections(db, owner_id=user.id, query_text="results")
+    assert notes.id not in {result["document_id"] for result in results}
+
+
+def test_phrase_and_prefix_modes(db, user, documents):
+    assert len(search_sections(db, owner_id=user.id, query_text="survey are", mode="phrase")) == 1
+    assert len(search_sections(db, owner_id=user.id, query_text="survey methodology", mode="phrase")) == 1
+    assert len(search_sections(db, owner_id=user.id, query_text="summar", mode="prefix")) == 1
+
+
+def test_user_operators_are_quoted():
+    assert build_match_expression('results OR "x" NEAR(y)') == '"results" "OR" "x" "NEAR" "y"'
+    with pytest.raises(ValueError):
+        build_match_expression("!!!")
+
+
+def test_snippets_are_escaped_before_highlighting(db, user):
+    add_document(db, user, "markup", [("Text", 0, "<script>alert(1)</script> injected results")])
+    [result] = search_sections(db, owner_id=user.id, query_text="injected")
+    assert "<script>" not in result["snippet"]
+    assert "&lt;script&gt;" in result["snippet"]
+    assert "<mark>injected</mark>" in result["snippet"]
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+WAITERS = 4
+
+
+def run_concurrently(flight, key, fn):
+    """
+    Call flight.do from a leader and WAITERS threads that arrive while it runs
+    """
+    results = [None] * (WAITERS + 1)
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, fn)
+        except Exception as e:
+            results[i] = e
+
+    leader = threading.Thread(target=call, args=(0,))
+    leader.start()
+    while not flight.in_flight():
+        time.sleep(0.001)
+    waiters = [threading.Thread(target=call, args=(i,)) for i in range(1, WAITERS + 1)]
+    for thread in waiters:
+        thread.start()
+    return results, [leader] + waiters
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def fn():
+        runs.append(1)
+        release.wait(5)
+        return "answer"
+
+    results, threads = run_concurrently(flight, "q", fn)
+    # Give the waiters time to find the call in flight before it finishes
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(runs) == 1
+    assert results[0] == ("answer", False)
+    assert results[1:] == [("answer", True)] * WAITERS
+    assert flight.in_flight() == 0
+
+
+def test_errors_reach_every_caller_and_are_not_cached():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise RuntimeError("failed")
+
+    results, threads = run_concurrently(flight, "q", fn)
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.do("q", lambda: "retried") == ("retried", False)
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == (1, False)
+    assert flight.do("b", lambda: 2) == (2, False)
+    # Finished calls are forgotten: the same key computes afresh
+    assert flight.do("a", lambda: 3) == (3, False)
+
+
+def test_base_exceptions_release_the_key():
+    flight = SingleFlight()
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        flight.do("q", interrupted)
+    assert flight.in_flight() == 0
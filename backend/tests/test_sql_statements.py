@@ -0,0 +1,131 @@
+"""
+SQL statements issued per request by the read and query endpoints, as a guard
+against N+1 regressions: the count must stay within a budget and be the same
+for a small and a large data set.
+"""
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, List
+
+import pytest
+from sqlalchemy import event
+
+# Statements allowed per request, whatever the amount of data
+BUDGETS = {
+    "GET /documents/": 3,  # page of documents, their sections with images, total
+    "GET /documents/{id}": 2,  # document, its sections with images
+    "GET /queries/": 3,  # total, page of queries, their citations
+    "GET /queries/{id}": 2,  # query, its citations
+    "POST /queries/": 8,  # document, query insert, update and reloads, citations insert and load
+}
+
+SMALL = {"documents": 1, "sections": 2, "queries": 1, "citations": 1}
+LARGE = {"documents": 8, "sections": 40, "queries": 6, "citations": 5}
+
+
+def seed(db, user, documents: int, sections: int, queries: int, citations: int):
+    """
+    Documents of sections (every other one with an image) and queries with citations
+    """
+    from app.models.document import Document, DocumentImage, DocumentSection
+    from app.models.query import Citation, Query
+
+    for d in range(documents):
+        document = Document(
+            title=f"Document {d}", file_path=f"test_{d}.pdf", file_type=".pdf", file_size=1,
+            meta_data={}, owner_id=user.id,
+        )
+        db.add(document)
+        db.flush()
+        for position in range(sections):
+            section = DocumentSection(
+                section_type="Text", content=f"Section {position}", page_num=position // 4,
+                position=position, meta_data={}, document_id=document.id,
+            )
+            db.add(section)
+            db.flush()
+            if position % 2:
+                db.add(DocumentImage(image_path=f"image_{position}.png", image_type="png", meta_data={}, section_id=section.id))
+        for q in range(queries):
+            query = Query(query_text=f"Question {q}", response="Answer", user_id=user.id, document_id=document.id)
+            db.add(query)
+            db.flush()
+            for c in range(citations):
+                db.add(Citation(content=f"Citation {c}", meta_data={}, query_id=query.id, document_section_id=section.id))
+    db.commit()
+    return document.id, query.id
+
+
+@contextmanager
+def count_statements(engine) -> Iterator[List[str]]:
+    statements: List[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def measure(client, login, engine, db, user, monkeypatch, size) -> dict:
+    from app.api.endpoints import queries
+
+    document_id, query_id = seed(db, user, **size)
+    # Authentication is not what is being counted
+    login(db, user)
+
+    result = {
+        "response": "Answer",
+        "citations": [
+            {"content": f"Citation {c}", "meta_data": {}, "document_section_id": 1}
+            for c in range(size["citations"])
+        ],
+        "meta_data": {"routing": {"route": "direct"}},
+    }
+    monkeypatch.setattr(queries, "process_query_coalesced", lambda **kwargs: (result, False))
+
+    requests = {
+        "GET /documents/": lambda: client.get("/api/v1/documents/"),
+        "GET /documents/{id}": lambda: client.get(f"/api/v1/documents/{document_id}"),
+        "GET /queries/": lambda: client.get("/api/v1/queries/"),
+        "GET /queries/{id}": lambda: client.get(f"/api/v1/queries/{query_id}"),
+        "POST /queries/": lambda: client.post(
+            "/api/v1/queries/", json={"query_text": "Question", "document_id": document_id}
+        ),
+    }
+    counts = {}
+    for name, send in requests.items():
+        with count_statements(engine) as statements:
+            response = send()
+        assert response.status_code == 200, (name, response.text)
+        if name == "POST /queries/":
+            assert len(response.json()["citations"]) == size["citations"]
+        counts[name] = len(statements)
+    return counts
+
+
+@pytest.fixture
+def counts(client, login, engine, monkeypatch):
+    from app.db.session import SessionLocal
+    from app.models.user import User
+
+    measured = {}
+    for label, size in (("small", SMALL), ("large", LARGE)):
+        db = SessionLocal()
+        try:
+            user = User(email=f"{uuid.uuid4().hex}@example.com", hashed_password="-", full_name="Test", is_active=True)
+            db.add(user)
+            db.commit()
+            measured[label] = measure(client, login, engine, db, user, monkeypatch, size)
+        finally:
+            db.close()
+    return measured
+
+
+@pytest.mark.parametrize("endpoint", BUDGETS)
+def test_statements_stay_flat_and_within_budget(counts, endpoint):
+    assert counts["large"][endpoint] == counts["small"][endpoint]
+    assert counts["large"][endpoint] <= BUDGETS[endpoint]
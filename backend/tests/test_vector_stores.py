@@ -0,0 +1,142 @@
+import os
+import zlib
+from typing import List
+
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from app.services.flat_vector_store import COMPACTED_MARKER, TOMBSTONES_FILE, FlatVectorStore  # noqa: E402
+from app.services.quantized_vector_store import QuantizedVectorStore  # noqa: E402
+
+TEXTS = [f"chunk {i}" for i in range(40)]
+
+
+class HashEmbeddings(Embeddings):
+    """
+    A random but fixed vector per text, so a text's own chunk is its nearest neighbour
+    """
+
+    def embed_query(self, text: str) -> List[float]:
+        return np.random.default_rng(zlib.crc32(text.encode())).normal(size=32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+@pytest.fixture(params=["flat", "quantized"])
+def open_store(request, tmp_path):
+    store_class = FlatVectorStore if request.param == "flat" else QuantizedVectorStore
+
+    def open_store():
+        return store_class(persist_directory=str(tmp_path / "store"), embedding_function=HashEmbeddings())
+
+    return open_store
+
+
+def fill(store, batches=4):
+    """
+    Add TEXTS in batches, as ingestion does, and persist
+    """
+    size = len(TEXTS) // batches
+    ids = []
+    for start in range(0, len(TEXTS), size):
+        texts = TEXTS[start:start + size]
+        ids += store.add_texts(texts, metadatas=[{"position": TEXTS.index(text)} for text in texts])
+    if hasattr(store, "persist"):
+        store.persist()
+    return ids
+
+
+def top_text(store, text):
+    [(document, _)] = store.similarity_search_with_score(text, k=1)
+    return document.page_content
+
+
+def test_add_in_batches_and_reopen(open_store):
+    store = open_store()
+    ids = fill(store)
+    assert len(ids) == len(set(ids)) == len(TEXTS)
+
+    reopened = open_store()
+    for text in TEXTS[::7]:
+        assert top_text(reopened, text) == text
+    hits = reopened.similarity_search_with_score(TEXTS[3], k=5)
+    assert len(hits) == 5
+    assert hits[0][0].metadata == {"position": 3}
+
+
+def test_delete(open_store):
+    store = open_store()
+    ids = fill(store)
+    assert store.delete([ids[3], ids[10]])
+    assert not store.delete(["unknown"])
+
+    reopened = open_store()
+    texts = [document.page_content for document in reopened.similarity_search(TEXTS[3], k=len(TEXTS))]
+    assert len(texts) == len(TEXTS) - 2
+    assert TEXTS[3] not in texts and TEXTS[10] not in texts
+    assert top_text(reopened, TEXTS[4]) == TEXTS[4]
+
+
+def test_delete_then_add(open_store):
+    store = open_store()
+    ids = fill(store)
+    store.delete(ids[:5])
+    store.add_texts(["late chunk"], metadatas=[{"position": -1}])
+    if hasattr(store, "persist"):
+        store.persist()
+
+    reopened = open_store()
+    assert top_text(reopened, "late chunk") == "late chunk"
+    assert top_text(reopened, TEXTS[20]) == TEXTS[20]
+    assert len(reopened.similarity_search(TEXTS[0], k=100)) == len(TEXTS) - 5 + 1
+
+
+def test_flat_compact_drops_deleted_rows(tmp_path):
+    store = FlatVectorStore(persist_directory=str(tmp_path / "store"), embedding_function=HashEmbeddings())
+    ids = fill(store)
+    store.delete(ids[:10])
+    reader = FlatVectorStore(persist_directory=str(tmp_path / "store"), embedding_function=HashEmbeddings())
+
+    assert store.compact() == 10
+    assert len(store.vectors) == len(TEXTS) - 10
+    assert not os.path.exists(store._path(TOMBSTONES_FILE))
+    assert store.compact() == 0
+
+    # A reader opened before the compaction re-maps the swapped files on its next search
+    assert top_text(reader, TEXTS[25]) == TEXTS[25]
+    assert len(reader) == len(TEXTS) - 10
+    assert TEXTS[0] not in [document.page_content for document in reader.similarity_search(TEXTS[0], k=100)]
+
+
+def test_flat_compact_is_skipped_while_read(tmp_path):
+    pytest.importorskip("fcntl")
+    store = FlatVectorStore(persist_directory=str(tmp_path / "store"), embedding_function=HashEmbeddings())
+    ids = fill(store)
+    store.delete(ids[:3])
+
+    with store._lock(exclusive=False):
+        other = FlatVectorStore(persist_directory=str(tmp_path / "store"), embedding_function=HashEmbeddings())
+        assert other.compact() == 0
+    assert other.compact() == 3
+
+
+def test_flat_compaction_interrupted_before_the_swap_is_finished_on_open(tmp_path, monkeypatch):
+    store = FlatVectorStore(persist_directory=str(tmp_path / "store"), embedding_function=HashEmbeddings())
+    ids = fill(store)
+    store.delete(ids[:4])
+
+    # Crash right after the compacted files and the marker were written
+    with monkeypatch.context() as patch:
+        patch.setattr(FlatVectorStore, "_finish_compaction", lambda self: None)
+        store.compact()
+    assert os.path.exists(store._path(COMPACTED_MARKER))
+
+    reopened = FlatVectorStore(persist_directory=str(tmp_path / "store"), embedding_function=HashEmbeddings())
+    assert not os.path.exists(store._path(COMPACTED_MARKER))
+    assert len(reopened.vectors) == len(TEXTS) - 4
+    assert top_text(reopened, TEXTS[30]) == TEXTS[30]
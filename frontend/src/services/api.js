@@ -39,12 +39,14 @@ export const documentApi = {
     },
   }),
   delete: (id) => api.delete(`/documents/${id}`),
+  search: (params) => api.get('/documents/search', { params }),
 };
 
 // Query API
 export const queryApi = {
   create: (data) => api.post('/queries/', data),
   getAll: (params) => api.get('/queries/', { params }),
+  export: (params) => api.get('/queries/export', { params, responseType: 'blob' }),
   get: (id) => api.get(`/queries/${id}`),
   update: (id, data) => api.put(`/queries/${id}`, data),
   delete: (id) => api.delete(`/queries/${id}`),